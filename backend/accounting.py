@@ -0,0 +1,550 @@
+"""Per-key quotas and the usage ledger
+
+Every authenticated request is charged to its key id. A POST to an /ai/*
+or /webhook/* route counts against the key's requests_per_minute, and the tokens each
+upstream call used are added to its tokens_per_minute and tokens_per_day
+once the call returns. A request is refused with 429 while any of its
+windows is spent, and so is every further upstream call made for it (each
+item of a batch or job), so one noisy workflow runs out of its own quota
+instead of the shared upstream budget. Windows are fixed, aligned to the
+epoch, and a limit of 0 means no limit.
+
+The defaults come from QUOTA_REQUESTS_PER_MINUTE, QUOTA_TOKENS_PER_MINUTE
+and QUOTA_TOKENS_PER_DAY; QUOTA_CONFIG names a JSON file of per-key
+overrides:
+
+    {"email-summarizer": {"requests_per_minute": 600, "tokens_per_day": 2000000}}
+
+Counters live in memory (QUOTA_BACKEND=memory, per worker) or in Redis,
+where a script checks and increments all of a request's windows in one
+atomic step so every worker shares the same counts.
+
+Each upstream call is also written to the usage ledger: key id, model,
+prompt and completion tokens, cost and latency. The MongoDB ledger
+buffers entries and inserts them in batches from a background thread,
+so requests never wait on the write; /usage reads it back aggregated per
+minute, hour or day.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import auth
+import history
+from governor import Overloaded
+
+# redis and pymongo are optional and only needed for the shared backends
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import pymongo
+except ImportError:
+    pymongo = None
+
+logger = logging.getLogger(__name__)
+
+# name: (what it counts, window in seconds)
+WINDOWS = {
+    "requests_per_minute": ("requests", 60),
+    "tokens_per_minute": ("tokens", 60),
+    "tokens_per_day": ("tokens", 86400)
+}
+BUCKETS = ("minute", "hour", "day")
+# Routes that reach the upstream: the AI endpoints and the in-process workflow triggers
+PROTECTED_PREFIXES = ("/ai/", "/webhook/")
+# Reports that need a key when authentication is on, without being charged
+READ_PREFIXES = ("/usage", "/history", "/profiler")
+
+
+class QuotaExceeded(Overloaded):
+    """Raised when a key has spent one of its quota windows"""
+
+    def __init__(self, key_id, limit_name, limit, retry_after):
+        super().__init__(f"Quota exceeded for {key_id}: {limit_name} is {limit}", retry_after)
+        self.limit_name = limit_name
+
+    def body(self):
+        return {"status": "error", "code": "quota_exceeded", "message": str(self), "limit": self.limit_name}
+
+
+class UsageQueryError(ValueError):
+    """Raised when a /usage query is malformed"""
+
+
+def load_limits(path=None):
+    """(default limits, per-key overrides) from the environment and QUOTA_CONFIG"""
+    defaults = {
+        "requests_per_minute": int(os.getenv("QUOTA_REQUESTS_PER_MINUTE", "120")),
+        "tokens_per_minute": int(os.getenv("QUOTA_TOKENS_PER_MINUTE", "100000")),
+        "tokens_per_day": int(os.getenv("QUOTA_TOKENS_PER_DAY", "0"))
+    }
+    overrides = {}
+    if path:
+        with open(path) as config_file:
+            overrides = json.load(config_file)
+        for key_id, limits in overrides.items():
+            unknown = set(limits) - set(WINDOWS)
+            if unknown:
+                raise ValueError(f"Unknown quota limits for {key_id}: {', '.join(sorted(unknown))}")
+    return defaults, overrides
+
+
+class MemoryQuotaStore:
+    """Window counters for a single worker process"""
+
+    backend = "memory"
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def _get(self, name, now):
+        value, expires_at = self._counters.get(name, (0, 0.0))
+        return value if expires_at > now else 0
+
+    def consume(self, counters, now=None):
+        """Charge counters unless one would go over its limit
+
+        counters are (name, limit, ttl, cost) tuples; a cost of 0 only
+        checks that the window is not already spent. Returns the index of
+        the first spent window, or None when everything was charged.
+        """
+        now = now or time.time()
+        with self._lock:
+            for index, (name, limit, _, cost) in enumerate(counters):
+                if limit > 0 and self._get(name, now) + max(cost, 1) > limit:
+                    return index
+            self._charge(counters, now)
+        return None
+
+    def charge(self, counters, now=None):
+        """Add each counter's cost without checking its limit"""
+        with self._lock:
+            self._charge(counters, now or time.time())
+
+    def _charge(self, counters, now):
+        for name, _, ttl, cost in counters:
+            if cost > 0:
+                self._counters[name] = (self._get(name, now) + cost, now + ttl)
+        if now >= self._next_prune:
+            self._counters = {name: entry for name, entry in self._counters.items() if entry[1] > now}
+            self._next_prune = now + 60
+
+    def values(self, names, now=None):
+        now = now or time.time()
+        with self._lock:
+            return [self._get(name, now) for name in names]
+
+
+class RedisQuotaStore:
+    """Window counters shared by every worker through the compose-provided Redis
+
+    Redis being unreachable admits requests rather than failing them.
+    """
+
+    backend = "redis"
+
+    CONSUME_SCRIPT = """
+    for i = 1, #KEYS do
+        local limit = tonumber(ARGV[3 * i - 2])
+        local cost = tonumber(ARGV[3 * i - 1])
+        if limit > 0 and tonumber(redis.call('GET', KEYS[i]) or '0') + math.max(cost, 1) > limit then
+            return i
+        end
+    end
+    for i = 1, #KEYS do
+        local cost = tonumber(ARGV[3 * i - 1])
+        if cost > 0 then
+            redis.call('INCRBY', KEYS[i], cost)
+            redis.call('EXPIRE', KEYS[i], ARGV[3 * i])
+        end
+    end
+    return 0
+    """
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("The redis package is required for QUOTA_BACKEND=redis")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._consume = self._client.register_script(self.CONSUME_SCRIPT)
+
+    def consume(self, counters, now=None):
+        args = []
+        for _, limit, ttl, cost in counters:
+            args.extend((limit, cost, int(ttl) + 1))
+        try:
+            spent = self._consume(keys=[name for name, _, _, _ in counters], args=args)
+        except redis.RedisError as e:
+            logger.warning("Quota check failed: %s", e)
+            return None
+        return int(spent) - 1 if spent else None
+
+    def charge(self, counters, now=None):
+        pipeline = self._client.pipeline()
+        for name, _, ttl, cost in counters:
+            if cost > 0:
+                pipeline.incrby(name, cost)
+                pipeline.expire(name, int(ttl) + 1)
+        try:
+            pipeline.execute()
+        except redis.RedisError as e:
+            logger.warning("Quota charge failed: %s", e)
+
+    def values(self, names, now=None):
+        try:
+            return [int(value or 0) for value in self._client.mget(names)]
+        except redis.RedisError as e:
+            logger.warning("Quota lookup failed: %s", e)
+            return [0] * len(names)
+
+
+def bucket_start(ts, bucket):
+    """Start of the minute, hour or day ts falls in"""
+    if bucket == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if bucket == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _empty_row():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0,
+            "latency_ms": 0.0, "max_latency_ms": 0.0}
+
+
+def aggregate(entries, bucket):
+    """Group ledger entries by bucket and key id, as the MongoDB pipeline does"""
+    rows = {}
+    for entry in entries:
+        row = rows.setdefault((bucket_start(entry["ts"], bucket), entry["key"]), _empty_row())
+        row["calls"] += 1
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            row[field] += entry[field]
+        row["cost"] += entry["cost"] or 0.0
+        row["latency_ms"] += entry["latency_ms"]
+        row["max_latency_ms"] = max(row["max_latency_ms"], entry["latency_ms"])
+    result = []
+    for (start, key_id), row in sorted(rows.items()):
+        row["latency_ms"] = round(row["latency_ms"] / row["calls"], 1)
+        result.append(dict(row, start=start, key=key_id))
+    return result
+
+
+def _matches(entry, key_id, since, until):
+    return since <= entry["ts"] < until and (key_id is None or entry["key"] == key_id)
+
+
+class MemoryLedger:
+    """The most recent ledger entries of a single worker process"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries=100000):
+        self._entries = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def append(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    def flush(self):
+        pass
+
+    def query(self, key_id, since, until, bucket):
+        with self._lock:
+            entries = [entry for entry in self._entries if _matches(entry, key_id, since, until)]
+        return aggregate(entries, bucket)
+
+    def info(self):
+        return {"backend": self.backend, "entries": len(self._entries)}
+
+
+class MongoLedger:
+    """Ledger stored in the compose-provided MongoDB
+
+    Entries are buffered and inserted with insert_many when batch_size of
+    them are waiting or every flush_interval seconds. A failed insert keeps
+    the batch for the next flush, up to max_buffer entries; past that the
+    oldest are dropped and counted. Entries expire after retention_days.
+    Reports read what has been inserted and do not wait for the buffer.
+    """
+
+    backend = "mongodb"
+
+    def __init__(self, uri, batch_size=500, flush_interval=2.0, max_buffer=50000, retention_days=90,
+                 collection="usage"):
+        if pymongo is None:
+            raise RuntimeError("The pymongo package is required for USAGE_LEDGER_BACKEND=mongodb")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self.written = 0
+        self._usage = pymongo.MongoClient(
+            uri, serverSelectionTimeoutMS=2000, connectTimeoutMS=2000
+        ).get_default_database("autotasker")[collection]
+        self._usage.create_index([("key", 1), ("ts", 1)])
+        if retention_days:
+            self._usage.create_index("ts", expireAfterSeconds=int(retention_days * 86400))
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        threading.Thread(target=self._run, name="usage-ledger", daemon=True).start()
+        atexit.register(self.close)
+
+    def append(self, entry):
+        with self._lock:
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Insert every buffered entry now"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            try:
+                self._usage.insert_many(batch, ordered=False)
+                self.written += len(batch)
+            except pymongo.errors.PyMongoError as e:
+                logger.warning("Usage ledger write of %d entries failed: %s", len(batch), e)
+                with self._lock:
+                    self._buffer = batch + self._buffer
+                    overflow = len(self._buffer) - self.max_buffer
+                    if overflow > 0:
+                        del self._buffer[:overflow]
+                        self.dropped += overflow
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self.flush()
+
+    def query(self, key_id, since, until, bucket):
+        match = {"ts": {"$gte": since, "$lt": until}}
+        if key_id is not None:
+            match["key"] = key_id
+        pipeline = [
+            {"$match": match},
+            {"$group": {
+                "_id": {"start": {"$dateTrunc": {"date": "$ts", "unit": bucket}}, "key": "$key"},
+                "calls": {"$sum": 1},
+                "prompt_tokens": {"$sum": "$prompt_tokens"},
+                "completion_tokens": {"$sum": "$completion_tokens"},
+                "total_tokens": {"$sum": "$total_tokens"},
+                "cost": {"$sum": {"$ifNull": ["$cost", 0]}},
+                "latency_ms": {"$avg": "$latency_ms"},
+                "max_latency_ms": {"$max": "$latency_ms"}
+            }},
+            {"$sort": {"_id.start": 1, "_id.key": 1}}
+        ]
+        rows = []
+        for row in self._usage.aggregate(pipeline):
+            group = row.pop("_id")
+            row["latency_ms"] = round(row["latency_ms"], 1)
+            rows.append(dict(row, start=group["start"].replace(tzinfo=timezone.utc), key=group["key"]))
+        return rows
+
+    def info(self):
+        with self._lock:
+            buffered = len(self._buffer)
+        return {"backend": self.backend, "buffered": buffered, "written": self.written, "dropped": self.dropped}
+
+
+class Accounting:
+    """Quota windows and usage ledger for every key id"""
+
+    def __init__(self, store, ledger, defaults, overrides=None):
+        self.store = store
+        self.ledger = ledger
+        self.defaults = defaults
+        self.overrides = overrides or {}
+
+    def limits(self, key_id):
+        return dict(self.defaults, **self.overrides.get(key_id, {}))
+
+    def _counters(self, key_id, costs, now):
+        """(window name, (counter name, limit, seconds left, cost)) for the windows counting costs' kinds"""
+        limits = self.limits(key_id)
+        counters = []
+        for name, (kind, period) in WINDOWS.items():
+            if kind in costs:
+                window = int(now // period)
+                counters.append((name, (f"autotasker:quota:{key_id}:{name}:{window}", limits[name],
+                                        (window + 1) * period - now, costs[kind])))
+        return counters
+
+    def _consume(self, key_id, costs):
+        now = time.time()
+        names, counters = zip(*self._counters(key_id, costs, now))
+        spent = self.store.consume(counters, now)
+        if spent is not None:
+            _, limit, ttl, _ = counters[spent]
+            raise QuotaExceeded(key_id, names[spent], limit, max(1.0, ttl))
+
+    def admit(self, key_id):
+        """Charge one request to key_id; raises QuotaExceeded when a window is spent"""
+        self._consume(key_id, {"requests": 1, "tokens": 0})
+
+    def check(self, key_id):
+        """Raise QuotaExceeded when one of key_id's token windows is spent, without charging it"""
+        self._consume(key_id, {"tokens": 0})
+
+    def record(self, key_id, model, usage, seconds, cost=None):
+        """Charge an upstream call's tokens and write it to the ledger"""
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        total_tokens = usage.get("total_tokens") or prompt_tokens + completion_tokens
+        if key_id is not None and total_tokens:
+            self.store.charge([counter for _, counter in self._counters(key_id, {"tokens": total_tokens}, time.time())])
+        self.ledger.append({
+            "key": key_id or auth.ANONYMOUS,
+            "ts": datetime.now(timezone.utc),
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens,
+            "cost": cost,
+            "latency_ms": round(seconds * 1000, 1)
+        })
+
+    def quota(self, key_id):
+        """Limit, amount used and seconds to reset of each of key_id's windows"""
+        now = time.time()
+        counters = self._counters(key_id, {"requests": 0, "tokens": 0}, now)
+        used = self.store.values([counter[0] for _, counter in counters], now)
+        return {
+            name: {"limit": limit, "used": value, "resets_in": round(ttl, 1)}
+            for (name, (_, limit, ttl, _)), value in zip(counters, used)
+        }
+
+    def info(self):
+        return {"quota_backend": self.store.backend, "ledger": self.ledger.info()}
+
+
+_accounting = None
+_accounting_lock = threading.Lock()
+
+
+def get_accounting():
+    """Return the process-wide quota store and ledger configured from the environment"""
+    global _accounting
+    if _accounting is None:
+        with _accounting_lock:
+            if _accounting is None:
+                if os.getenv("QUOTA_BACKEND", "memory") == "redis":
+                    store = RedisQuotaStore(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+                else:
+                    store = MemoryQuotaStore()
+                if os.getenv("USAGE_LEDGER_BACKEND", "memory") == "mongodb":
+                    ledger = MongoLedger(
+                        os.getenv("MONGODB_URI", "mongodb://localhost:27017/autotasker"),
+                        batch_size=int(os.getenv("USAGE_LEDGER_BATCH_SIZE", "500")),
+                        flush_interval=float(os.getenv("USAGE_LEDGER_FLUSH_INTERVAL", "2")),
+                        retention_days=float(os.getenv("USAGE_LEDGER_RETENTION_DAYS", "90"))
+                    )
+                else:
+                    ledger = MemoryLedger(int(os.getenv("USAGE_LEDGER_MAX_ENTRIES", "100000")))
+                _accounting = Accounting(store, ledger, *load_limits(os.getenv("QUOTA_CONFIG")))
+    return _accounting
+
+
+def reset_accounting():
+    global _accounting
+    with _accounting_lock:
+        if _accounting is not None:
+            _accounting.ledger.flush()
+        _accounting = None
+
+
+def admit_request(method, path, headers):
+    """Authenticate a request to a protected route and charge it to its key
+
+    Returns the caller's key id, or None for open routes and when
+    authentication is off; raises AuthError or QuotaExceeded.
+    """
+    if not (path.startswith(PROTECTED_PREFIXES) or path.startswith(READ_PREFIXES)) or not auth.enabled():
+        return None
+    key_id = auth.authenticate(headers)
+    if method == "POST" and path.startswith(PROTECTED_PREFIXES):
+        get_accounting().admit(key_id)
+    return key_id
+
+
+def check_quota():
+    """Refuse an upstream call made for a key whose quota is spent"""
+    key_id = auth.current_key()
+    if key_id is not None:
+        get_accounting().check(key_id)
+
+
+def record_call(model, usage, seconds):
+    """Account for one upstream call made for the current key"""
+    from router import get_router
+    tokens = (usage or {}).get("total_tokens") or 0
+    history.add_tokens(usage)
+    get_accounting().record(auth.current_key(), model, usage, seconds, get_router().cost(model, tokens))
+
+
+def parse_time(value, default):
+    if value in (None, ""):
+        return default
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = None
+    if seconds is not None:
+        try:
+            return datetime.fromtimestamp(seconds, timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise UsageQueryError(f"Timestamp out of range: {value}")
+    try:
+        ts = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise UsageQueryError(f"Not a timestamp: {value}")
+    return ts if ts.tzinfo is not None else ts.replace(tzinfo=timezone.utc)
+
+
+def usage_report(key_id, since=None, until=None, bucket="hour"):
+    """Aggregated ledger rows for key_id (every key when None) between since and until"""
+    if bucket not in BUCKETS:
+        raise UsageQueryError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    now = datetime.now(timezone.utc)
+    until = parse_time(until, now)
+    since = parse_time(since, until - timedelta(days=1))
+    if since >= until:
+        raise UsageQueryError("since must be before until")
+    rows = get_accounting().ledger.query(key_id, since, until, bucket)
+    totals = _empty_row()
+    for row in rows:
+        for field in ("calls", "prompt_tokens", "completion_tokens", "total_tokens", "cost"):
+            totals[field] += row[field]
+    del totals["latency_ms"], totals["max_latency_ms"]
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "bucket": bucket,
+        "totals": totals,
+        "usage": [dict(row, start=row["start"].isoformat()) for row in rows]
+    }
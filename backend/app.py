@@ -1,18 +1,176 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import os
 import json
-import requests
 from dotenv import load_dotenv
 
+import accounting
+import auth
+import batch
+import chunking
+import history
+import jobs
+import metrics
+import notifications
+import profiler
+import prompts
+import replay
+import resilience
+import screening
+import status
+import streaming
+import validation
+import workflow_engine
+from completion_service import failure_status, fetch_completion
+from governor import get_governor
+from response_cache import get_cache
+from router import get_router
+from semantic_cache import get_semantic_cache
+from singleflight import get_flight
+
 # Load environment variables
 load_dotenv()
 
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify through the fast JSON encoder"""
+
+    def dumps(self, obj, **kwargs):
+        return validation.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return validation.loads(s)
+
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 # Get OpenAI API key from environment variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+if not OPENAI_API_KEY and replay.mode() == "replay":
+    # Replayed completions are served from the recording and need no key
+    OPENAI_API_KEY = "replay"
+
+def chat_completion(payload, semantic=False):
+    """Send a chat completion request through the cached, coalesced upstream pipeline"""
+    response_data, g.cache_status = fetch_completion(payload, semantic)
+    return prompts.message_content(response_data)
+
+def upstream_failure(message, e):
+    """Error response for a failed completion, keeping rate limiting distinguishable from faults"""
+    status_code, headers = failure_status(e)
+    metrics.record_error(e)
+    return jsonify({
+        "status": "error",
+        "code": metrics.error_class(e),
+        "message": message
+    }), status_code, headers
+
+def request_data(schema_name):
+    """Decode the JSON body and validate it against the route's schema
+
+    The declared size is checked before anything is read, and at most one
+    byte past the limit is read from bodies sent without a length.
+    """
+    schema = validation.SCHEMAS[schema_name]
+    schema.check_size(request.headers.get("Content-Length"))
+    body = request.stream.read(schema.max_bytes + 1)
+    history.set_input(body)
+    return schema.parse(body)
+
+@app.errorhandler(validation.ValidationError)
+@app.errorhandler(auth.AuthError)
+def invalid_request(e):
+    return jsonify(e.body()), e.status_code
+
+@app.errorhandler(accounting.QuotaExceeded)
+def quota_exceeded(e):
+    return jsonify(e.body()), 429, {"Retry-After": str(int(e.retry_after))}
+
+@app.errorhandler(screening.StoreUnavailable)
+def screening_store_unavailable(e):
+    return jsonify({
+        "status": "error",
+        "code": "store_unavailable",
+        "message": str(e)
+    }), 503
+
+def owned_by_caller(record):
+    """Whether the caller may see a stored record: its own, or any for admin keys or while authentication is off"""
+    caller = auth.current_key()
+    return not auth.enabled() or auth.is_admin(caller) or record.get("api_key_id") == caller
+
+def wants_stream():
+    return streaming.wants_stream(request.args.get("stream"), request.headers.get("Accept"))
+
+def event_stream(payload, field, error_prefix, extra=None, semantic=False):
+    """Relay a streaming completion to the caller as Server-Sent Events"""
+    events = streaming.stream_completion(payload, field, error_prefix, extra, semantic)
+    return Response(stream_with_context(events), mimetype="text/event-stream", headers=streaming.SSE_HEADERS)
+
+def route_label():
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@app.before_request
+def start_request_deadline():
+    """Bound this request's upstream work by its X-Request-Timeout header"""
+    resilience.start_deadline(request.headers.get(resilience.DEADLINE_HEADER))
+    g.metrics_started = metrics.start_request(route_label())
+    history.start(request.method, request.path)
+
+@app.before_request
+def authenticate_request():
+    """Require an API key on the /ai/* routes and charge the request to its quota"""
+    # Set on every request, so a thread never carries the previous caller's key
+    auth.set_current_key(None)
+    auth.set_current_key(accounting.admit_request(request.method, request.path, request.headers))
+
+@app.before_request
+def start_profiling():
+    """Attribute this thread's profiler samples to the route, and trace the request when asked to"""
+    profiler.get_profiler().begin(route_label())
+    g.profile_trace = profiler.start_trace(request.headers, request.remote_addr)
+
+@app.after_request
+def add_cache_header(response):
+    """Report whether the completion came from the response cache, and where the time went"""
+    if "cache_status" in g:
+        response.headers["X-Cache"] = g.cache_status
+    trace = g.pop("profile_trace", None)
+    if trace is not None:
+        profiler.finish_trace(trace)
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        response.headers["Server-Timing"] = metrics.finish_request(
+            route_label(), request.method, response.status_code, started
+        )
+    output = None if response.is_streamed or response.mimetype != "application/json" else response.get_data()
+    history.finish(route_label(), request.path, response.status_code, auth.current_key() or auth.ANONYMOUS,
+                   output, response.headers.get("X-Cache"))
+    return response
+
+@app.teardown_request
+def finish_failed_request(exc):
+    """Still count requests that died with an unhandled exception"""
+    profiler.get_profiler().end()
+    trace = g.pop("profile_trace", None)
+    if trace is not None:
+        profiler.finish_trace(trace)
+    started = g.pop("metrics_started", None)
+    if started is not None:
+        metrics.finish_request(route_label(), request.method, 500, started)
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Endpoint exposing request, upstream and component metrics to Prometheus"""
+    if os.getenv("METRICS_ENABLED", "true").lower() != "true":
+        return jsonify({
+            "status": "error",
+            "message": "Metrics are disabled"
+        }), 404
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
 
 @app.route("/")
 def home():
@@ -21,6 +179,211 @@ def home():
         "message": "AutoTasker AI Backend is running"
     })
 
+@app.route("/status")
+def dependency_status():
+    """Endpoint to report the cached health and latency history of OpenAI, n8n, MongoDB and Redis"""
+    return jsonify(status.get_monitor().snapshot())
+
+@app.route("/cache/stats")
+def cache_stats():
+    """Endpoint to report response cache and request coalescing counters"""
+    cache = get_cache()
+    flight = get_flight()
+    semantic = get_semantic_cache()
+    return jsonify({
+        "status": "success",
+        "cache": cache.info() if cache is not None else {"backend": None},
+        "singleflight": flight.info() if flight is not None else {"backend": None},
+        "semantic": semantic.info() if semantic is not None else None
+    })
+
+@app.route("/governor/stats")
+def governor_stats():
+    """Endpoint to report upstream queue depth, concurrency limit, retries and circuit state"""
+    governor = get_governor()
+    return jsonify({
+        "status": "success",
+        "governor": governor.info() if governor is not None else None,
+        "resilience": resilience.get_resilience().info()
+    })
+
+@app.route("/router/stats")
+def router_stats():
+    """Endpoint to report each routing target's rolling error rate, latency and health"""
+    return jsonify({
+        "status": "success",
+        "router": get_router().info()
+    })
+
+@app.route("/usage")
+def usage():
+    """Endpoint to report the caller's token usage, cost and latency per minute, hour or day
+
+    Admin keys, and every caller when authentication is off, may pass
+    ?key= to read another key's usage or leave it out for every key.
+    """
+    caller = auth.current_key()
+    key_id = request.args.get("key") or None
+    if auth.enabled() and not auth.is_admin(caller):
+        if key_id not in (None, caller):
+            return jsonify({
+                "status": "error",
+                "code": "forbidden",
+                "message": "Only admin keys may read another key's usage"
+            }), 403
+        key_id = caller
+
+    try:
+        report = accounting.usage_report(key_id, request.args.get("since"), request.args.get("until"),
+                                         request.args.get("bucket", "hour"))
+    except accounting.UsageQueryError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    return jsonify(dict({
+        "status": "success",
+        "key": key_id,
+        "quota": accounting.get_accounting().quota(key_id) if key_id is not None else None
+    }, **report))
+
+@app.route("/history")
+def list_executions():
+    """Endpoint to page through recorded executions, newest first
+
+    Filters are ?endpoint=, ?caller=, ?input_hash=, ?status=, ?since= and
+    ?until=; pass a page's next_cursor as ?cursor= for the next one.
+    Callers other than admin keys only see their own executions.
+    """
+    filters = {name: request.args.get(name) for name in history.FILTERS}
+    caller = auth.current_key()
+    if auth.enabled() and not auth.is_admin(caller):
+        if filters["caller"] not in (None, caller):
+            return jsonify({
+                "status": "error",
+                "code": "forbidden",
+                "message": "Only admin keys may read another key's executions"
+            }), 403
+        filters["caller"] = caller
+
+    try:
+        page = history.query(filters, request.args.get("since"), request.args.get("until"),
+                             request.args.get("limit", 50), request.args.get("cursor"))
+    except history.HistoryQueryError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    return jsonify(dict({"status": "success"}, **page))
+
+@app.route("/history/<execution_id>")
+def get_execution(execution_id):
+    """Endpoint to fetch one recorded execution with its output"""
+    try:
+        execution = history.get_execution(execution_id)
+    except history.HistoryQueryError:
+        execution = None
+    caller = auth.current_key()
+    if execution is None or (auth.enabled() and not auth.is_admin(caller) and execution["caller"] != caller):
+        return jsonify({
+            "status": "error",
+            "message": "Execution not found"
+        }), 404
+    return jsonify({
+        "status": "success",
+        "execution": execution
+    })
+
+def admin_only():
+    """403 response for callers who may not use the profiler, else None"""
+    if not profiler.allowed(auth.current_key(), request.remote_addr):
+        return jsonify({
+            "status": "error",
+            "code": "forbidden",
+            "message": "Only admin keys may use the profiler"
+        }), 403
+    return None
+
+@app.route("/profiler")
+def profiler_status():
+    """Endpoint to report whether the sampling profiler runs, its samples per route and the GIL wait"""
+    return admin_only() or jsonify({
+        "status": "success",
+        "profiler": profiler.get_profiler().info()
+    })
+
+@app.route("/profiler/start", methods=["POST"])
+def start_profiler():
+    """Endpoint to start the sampling profiler, optionally with an interval and for a duration in seconds"""
+    denied = admin_only()
+    if denied:
+        return denied
+    options = request_data("profiler") if request.content_length else {}
+    interval, duration = options.get("interval"), options.get("duration")
+    if interval is not None and not 0.001 <= interval <= 1:
+        raise validation.ValidationError("invalid_value", "interval must be between 0.001 and 1 second", "interval")
+    if duration is not None and duration <= 0:
+        raise validation.ValidationError("invalid_value", "duration must be positive", "duration")
+    sampler = profiler.get_profiler()
+    sampler.start(interval, duration)
+    return jsonify({
+        "status": "success",
+        "profiler": sampler.info()
+    })
+
+@app.route("/profiler/stop", methods=["POST"])
+def stop_profiler():
+    """Endpoint to stop the sampling profiler, keeping its samples"""
+    denied = admin_only()
+    if denied:
+        return denied
+    sampler = profiler.get_profiler()
+    sampler.stop()
+    return jsonify({
+        "status": "success",
+        "profiler": sampler.info()
+    })
+
+@app.route("/profiler/reset", methods=["POST"])
+def reset_profiler():
+    """Endpoint to drop the samples collected so far"""
+    denied = admin_only()
+    if denied:
+        return denied
+    sampler = profiler.get_profiler()
+    sampler.reset()
+    return jsonify({
+        "status": "success",
+        "profiler": sampler.info()
+    })
+
+@app.route("/profiler/stacks")
+def profiler_stacks():
+    """Endpoint to export the sampled stacks as collapsed text (?format=collapsed), a flame graph
+    (?format=svg) or JSON counts (?format=json), for every route or one (?route=)
+    """
+    denied = admin_only()
+    if denied:
+        return denied
+    sampler = profiler.get_profiler()
+    route = request.args.get("route") or None
+    output = request.args.get("format", "collapsed")
+    if output == "collapsed":
+        return Response(sampler.collapsed(route), mimetype="text/plain")
+    if output == "svg":
+        return Response(profiler.flamegraph(sampler.stacks(route)), mimetype="image/svg+xml")
+    if output == "json":
+        return jsonify({
+            "status": "success",
+            "stacks": dict(sampler.stacks(route).most_common(int(request.args.get("top", 100))))
+        })
+    return jsonify({
+        "status": "error",
+        "message": "format must be collapsed, svg or json"
+    }), 400
+
 @app.route("/ai/summary", methods=["POST"])
 def summarize():
     """Endpoint to summarize text using OpenAI API"""
@@ -30,54 +393,23 @@ def summarize():
             "message": "OpenAI API key not found. Please set it in the .env file."
         }), 400
     
-    data = request.json
-    if not data or "text" not in data:
-        return jsonify({
-            "status": "error",
-            "message": "No text provided for summarization"
-        }), 400
-    
+    data = request_data("summary")
+
     try:
         # Call OpenAI API
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "gpt-4",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that summarizes text."
-                },
-                {
-                    "role": "user",
-                    "content": f"Summarize the following text concisely: {data['text']}"
-                }
-            ],
-            "max_tokens": 150
-        }
-        
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
-        
-        response_data = response.json()
-        summary = response_data["choices"][0]["message"]["content"].strip()
+        payload, chunk_info = chunking.prepare_summary(data["text"])
+        if wants_stream():
+            return event_stream(payload, "summary", "Error generating summary", chunk_info, semantic=True)
+
+        summary = chat_completion(payload, semantic=True)
         
-        return jsonify({
+        return jsonify(dict({
             "status": "success",
             "summary": summary
-        })
+        }, **chunk_info))
     
     except Exception as e:
-        return jsonify({
-            "status": "error",
-            "message": f"Error generating summary: {str(e)}"
-        }), 500
+        return upstream_failure(f"Error generating summary: {str(e)}", e)
 
 @app.route("/ai/post_social", methods=["POST"])
 def post_social():
@@ -88,45 +420,16 @@ def post_social():
             "message": "OpenAI API key not found. Please set it in the .env file."
         }), 400
     
-    data = request.json
-    if not data or "content" not in data or "platform" not in data:
-        return jsonify({
-            "status": "error",
-            "message": "Missing required fields: content and platform"
-        }), 400
-    
+    data = request_data("post_social")
+
     try:
         # Call OpenAI API
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        platform = data["platform"]  # e.g., "twitter", "linkedin", "instagram"
-        
-        payload = {
-            "model": "gpt-4",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": f"You are a social media expert who creates engaging posts for {platform}."
-                },
-                {
-                    "role": "user",
-                    "content": f"Create a {platform} post based on this content: {data['content']}"
-                }
-            ],
-            "max_tokens": 150
-        }
-        
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
-        
-        response_data = response.json()
-        post = response_data["choices"][0]["message"]["content"].strip()
+        platform = data["platform"]
+        if wants_stream():
+            return event_stream(prompts.social_payload(data), "post", "Error generating social media post",
+                                {"platform": platform}, semantic=True)
+
+        post = chat_completion(prompts.social_payload(data), semantic=True)
         
         return jsonify({
             "status": "success",
@@ -135,10 +438,7 @@ def post_social():
         })
     
     except Exception as e:
-        return jsonify({
-            "status": "error",
-            "message": f"Error generating social media post: {str(e)}"
-        }), 500
+        return upstream_failure(f"Error generating social media post: {str(e)}", e)
 
 @app.route("/ai/screen_resume", methods=["POST"])
 def screen_resume():
@@ -149,43 +449,14 @@ def screen_resume():
             "message": "OpenAI API key not found. Please set it in the .env file."
         }), 400
     
-    data = request.json
-    if not data or "resume" not in data or "job_description" not in data:
-        return jsonify({
-            "status": "error",
-            "message": "Missing required fields: resume and job_description"
-        }), 400
-    
+    data = request_data("screen_resume")
+
     try:
         # Call OpenAI API
-        headers = {
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "gpt-4",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are an HR assistant who screens resumes for job positions."
-                },
-                {
-                    "role": "user",
-                    "content": f"Evaluate this resume for the following job description. Provide a match percentage and brief explanation.\n\nJob Description: {data['job_description']}\n\nResume: {data['resume']}"
-                }
-            ],
-            "max_tokens": 300
-        }
-        
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
-        
-        response_data = response.json()
-        evaluation = response_data["choices"][0]["message"]["content"].strip()
+        if wants_stream():
+            return event_stream(prompts.resume_payload(data), "evaluation", "Error screening resume")
+
+        evaluation = chat_completion(prompts.resume_payload(data))
         
         return jsonify({
             "status": "success",
@@ -193,31 +464,277 @@ def screen_resume():
         })
     
     except Exception as e:
+        return upstream_failure(f"Error screening resume: {str(e)}", e)
+
+@app.route("/ai/job_descriptions", methods=["POST"])
+def create_job_description():
+    """Endpoint to index a job description once for screening many resumes against it"""
+    data = request_data("job_description")
+    try:
+        job = screening.index_job_description(data.get("job_description"), data.get("title"))
+    except screening.ScreeningError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    job["api_key_id"] = auth.current_key()
+    screening.get_store().put("jd", job)
+    top_terms = sorted(job["terms"], key=lambda term: -job["terms"][term])[:20]
+    return jsonify({
+        "status": "success",
+        "job_description_id": job["id"],
+        "title": job["title"],
+        "terms": top_terms
+    }), 201, {"Location": f"/ai/job_descriptions/{job['id']}"}
+
+@app.route("/ai/job_descriptions/<jd_id>", methods=["GET"])
+def get_job_description(jd_id):
+    """Endpoint to fetch an indexed job description"""
+    job = screening.get_store().get("jd", jd_id)
+    if job is None or not owned_by_caller(job):
+        return jsonify({
+            "status": "error",
+            "message": f"Job description not found: {jd_id}"
+        }), 404
+    return jsonify({
+        "status": "success",
+        "job_description": job
+    })
+
+@app.route("/ai/job_descriptions/<jd_id>/screen", methods=["POST"])
+def screen_resumes(jd_id):
+    """Endpoint to rank a pool of resumes locally and evaluate the best ones with OpenAI"""
+    if not OPENAI_API_KEY:
+        return jsonify({
+            "status": "error",
+            "message": "OpenAI API key not found. Please set it in the .env file."
+        }), 400
+
+    store = screening.get_store()
+    job = store.get("jd", jd_id)
+    if job is None or not owned_by_caller(job):
+        return jsonify({
+            "status": "error",
+            "message": f"Job description not found: {jd_id}"
+        }), 404
+
+    try:
+        candidates, top_k = screening.parse_screening(request_data("screening"))
+        result = screening.screen(job, candidates, top_k)
+        first_page = screening.page(result, per_page=request.args.get("per_page", 20, type=int))
+    except screening.ScreeningError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    result["api_key_id"] = auth.current_key()
+    store.put("screening", result)
+    return jsonify(dict({
+        "status": "success",
+        "screening_id": result["id"],
+        "evaluated": result["evaluated"]
+    }, **first_page)), 201, {"Location": f"/ai/screenings/{result['id']}"}
+
+@app.route("/ai/screenings/<screening_id>", methods=["GET"])
+def get_screening(screening_id):
+    """Endpoint to page through screening results sorted by match or local score"""
+    result = screening.get_store().get("screening", screening_id)
+    if result is None or not owned_by_caller(result):
+        return jsonify({
+            "status": "error",
+            "message": f"Screening not found: {screening_id}"
+        }), 404
+
+    try:
+        results_page = screening.page(
+            result,
+            sort=request.args.get("sort", "match"),
+            order=request.args.get("order", "desc"),
+            page_number=request.args.get("page", 1, type=int),
+            per_page=request.args.get("per_page", 20, type=int)
+        )
+    except screening.ScreeningError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 400
+
+    return jsonify(dict({
+        "status": "success",
+        "screening_id": result["id"],
+        "job_description_id": result["job_description_id"],
+        "evaluated": result["evaluated"]
+    }, **results_page))
+
+@app.route("/ai/batch/<task>", methods=["POST"])
+def run_batch(task):
+    """Endpoint to run many AI tasks in one call, streaming results as NDJSON"""
+    if task not in batch.TASKS:
+        return jsonify({
+            "status": "error",
+            "message": f"Unknown batch task: {task}"
+        }), 404
+
+    if not OPENAI_API_KEY:
+        return jsonify({
+            "status": "error",
+            "message": "OpenAI API key not found. Please set it in the .env file."
+        }), 400
+
+    try:
+        items, concurrency = batch.parse_batch(task, request_data("batch"))
+    except batch.BatchError as e:
         return jsonify({
             "status": "error",
-            "message": f"Error screening resume: {str(e)}"
-        }), 500
+            "message": str(e)
+        }), 400
+
+    return Response(batch.run_batch(task, items, concurrency), mimetype="application/x-ndjson")
+
+@app.route("/ai/jobs/<task>", methods=["POST"])
+def submit_job(task):
+    """Endpoint to queue an AI task and return its job id without waiting for the result"""
+    if not OPENAI_API_KEY:
+        return jsonify({
+            "status": "error",
+            "message": "OpenAI API key not found. Please set it in the .env file."
+        }), 400
+
+    try:
+        job = jobs.new_job(task, request_data("job"), auth.current_key())
+    except jobs.JobError as e:
+        return jsonify({
+            "status": "error",
+            "message": str(e)
+        }), 404 if task not in batch.TASKS else 400
+
+    jobs.get_queue().submit(job)
+    jobs.ensure_local_worker()
+    return jsonify({
+        "status": "success",
+        "job_id": job["id"],
+        "job": jobs.public_view(job)
+    }), 202, {"Location": f"/ai/jobs/{job['id']}"}
+
+@app.route("/ai/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Endpoint to poll a queued AI task for its status and result"""
+    job = jobs.get_queue().get(job_id)
+    caller = auth.current_key()
+    if job is None or (auth.enabled() and not auth.is_admin(caller) and job.get("api_key_id") != caller):
+        return jsonify({
+            "status": "error",
+            "message": f"Job not found: {job_id}"
+        }), 404
+    return jsonify({
+        "status": "success",
+        "job": jobs.public_view(job)
+    })
+
+@app.route("/jobs/stats")
+def job_stats():
+    """Endpoint to report job queue depth"""
+    return jsonify({
+        "status": "success",
+        "jobs": jobs.get_queue().info()
+    })
 
 @app.route("/notification/send", methods=["POST"])
 def send_notification():
-    """Mock endpoint to send notifications"""
-    data = request.json
-    if not data or "subject" not in data or "message" not in data:
+    """Endpoint to queue a notification for background delivery"""
+    try:
+        notification = notifications.new_notification(request_data("notification"), notifications.default_channel())
+    except notifications.NotificationError as e:
         return jsonify({
             "status": "error",
-            "message": "Missing required fields: subject and message"
+            "message": str(e)
         }), 400
-    
-    # In a real application, this would send an email, push notification, etc.
-    # For this demo, we're just returning a success response
+
+    notifications.get_dispatcher().submit(notification)
     return jsonify({
         "status": "success",
-        "message": "Notification sent successfully",
+        "message": "Notification queued for delivery",
         "notification": {
-            "subject": data["subject"],
-            "message": data["message"]
+            "id": notification["id"],
+            "channel": notification["channel"],
+            "subject": notification["subject"],
+            "message": notification["message"]
         }
     })
 
+@app.route("/notification/stats")
+def notification_stats():
+    """Endpoint to report notification queue depth, delivery counts and dead letters"""
+    return jsonify({
+        "status": "success",
+        "notifications": notifications.get_dispatcher().info()
+    })
+
+@app.route("/notification/dead_letters")
+def notification_dead_letters():
+    """Endpoint to list notifications that could not be delivered"""
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify({
+        "status": "success",
+        "dead_letters": notifications.get_dispatcher().dead_letters.list(limit)
+    })
+
+@app.route("/workflows")
+def list_workflows():
+    """Endpoint to list the workflows compiled for in-process execution, and why others were not"""
+    return jsonify({
+        "status": "success",
+        "workflows": workflow_engine.get_registry().info()
+    })
+
+def workflow_failure(e):
+    """Error response for a failed workflow node, shaped like the failure of the route it stands for"""
+    cause = e.cause
+    if isinstance(cause, validation.ValidationError):
+        return jsonify(dict(cause.body(), node=e.node)), cause.status_code
+    if isinstance(cause, (notifications.NotificationError, batch.BatchError)):
+        return jsonify({"status": "error", "code": "invalid_request", "message": str(e), "node": e.node}), 400
+    status_code, headers = failure_status(cause)
+    metrics.record_error(cause)
+    return jsonify({
+        "status": "error",
+        "code": metrics.error_class(cause),
+        "message": str(e),
+        "node": e.node
+    }), status_code, headers
+
+@app.route("/webhook/<path:hook>", methods=["POST"])
+def trigger_workflow(hook):
+    """Endpoint to run a workflow in-process from its webhook trigger, without a round trip through n8n"""
+    registry = workflow_engine.get_registry()
+    workflow = registry.get(hook)
+    if workflow is None:
+        return jsonify({
+            "status": "error",
+            "message": f"No in-process workflow has the webhook path: {hook}"
+        }), 404
+
+    trigger = {
+        "body": request_data("webhook"),
+        # Credentials stay out of the data the nodes can read
+        "headers": {name: value for name, value in request.headers.items()
+                    if name.lower() not in ("authorization", "x-api-key", "cookie")},
+        "query": request.args.to_dict()
+    }
+    try:
+        result, nodes = registry.run(workflow, trigger)
+    except workflow_engine.NodeFailed as e:
+        return workflow_failure(e)
+
+    return jsonify({
+        "status": "success",
+        "workflow": workflow.slug,
+        "result": result,
+        "nodes": nodes
+    })
+
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # Development server only; production runs serve.py
+    app.run(debug=os.getenv("FLASK_DEBUG", "0") == "1", host="0.0.0.0", port=5000)
@@ -0,0 +1,338 @@
+"""
+ASGI entry point for the backend
+The /ai/* routes run natively on asyncio so slow upstream calls do not hold
+a worker thread; every other route is served by the Flask app unchanged,
+on a pool of WSGI_THREADS threads per worker. The / health check is
+answered here too, without a thread hop.
+"""
+
+import json
+import os
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.datastructures import Headers
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse as StarletteJSONResponse
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Match, Mount, Route
+
+import accounting
+import app as wsgi
+import auth
+import batch
+import chunking
+import history
+import metrics
+import profiler
+import prompts
+import resilience
+import streaming
+import validation
+from completion_service import afetch_completion, failure_status
+
+
+class JSONResponse(StarletteJSONResponse):
+    """JSON response rendered by the fast JSON encoder"""
+
+    def render(self, content):
+        return validation.dumps(content)
+
+
+class DeadlineMiddleware:
+    """Bound each request's upstream work by its X-Request-Timeout header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            resilience.start_deadline(Headers(scope=scope).get(resilience.DEADLINE_HEADER))
+        await self.app(scope, receive, send)
+
+
+class AuthMiddleware:
+    """Authenticate the native routes and charge them to the caller's quota
+
+    The mounted Flask app checks its own routes in a before_request hook.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or matched_route(self.routes, scope) is None:
+            await self.app(scope, receive, send)
+            return
+        auth.set_current_key(None)
+        try:
+            auth.set_current_key(accounting.admit_request(scope["method"], scope["path"], Headers(scope=scope)))
+        except auth.AuthError as e:
+            response = JSONResponse(e.body(), status_code=e.status_code)
+        except accounting.QuotaExceeded as e:
+            response = JSONResponse(e.body(), status_code=429, headers={"Retry-After": str(int(e.retry_after))})
+        else:
+            await self.app(scope, receive, send)
+            return
+        await response(scope, receive, send)
+
+
+def matched_route(routes, scope):
+    """Path of the native route serving scope, None for requests handed to Flask"""
+    for route in routes:
+        if route.matches(scope)[0] == Match.FULL:
+            return route.path
+    return None
+
+
+class MetricsMiddleware:
+    """Record route metrics and add a Server-Timing header for the native routes
+
+    Requests handed to the mounted Flask app are measured by its own hooks.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        route = matched_route(self.routes, scope) if scope["type"] == "http" else None
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = metrics.start_request(route)
+        finished = False
+        # Native routes all run on the event loop thread; their samples are told apart by the stack
+        profiler.get_profiler().begin(profiler.EVENT_LOOP)
+        trace = profiler.start_trace(Headers(scope=scope), (scope.get("client") or (None,))[0])
+
+        async def send_with_timing(message):
+            nonlocal finished, trace
+            if message["type"] == "http.response.start":
+                finished = True
+                if trace is not None:
+                    profiler.finish_trace(trace)
+                    trace = None
+                timing = metrics.finish_request(route, scope["method"], message["status"], started)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if trace is not None:
+                profiler.finish_trace(trace)
+            if not finished:
+                metrics.finish_request(route, scope["method"], 500, started)
+
+
+class HistoryMiddleware:
+    """Record the native routes in the execution history
+
+    Requests handed to the mounted Flask app are recorded by its own hooks.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        route = matched_route(self.routes, scope) if scope["type"] == "http" else None
+        if route is None or history.start(scope["method"], scope["path"]) is None:
+            await self.app(scope, receive, send)
+            return
+
+        response = {}
+        chunks = []
+
+        async def send_recording(message):
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message.get("headers", []))
+                response.update(status=message["status"], cache=headers.get("x-cache"),
+                                json=headers.get("content-type", "").startswith("application/json"))
+            elif message["type"] == "http.response.body":
+                if response.get("json"):
+                    chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    history.finish(route, scope["path"], response["status"], auth.current_key() or auth.ANONYMOUS,
+                                   b"".join(chunks) if response["json"] else None, response["cache"])
+            await send(message)
+
+        await self.app(scope, receive, send_recording)
+
+
+def error(message, status_code, headers=None):
+    return JSONResponse({"status": "error", "message": message}, status_code=status_code, headers=headers)
+
+
+def upstream_failure(message, e):
+    """Error response for a failed completion, keeping rate limiting distinguishable from faults"""
+    status_code, headers = failure_status(e)
+    metrics.record_error(e)
+    return JSONResponse({
+        "status": "error",
+        "code": metrics.error_class(e),
+        "message": message
+    }, status_code=status_code, headers=headers)
+
+
+async def read_json(request, schema_name):
+    """Decode the JSON body and validate it against the route's schema
+
+    The declared size is checked before anything is read, and reading
+    stops as soon as a body sent without a length passes the limit.
+    """
+    schema = validation.SCHEMAS[schema_name]
+    schema.check_size(request.headers.get("content-length"))
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > schema.max_bytes:
+            raise schema.too_large()
+    body = bytes(body)
+    history.set_input(body)
+    return schema.parse(body)
+
+
+async def invalid_request(request, e):
+    return JSONResponse(e.body(), status_code=e.status_code)
+
+
+async def chat_completion(payload, semantic=False):
+    """Return (content, cache_status) from the non-blocking completion pipeline"""
+    response_data, cache_status = await afetch_completion(payload, semantic)
+    return prompts.message_content(response_data), cache_status
+
+
+def wants_stream(request):
+    return streaming.wants_stream(request.query_params.get("stream"), request.headers.get("accept"))
+
+
+def event_stream(payload, field, error_prefix, extra=None, semantic=False):
+    """Relay a streaming completion to the caller as Server-Sent Events"""
+    events = streaming.astream_completion(payload, field, error_prefix, extra, semantic)
+    return StreamingResponse(events, media_type="text/event-stream", headers=streaming.SSE_HEADERS)
+
+
+def missing_api_key():
+    return error("OpenAI API key not found. Please set it in the .env file.", 400)
+
+
+async def summarize(request):
+    """Endpoint to summarize text using OpenAI API"""
+    if not wsgi.OPENAI_API_KEY:
+        return missing_api_key()
+
+    data = await read_json(request, "summary")
+
+    try:
+        payload, chunk_info = await chunking.aprepare_summary(data["text"])
+        if wants_stream(request):
+            return event_stream(payload, "summary", "Error generating summary", chunk_info, semantic=True)
+
+        summary, cache_status = await chat_completion(payload, semantic=True)
+        return JSONResponse(dict({
+            "status": "success",
+            "summary": summary
+        }, **chunk_info), headers={"X-Cache": cache_status})
+
+    except Exception as e:
+        return upstream_failure(f"Error generating summary: {str(e)}", e)
+
+
+async def post_social(request):
+    """Endpoint to generate social media post from content"""
+    if not wsgi.OPENAI_API_KEY:
+        return missing_api_key()
+
+    data = await read_json(request, "post_social")
+
+    try:
+        if wants_stream(request):
+            return event_stream(prompts.social_payload(data), "post", "Error generating social media post",
+                                {"platform": data["platform"]}, semantic=True)
+
+        post, cache_status = await chat_completion(prompts.social_payload(data), semantic=True)
+        return JSONResponse({
+            "status": "success",
+            "post": post,
+            "platform": data["platform"]
+        }, headers={"X-Cache": cache_status})
+
+    except Exception as e:
+        return upstream_failure(f"Error generating social media post: {str(e)}", e)
+
+
+async def screen_resume(request):
+    """Endpoint to screen resumes using AI"""
+    if not wsgi.OPENAI_API_KEY:
+        return missing_api_key()
+
+    data = await read_json(request, "screen_resume")
+
+    try:
+        if wants_stream(request):
+            return event_stream(prompts.resume_payload(data), "evaluation", "Error screening resume")
+
+        evaluation, cache_status = await chat_completion(prompts.resume_payload(data))
+        return JSONResponse({
+            "status": "success",
+            "evaluation": evaluation
+        }, headers={"X-Cache": cache_status})
+
+    except Exception as e:
+        return upstream_failure(f"Error screening resume: {str(e)}", e)
+
+
+async def run_batch(request):
+    """Endpoint to run many AI tasks in one call, streaming results as NDJSON"""
+    task = request.path_params["task"]
+    if task not in batch.TASKS:
+        return error(f"Unknown batch task: {task}", 404)
+
+    if not wsgi.OPENAI_API_KEY:
+        return missing_api_key()
+
+    try:
+        items, concurrency = batch.parse_batch(task, await read_json(request, "batch"))
+    except batch.BatchError as e:
+        return error(str(e), 400)
+
+    return StreamingResponse(batch.arun_batch(task, items, concurrency), media_type="application/x-ndjson")
+
+
+HOME_BODY = json.dumps({
+    "status": "success",
+    "message": "AutoTasker AI Backend is running"
+}).encode()
+
+
+async def home(request):
+    """Health check, answered from a pre-rendered body"""
+    return Response(HOME_BODY, media_type="application/json")
+
+
+ROUTES = [
+    Route("/ai/summary", summarize, methods=["POST"]),
+    Route("/ai/post_social", post_social, methods=["POST"]),
+    Route("/ai/screen_resume", screen_resume, methods=["POST"]),
+    Route("/ai/batch/{task}", run_batch, methods=["POST"])
+]
+
+app = Starlette(
+    routes=ROUTES + [
+        Route("/", home),
+        Mount("/", WSGIMiddleware(wsgi.app, workers=int(os.getenv("WSGI_THREADS", "10"))))
+    ],
+    exception_handlers={validation.ValidationError: invalid_request},
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]),
+        Middleware(MetricsMiddleware, routes=ROUTES),
+        Middleware(HistoryMiddleware, routes=ROUTES),
+        Middleware(DeadlineMiddleware),
+        Middleware(AuthMiddleware, routes=ROUTES)
+    ]
+)
@@ -0,0 +1,169 @@
+"""API-key authentication for the /ai/* routes
+
+Keys are issued, not stored: a key is "<key id>.<signature>", the
+signature being an HMAC of the key id under API_KEY_SECRET, so every
+worker verifies one without a lookup. The key id names the calling
+workflow; quotas and the usage ledger are kept per key id. Issue a key
+with
+
+    python auth.py issue email-summarizer
+
+Callers send it as X-API-Key or as "Authorization: Bearer <key>". A
+bearer token with three dot-separated parts is read as an HS256 JWT
+signed with JWT_SECRET instead, whose "sub" is the key id.
+
+Authentication is on when either secret is set (AUTH_ENABLED overrides
+that). Key ids listed in REVOKED_API_KEYS are refused; ids listed in
+ADMIN_API_KEYS may read every key's usage.
+"""
+import base64
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+KEY_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+ANONYMOUS = "anonymous"
+
+_current_key = contextvars.ContextVar("api_key_id", default=None)
+
+
+class AuthError(Exception):
+    """Raised when a request carries no valid credentials"""
+
+    status_code = 401
+    code = "unauthorized"
+
+    def body(self):
+        return {"status": "error", "code": self.code, "message": str(self)}
+
+
+def _env_list(name):
+    return {item.strip() for item in os.getenv(name, "").split(",") if item.strip()}
+
+
+def enabled():
+    setting = os.getenv("AUTH_ENABLED", "auto").lower()
+    if setting == "auto":
+        return bool(os.getenv("API_KEY_SECRET") or os.getenv("JWT_SECRET"))
+    return setting == "true"
+
+
+def is_admin(key_id):
+    return key_id is not None and key_id in _env_list("ADMIN_API_KEYS")
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign(key_id, secret):
+    return _b64(hmac.new(secret.encode(), key_id.encode(), hashlib.sha256).digest())
+
+
+def issue_key(key_id, secret=None):
+    """Return a new API key for key_id, signed with API_KEY_SECRET"""
+    secret = secret or os.getenv("API_KEY_SECRET")
+    if not secret:
+        raise AuthError("API_KEY_SECRET is not set")
+    if not KEY_ID_PATTERN.match(key_id):
+        raise AuthError("Key ids are 1 to 64 letters, digits, dashes or underscores")
+    return f"{key_id}.{sign(key_id, secret)}"
+
+
+def verify_api_key(key, secret):
+    """Return the key id of a correctly signed key, or None"""
+    key_id, _, signature = key.partition(".")
+    if not secret or not signature or not KEY_ID_PATTERN.match(key_id):
+        return None
+    return key_id if hmac.compare_digest(signature, sign(key_id, secret)) else None
+
+
+def verify_jwt(token, secret, now=None):
+    """Return the subject of a valid, unexpired HS256 token, or None"""
+    if not secret:
+        return None
+    try:
+        header, claims, signature = token.split(".")
+        expected = hmac.new(secret.encode(), f"{header}.{claims}".encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(_unb64(signature), expected):
+            return None
+        if json.loads(_unb64(header)).get("alg") != "HS256":
+            return None
+        claims = json.loads(_unb64(claims))
+    except (ValueError, AttributeError):
+        return None
+    if claims.get("exp") is not None and claims["exp"] < (now or time.time()):
+        return None
+    subject = claims.get("sub")
+    return subject if isinstance(subject, str) and KEY_ID_PATTERN.match(subject) else None
+
+
+def authenticate(headers):
+    """Return the key id of the caller's credentials; raises AuthError
+
+    headers is any mapping with a case-insensitive get, such as Flask's
+    or Starlette's request headers.
+    """
+    token = headers.get("X-API-Key")
+    if not token:
+        scheme, _, token = (headers.get("Authorization") or "").partition(" ")
+        if scheme.lower() != "bearer":
+            token = None
+    if not token:
+        raise AuthError("Missing API key: send it as X-API-Key or as a Bearer token")
+
+    token = token.strip()
+    if token.count(".") == 2:
+        key_id = verify_jwt(token, os.getenv("JWT_SECRET", ""))
+    else:
+        key_id = verify_api_key(token, os.getenv("API_KEY_SECRET", ""))
+    if key_id is None or key_id in _env_list("REVOKED_API_KEYS"):
+        raise AuthError("Invalid API key")
+    return key_id
+
+
+def current_key():
+    """Key id of the request or job being served, None when unauthenticated"""
+    return _current_key.get()
+
+
+def set_current_key(key_id):
+    _current_key.set(key_id)
+
+
+@contextmanager
+def acting_as(key_id):
+    """Attribute the work done inside the block to key_id"""
+    token = _current_key.set(key_id)
+    try:
+        yield
+    finally:
+        _current_key.reset(token)
+
+
+def main(argv):
+    if len(argv) != 2 or argv[0] != "issue":
+        print("usage: python auth.py issue <key id>", file=sys.stderr)
+        return 2
+    try:
+        print(issue_key(argv[1]))
+    except AuthError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,145 @@
+"""Bulk execution of AI tasks with bounded concurrency and NDJSON streaming"""
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import chunking
+import metrics
+import prompts
+import validation
+from completion_service import afetch_completion, fetch_completion
+from semantic_cache import SEMANTIC_TASKS
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+
+# Per task: required item fields, payload builder, result field, error prefix
+TASKS = {
+    "summary": (("text",), chunking.summary_payload, "summary", "Error generating summary"),
+    "post_social": (("content", "platform"), prompts.social_payload, "post", "Error generating social media post"),
+    "screen_resume": (("resume", "job_description"), prompts.resume_payload, "evaluation", "Error screening resume")
+}
+
+
+class BatchError(ValueError):
+    """Raised when a batch request cannot be run at all"""
+
+
+def parse_batch(task_name, data):
+    """Validate a batch request and return (items, concurrency)
+
+    Fields given at the top level of the body (for example one
+    job_description for a pile of resumes) apply to every item that
+    does not set them itself.
+    """
+    if task_name not in TASKS:
+        raise BatchError(f"Unknown batch task: {task_name}")
+    if not data or not isinstance(data.get("items"), list) or not data["items"]:
+        raise BatchError("Missing required field: items")
+    if len(data["items"]) > BATCH_MAX_ITEMS:
+        raise BatchError(f"Too many items: at most {BATCH_MAX_ITEMS} per batch")
+
+    required = TASKS[task_name][0]
+    shared = {field: data[field] for field in required if field in data}
+    items = [dict(shared, **item) if isinstance(item, dict) else item for item in data["items"]]
+
+    try:
+        concurrency = int(data.get("concurrency", BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        raise BatchError("concurrency must be an integer")
+    return items, max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+
+
+# Builders that call upstream themselves get a non-blocking variant for the ASGI app
+ASYNC_BUILDERS = {
+    "summary": chunking.asummary_payload
+}
+
+
+def validate_item(task_name, item):
+    """Check one task item against the task's request schema"""
+    validation.SCHEMAS[task_name].validate(item)
+
+
+def item_payload(task_name, item):
+    """Validate one task item and build its completion payload"""
+    validate_item(task_name, item)
+    return TASKS[task_name][1](item)
+
+
+async def aitem_payload(task_name, item):
+    validate_item(task_name, item)
+    if task_name in ASYNC_BUILDERS:
+        return await ASYNC_BUILDERS[task_name](item)
+    return TASKS[task_name][1](item)
+
+
+def task_result(task_name, item, response_data):
+    """Response fields for one finished task item, matching the single-item endpoints"""
+    _, _, field, _ = TASKS[task_name]
+    result = {"status": "success", field: prompts.message_content(response_data)}
+    if task_name == "post_social":
+        result["platform"] = item["platform"]
+    return result
+
+
+def run_task(task_name, item):
+    """Run one task item through the completion pipeline"""
+    response_data, _ = fetch_completion(item_payload(task_name, item), task_name in SEMANTIC_TASKS)
+    return task_result(task_name, item, response_data)
+
+
+def _error_line(task_name, index, e):
+    if isinstance(e, validation.ValidationError):
+        return {"index": index, "status": "error", "code": e.code, "message": str(e)}
+    metrics.record_error(e)
+    return {"index": index, "status": "error", "code": metrics.error_class(e),
+            "message": f"{TASKS[task_name][3]}: {str(e)}"}
+
+
+def _run_item(task_name, index, item):
+    try:
+        return dict({"index": index}, **run_task(task_name, item))
+    except Exception as e:
+        return _error_line(task_name, index, e)
+
+
+async def _arun_item(task_name, index, item, semaphore):
+    try:
+        async with semaphore:
+            payload = await aitem_payload(task_name, item)
+            response_data, _ = await afetch_completion(payload, task_name in SEMANTIC_TASKS)
+        return dict({"index": index}, **task_result(task_name, item, response_data))
+    except Exception as e:
+        return _error_line(task_name, index, e)
+
+
+def run_batch(task_name, items, concurrency):
+    """Yield one NDJSON line per item, in completion order, from a thread pool
+
+    Each item runs in a copy of the request's context, so its deadline and
+    API key follow it into the pool.
+    """
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = [executor.submit(contextvars.copy_context().run, _run_item, task_name, index, item)
+                   for index, item in enumerate(items)]
+        for future in as_completed(futures):
+            yield validation.dumps(future.result()) + b"\n"
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def arun_batch(task_name, items, concurrency):
+    """Async variant of run_batch for the ASGI app"""
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(_arun_item(task_name, index, item, semaphore))
+             for index, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield validation.dumps(await next_done) + b"\n"
+    finally:
+        for task in tasks:
+            task.cancel()
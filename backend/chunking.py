@@ -0,0 +1,177 @@
+"""Token-aware map-reduce summarization for inputs too long for one prompt
+
+Text under SUMMARY_CHUNK_THRESHOLD tokens is summarized in one call as
+before. Longer text is split into chunks of about SUMMARY_CHUNK_TOKENS,
+each chunk is summarized concurrently (the map stage), and the part
+summaries are combined by a final reduce call. Input past
+SUMMARY_MAX_INPUT_TOKENS is dropped, which bounds both cost and latency.
+
+Chunk boundaries are chosen by paragraph content rather than by position,
+so editing one part of a document leaves the other chunks byte-identical.
+Their map calls are then answered by the response cache and only the
+changed chunks go upstream.
+
+Tokens are counted with tiktoken when it is installed and estimated from
+the character count otherwise.
+"""
+import asyncio
+import contextvars
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import prompts
+from completion_service import afetch_completion, fetch_completion
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+
+
+def count_tokens(text):
+    global _encoding
+    if tiktoken is not None and _encoding is None:
+        try:
+            _encoding = tiktoken.encoding_for_model("gpt-4")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _settings():
+    return {
+        "threshold": int(os.getenv("SUMMARY_CHUNK_THRESHOLD", "3000")),
+        "chunk_tokens": int(os.getenv("SUMMARY_CHUNK_TOKENS", "2000")),
+        "max_input_tokens": int(os.getenv("SUMMARY_MAX_INPUT_TOKENS", "100000")),
+        "concurrency": int(os.getenv("SUMMARY_CHUNK_CONCURRENCY", "8"))
+    }
+
+
+def _units(text, max_tokens):
+    """Paragraphs, with any paragraph over max_tokens split by sentence and then by length"""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            yield paragraph
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                yield sentence
+                continue
+            step = max(1, len(sentence) * max_tokens // count_tokens(sentence))
+            for start in range(0, len(sentence), step):
+                yield sentence[start:start + step]
+
+
+def _is_anchor(unit):
+    # About one paragraph in four ends a chunk once it is half full
+    return int(hashlib.sha1(unit.encode()).hexdigest()[:8], 16) % 4 == 0
+
+
+def chunk_text(text, chunk_tokens, max_input_tokens=None):
+    """Split text into content-defined chunks; returns (chunks, truncated)"""
+    chunks, current, size, total = [], [], 0, 0
+    truncated = False
+    for unit in _units(text, chunk_tokens):
+        tokens = count_tokens(unit)
+        if max_input_tokens is not None and total + tokens > max_input_tokens:
+            truncated = True
+            break
+        if current and size + tokens > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(unit)
+        size += tokens
+        total += tokens
+        if size >= chunk_tokens // 2 and _is_anchor(unit):
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks, truncated
+
+
+def _map_one(chunk):
+    response_data, _ = fetch_completion(prompts.chunk_summary_payload(chunk))
+    return prompts.message_content(response_data)
+
+
+def _map(chunks, concurrency):
+    # Each chunk call carries a copy of the request context (deadline, timings)
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _map_one, chunk) for chunk in chunks]
+        return [future.result() for future in futures]
+
+
+async def _amap(chunks, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def map_one(chunk):
+        async with semaphore:
+            response_data, _ = await afetch_completion(prompts.chunk_summary_payload(chunk))
+        return prompts.message_content(response_data)
+
+    return await asyncio.gather(*(map_one(chunk) for chunk in chunks))
+
+
+def _plan(text):
+    """(settings, chunks, truncated), or None when the text fits in one prompt"""
+    settings = _settings()
+    if count_tokens(text) <= settings["threshold"]:
+        return None
+    chunks, truncated = chunk_text(text, settings["chunk_tokens"], settings["max_input_tokens"])
+    return settings, chunks, truncated
+
+
+def _regroup(summaries, chunk_tokens):
+    """Chunks for another map round when the part summaries are still too long to reduce"""
+    joined = "\n\n".join(summaries)
+    if len(summaries) < 2 or count_tokens(joined) <= chunk_tokens:
+        return None
+    groups = chunk_text(joined, chunk_tokens)[0]
+    return groups if len(groups) < len(summaries) else None
+
+
+def prepare_summary(text):
+    """Return (payload, info) for summarizing text, running the map stage first if it is long
+
+    info is empty for short text and otherwise reports the chunk count and
+    whether the input was truncated.
+    """
+    plan = _plan(text)
+    if plan is None:
+        return prompts.summary_payload({"text": text}), {}
+    settings, chunks, truncated = plan
+    summaries = _map(chunks, settings["concurrency"])
+    while (groups := _regroup(summaries, settings["chunk_tokens"])) is not None:
+        summaries = _map(groups, settings["concurrency"])
+    return prompts.reduce_summary_payload(summaries), {"chunks": len(chunks), "truncated": truncated}
+
+
+async def aprepare_summary(text):
+    """asyncio variant of prepare_summary"""
+    plan = _plan(text)
+    if plan is None:
+        return prompts.summary_payload({"text": text}), {}
+    settings, chunks, truncated = plan
+    summaries = await _amap(chunks, settings["concurrency"])
+    while (groups := _regroup(summaries, settings["chunk_tokens"])) is not None:
+        summaries = await _amap(groups, settings["concurrency"])
+    return prompts.reduce_summary_payload(summaries), {"chunks": len(chunks), "truncated": truncated}
+
+
+def summary_payload(data):
+    """Payload builder for batch and job items, with the map stage applied"""
+    return prepare_summary(data["text"])[0]
+
+
+async def asummary_payload(data):
+    return (await aprepare_summary(data["text"]))[0]
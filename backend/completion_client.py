@@ -0,0 +1,369 @@
+"""Shared, pooled HTTP client for OpenAI-compatible chat completion calls"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+
+# httpx is optional; it provides HTTP/2 (with the h2 extra) and the async client
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = httpx is not None
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+DEFAULT_API_URL = "https://api.openai.com/v1/chat/completions"
+
+
+class UpstreamError(Exception):
+    """Raised when the completion upstream answers with an error status"""
+
+    def __init__(self, status_code, message, headers=None):
+        super().__init__(f"Upstream returned {status_code}: {message}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+_connect_timing = threading.local()
+
+
+class _TimedConnect:
+    """Adds the time spent opening (TCP + TLS) a connection to the calling thread's tally"""
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_timing.seconds = getattr(_connect_timing, "seconds", 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPConnection(_TimedConnect, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnect, HTTPSConnection):
+    pass
+
+
+class _TimedAdapter(HTTPAdapter):
+    def get_connection(self, url, proxies=None):
+        pool = super().get_connection(url, proxies)
+        pool.ConnectionCls = _TimedHTTPSConnection if pool.scheme == "https" else _TimedHTTPConnection
+        return pool
+
+
+class _Trace:
+    """httpx trace hook that turns connection events into phase timings"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+
+    def __call__(self, event, info):
+        self.marks[event] = time.perf_counter()
+
+    async def atrace(self, event, info):
+        self.marks[event] = time.perf_counter()
+
+    def timings(self):
+        connect = 0.0
+        for step in ("connection.connect_tcp", "connection.start_tls"):
+            if f"{step}.complete" in self.marks:
+                connect += self.marks[f"{step}.complete"] - self.marks[f"{step}.started"]
+        headers = [mark for event, mark in self.marks.items() if event.endswith("receive_response_headers.complete")]
+        now = time.perf_counter()
+        return {
+            "connect": connect,
+            "ttfb": (headers[0] if headers else now) - self.start,
+            "total": now - self.start
+        }
+
+
+class CompletionClient:
+    """Thread-safe chat completion client that keeps upstream connections alive
+
+    One instance owns a connection pool that is shared by every request
+    handled in the worker, so only the first call to a host pays for the
+    TCP and TLS handshake.
+    """
+
+    def __init__(self, api_key, api_url=DEFAULT_API_URL, pool_size=20,
+                 connect_timeout=5.0, read_timeout=60.0, http2=True, verify=True):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = bool(http2 and HTTP2_AVAILABLE)
+        self.verify = verify
+
+        if self.http2:
+            self._session = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=pool_size,
+                    max_keepalive_connections=pool_size
+                ),
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                verify=verify
+            )
+        else:
+            self._session = requests.Session()
+            adapter = _TimedAdapter(
+                pool_connections=1,
+                pool_maxsize=pool_size,
+                max_retries=0
+            )
+            self._session.mount("https://", adapter)
+            self._session.mount("http://", adapter)
+
+    @property
+    def headers(self):
+        headers = {"Content-Type": "application/json"}
+        # Local inference servers are often run without a key
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def post(self, payload, timeout=None):
+        """Send a raw completion request and return the upstream response
+
+        timeout caps the connect and read timeouts for this one call. The
+        response gets a timings dict with connect, ttfb and total seconds.
+        """
+        connect_timeout, read_timeout = _cap(self.connect_timeout, self.read_timeout, timeout)
+        if self.http2:
+            trace = _Trace()
+            response = self._session.post(
+                self.api_url,
+                headers=self.headers,
+                json=payload,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                extensions={"trace": trace}
+            )
+            response.timings = trace.timings()
+            return response
+
+        _connect_timing.seconds = 0.0
+        start = time.perf_counter()
+        response = self._session.post(
+            self.api_url,
+            headers=self.headers,
+            json=payload,
+            timeout=(connect_timeout, read_timeout),
+            verify=self.verify
+        )
+        response.timings = {
+            "connect": _connect_timing.seconds,
+            "ttfb": response.elapsed.total_seconds(),
+            "total": time.perf_counter() - start
+        }
+        return response
+
+    def complete(self, payload):
+        """Send a completion request and return the decoded JSON body"""
+        return parse_response(self.post(payload))
+
+    def stream(self, payload):
+        """Send a streaming completion request and yield each decoded chunk"""
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        if self.http2:
+            with self._session.stream("POST", self.api_url, headers=self.headers, json=payload) as response:
+                if response.status_code >= 400:
+                    response.read()
+                    raise UpstreamError(response.status_code, _error_message(response), response.headers)
+                yield from _sse_chunks(response.iter_lines())
+            return
+
+        with self._session.post(
+            self.api_url,
+            headers=self.headers,
+            json=payload,
+            timeout=(self.connect_timeout, self.read_timeout),
+            verify=self.verify,
+            stream=True
+        ) as response:
+            if response.status_code >= 400:
+                raise UpstreamError(response.status_code, _error_message(response), response.headers)
+            yield from _sse_chunks(response.iter_lines())
+
+    def close(self):
+        self._session.close()
+
+
+class AsyncCompletionClient:
+    """Non-blocking counterpart of CompletionClient used by the ASGI app"""
+
+    def __init__(self, api_key, api_url=DEFAULT_API_URL, pool_size=1000,
+                 connect_timeout=5.0, read_timeout=60.0, http2=True, verify=True):
+        if httpx is None:
+            raise RuntimeError("The httpx package is required for the async completion client")
+        self.api_key = api_key
+        self.api_url = api_url
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = bool(http2 and HTTP2_AVAILABLE)
+        self._session = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            verify=verify
+        )
+
+    headers = CompletionClient.headers
+
+    async def post(self, payload, timeout=None):
+        """Send a raw completion request and return the upstream response"""
+        connect_timeout, read_timeout = _cap(self.connect_timeout, self.read_timeout, timeout)
+        trace = _Trace()
+        response = await self._session.post(
+            self.api_url,
+            headers=self.headers,
+            json=payload,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            extensions={"trace": trace.atrace}
+        )
+        response.timings = trace.timings()
+        return response
+
+    async def complete(self, payload):
+        """Send a completion request and return the decoded JSON body"""
+        return parse_response(await self.post(payload))
+
+    async def stream(self, payload):
+        """Send a streaming completion request and yield each decoded chunk"""
+        payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        async with self._session.stream("POST", self.api_url, headers=self.headers, json=payload) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise UpstreamError(response.status_code, _error_message(response), response.headers)
+            async for line in response.aiter_lines():
+                chunk = _sse_chunk(line)
+                if chunk is _DONE:
+                    return
+                if chunk is not None:
+                    yield chunk
+
+    async def close(self):
+        await self._session.aclose()
+
+
+def _cap(connect_timeout, read_timeout, timeout):
+    if timeout is None:
+        return connect_timeout, read_timeout
+    return min(connect_timeout, timeout), min(read_timeout, timeout)
+
+
+_DONE = object()
+
+
+def _sse_chunk(line):
+    """Decode one Server-Sent Events line from a streaming completion"""
+    if isinstance(line, bytes):
+        line = line.decode()
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    return _DONE if data == "[DONE]" else json.loads(data)
+
+
+def _sse_chunks(lines):
+    for line in lines:
+        chunk = _sse_chunk(line)
+        if chunk is _DONE:
+            return
+        if chunk is not None:
+            yield chunk
+
+
+def parse_response(response):
+    """Decode a completion response, raising UpstreamError for error statuses"""
+    if response.status_code >= 400:
+        raise UpstreamError(response.status_code, _error_message(response), response.headers)
+    return response.json()
+
+
+def _error_message(response):
+    try:
+        return response.json()["error"]["message"]
+    except Exception:
+        return response.text[:200]
+
+
+_clients = {}
+_client_lock = threading.Lock()
+
+
+_async_clients = {}
+
+
+def _settings(api_url=None, api_key=None):
+    return {
+        "api_key": os.getenv("OPENAI_API_KEY", "") if api_key is None else api_key,
+        "api_url": api_url or os.getenv("OPENAI_API_URL", DEFAULT_API_URL),
+        "connect_timeout": float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+        "read_timeout": float(os.getenv("OPENAI_READ_TIMEOUT", os.getenv("AI_PROCESSING_TIMEOUT", "60"))),
+        "http2": os.getenv("OPENAI_HTTP2", "true").lower() == "true",
+        "verify": os.getenv("OPENAI_VERIFY_TLS", "true").lower() == "true"
+    }
+
+
+def get_client(api_url=None, api_key=None):
+    """Return the process-wide completion client for an endpoint, creating it on first use
+
+    Without arguments this is the OPENAI_API_URL client; the model router
+    passes each provider's URL and key so every provider keeps its own pool.
+    With UPSTREAM_MODE set to record or replay it is wrapped by the recorder.
+    """
+    from replay import wrap_client
+    settings = _settings(api_url, api_key)
+    key = (settings["api_url"], settings["api_key"])
+    client = _clients.get(key)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = wrap_client(CompletionClient(
+                    pool_size=int(os.getenv("OPENAI_POOL_SIZE", "20")),
+                    **settings
+                ))
+    return client
+
+
+def get_async_client(api_url=None, api_key=None):
+    """Return the async completion client for an endpoint, bound to the running event loop"""
+    from replay import wrap_client
+    loop = asyncio.get_running_loop()
+    settings = _settings(api_url, api_key)
+    key = (settings["api_url"], settings["api_key"])
+    clients = _async_clients.get(loop)
+    if clients is None:
+        _async_clients.clear()
+        clients = _async_clients[loop] = {}
+    client = clients.get(key)
+    if client is None:
+        client = clients[key] = wrap_client(AsyncCompletionClient(
+            pool_size=int(os.getenv("OPENAI_ASYNC_POOL_SIZE", "1000")),
+            **settings
+        ), asynchronous=True)
+    return client
+
+
+def reset_client():
+    """Close and drop the shared clients so the next call rebuilds them"""
+    with _client_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+    _async_clients.clear()
@@ -0,0 +1,245 @@
+"""Completion pipeline shared by the WSGI and ASGI apps
+
+A request is answered from the response cache when possible; otherwise
+identical concurrent misses are coalesced into one upstream call whose
+result is stored back in the cache. Upstream calls are admitted by the
+governor so bursts queue briefly instead of tripping upstream rate limits,
+are retried, hedged and circuit-broken by the resilience layer, and are
+sent to the provider and model chosen by the model router. A request is
+refused while the calling key's quota is spent, and every caller, including
+those whose miss was coalesced into another's upstream call, is charged
+and written to the usage ledger.
+
+A coalesced call can fail for reasons that belong to the caller that made
+it (its quota or its deadline). The other callers waiting on it then
+retry, one of them making the call again for itself.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import accounting
+import metrics
+from completion_client import UpstreamError, get_async_client, get_client, parse_response
+from governor import Overloaded, Permit, estimate_tokens, get_governor
+from resilience import DeadlineExceeded, get_resilience
+from response_cache import cache_key, get_cache
+from router import get_router
+from semantic_cache import get_semantic_cache
+from singleflight import get_async_flight, get_flight
+
+# Failures of a coalesced call that belong to its leader and are never handed to followers
+CALLER_ERRORS = (accounting.QuotaExceeded, DeadlineExceeded)
+
+
+def failure_status(e):
+    """HTTP status and headers for a failed completion
+
+    Shed calls and upstream rate limits are reported as such instead of
+    as a generic server error, with a Retry-After hint for the caller.
+    """
+    if isinstance(e, accounting.QuotaExceeded):
+        return 429, {"Retry-After": str(int(e.retry_after))}
+    if isinstance(e, Overloaded):
+        return 503, {"Retry-After": str(int(e.retry_after))}
+    if isinstance(e, DeadlineExceeded):
+        return 504, {}
+    if isinstance(e, UpstreamError) and e.status_code == 429:
+        return 429, {"Retry-After": e.headers.get("retry-after", "1")}
+    return 500, {}
+
+
+@contextmanager
+def governed(payload, timeout=None):
+    """Hold a governor permit for the duration of one upstream call"""
+    governor = get_governor()
+    if governor is None:
+        yield Permit(None, 0)
+        return
+    queued_at = time.monotonic()
+    with governor.slot(estimate_tokens(payload), timeout) as permit:
+        metrics.add_timing("queue", time.monotonic() - queued_at)
+        try:
+            yield permit
+        except UpstreamError as e:
+            permit.observe(e.status_code, e.headers)
+            raise
+
+
+@asynccontextmanager
+async def agoverned(payload, timeout=None):
+    """asyncio variant of governed"""
+    governor = get_governor()
+    if governor is None:
+        yield Permit(None, 0)
+        return
+    queued_at = time.monotonic()
+    async with governor.aslot(estimate_tokens(payload), timeout) as permit:
+        metrics.add_timing("queue", time.monotonic() - queued_at)
+        try:
+            yield permit
+        except UpstreamError as e:
+            permit.observe(e.status_code, e.headers)
+            raise
+
+
+def _attempt(payload, timeout):
+    """Send one routed completion request upstream, falling back across providers"""
+    return get_router().call(_send, payload, timeout)
+
+
+async def _aattempt(payload, timeout):
+    return await get_router().acall(_asend, payload, timeout)
+
+
+def _send(target, payload, timeout):
+    """Send one governed completion request to a routing target"""
+    with governed(payload, timeout) as permit, metrics.UPSTREAM_IN_FLIGHT.track_inprogress():
+        response = get_client(target.api_url, target.api_key).post(payload, timeout=timeout)
+        return _observe(permit, response, payload)
+
+
+async def _asend(target, payload, timeout):
+    async with agoverned(payload, timeout) as permit:
+        with metrics.UPSTREAM_IN_FLIGHT.track_inprogress():
+            response = await get_async_client(target.api_url, target.api_key).post(payload, timeout=timeout)
+        return _observe(permit, response, payload)
+
+
+def _observe(permit, response, payload):
+    """Parse an upstream response, reporting it to the governor and the metrics"""
+    metrics.record_upstream(response.timings)
+    response_data = parse_response(response)
+    usage = response_data.get("usage")
+    permit.observe(response.status_code, response.headers, usage)
+    metrics.record_usage(usage, payload.get("model"))
+    accounting.record_call(payload.get("model"), usage, response.timings.get("total", 0.0))
+    return response_data
+
+
+def call_upstream(payload):
+    """Send a completion request upstream with retries, hedging and the circuit breaker"""
+    return get_resilience().call(_attempt, payload)
+
+
+async def acall_upstream(payload):
+    """asyncio variant of call_upstream"""
+    return await get_resilience().acall(_aattempt, payload)
+
+
+def fetch_completion(payload, semantic=False):
+    """Return (response_data, cache_status) for a chat completion request
+
+    With semantic set, a near-duplicate of an earlier prompt is answered
+    from the semantic cache (cache status SEMANTIC) when that is enabled.
+    """
+    cache = get_cache()
+    key = cache_key(payload)
+    started = time.monotonic()
+    response_data = cache.get(key) if cache is not None else None
+    _cache_timing(cache, started, response_data)
+    if response_data is not None:
+        return response_data, "HIT"
+
+    similar = get_semantic_cache() if semantic else None
+    if similar is not None:
+        response_data = _semantic_lookup(similar, payload)
+        if response_data is not None:
+            return response_data, "SEMANTIC"
+
+    def fetch():
+        data = call_upstream(payload)
+        if cache is not None:
+            cache.set(key, data)
+        if similar is not None:
+            similar.set(payload, data)
+        return data
+
+    accounting.check_quota()
+    flight = get_flight()
+    if flight is None:
+        return fetch(), "MISS" if cache is not None else "BYPASS"
+    while True:
+        led = []
+
+        def lead():
+            led.append(True)
+            return fetch()
+        try:
+            response_data = flight.do(key, lead)
+            break
+        except CALLER_ERRORS:
+            if led:
+                raise
+    if not led:
+        _charge_follower(payload, response_data, started)
+    return response_data, "MISS" if cache is not None else "BYPASS"
+
+
+async def afetch_completion(payload, semantic=False):
+    """Non-blocking variant of fetch_completion for the ASGI app"""
+    cache = get_cache()
+    key = cache_key(payload)
+    started = time.monotonic()
+    response_data = await cache_io(cache, cache.get, key) if cache is not None else None
+    _cache_timing(cache, started, response_data)
+    if response_data is not None:
+        return response_data, "HIT"
+
+    similar = get_semantic_cache() if semantic else None
+    if similar is not None:
+        response_data = _semantic_lookup(similar, payload)
+        if response_data is not None:
+            return response_data, "SEMANTIC"
+
+    async def fetch():
+        data = await acall_upstream(payload)
+        if cache is not None:
+            await cache_io(cache, cache.set, key, data)
+        if similar is not None:
+            similar.set(payload, data)
+        return data
+
+    accounting.check_quota()
+    flight = get_async_flight()
+    if flight is None:
+        return await fetch(), "MISS" if cache is not None else "BYPASS"
+    while True:
+        led = []
+
+        async def lead():
+            led.append(True)
+            return await fetch()
+        try:
+            response_data = await flight.do(key, lead)
+            break
+        except CALLER_ERRORS:
+            if led:
+                raise
+    if not led:
+        _charge_follower(payload, response_data, started)
+    return response_data, "MISS" if cache is not None else "BYPASS"
+
+
+def _charge_follower(payload, response_data, started):
+    """Charge a caller that received another caller's upstream response"""
+    accounting.record_call(payload.get("model"), response_data.get("usage"), time.monotonic() - started)
+
+
+def _semantic_lookup(similar, payload):
+    started = time.monotonic()
+    response_data = similar.get(payload)
+    metrics.add_timing("semantic", time.monotonic() - started, "hit" if response_data is not None else "miss")
+    return response_data
+
+
+def _cache_timing(cache, started, response_data):
+    if cache is not None:
+        metrics.add_timing("cache", time.monotonic() - started, "hit" if response_data is not None else "miss")
+
+
+async def cache_io(cache, method, *args):
+    # The in-process cache never blocks; network backends run off the event loop
+    if cache.backend == "memory":
+        return method(*args)
+    return await asyncio.to_thread(method, *args)
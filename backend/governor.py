@@ -0,0 +1,276 @@
+"""Client-side governor for upstream completion calls
+
+Every upstream call takes a permit first. A permit is granted when the
+adaptive concurrency limit has room and the requests/min and tokens/min
+token buckets can cover the call. Callers that cannot be admitted wait in
+a bounded queue and are shed once their deadline passes, so a burst turns
+into a short queue instead of a wall of upstream 429s.
+
+The concurrency limit follows AIMD: it grows by about one slot per
+limit's worth of successful calls and halves whenever the upstream says
+it is overloaded (429 or 503). The buckets are pulled down to the
+x-ratelimit-remaining-* values the upstream reports, and a Retry-After
+pauses all admissions.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+OVERLOAD_STATUSES = (429, 503)
+
+
+class Overloaded(Exception):
+    """Raised when a call is shed instead of being sent upstream"""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuously refilled bucket; not thread-safe, the governor locks it"""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until the bucket holds amount, 0 when it already does"""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def clamp(self, remaining):
+        self.level = min(self.level, float(remaining))
+
+
+def estimate_tokens(payload):
+    """Rough prompt + completion token count used before the call is made"""
+    chars = sum(len(str(message.get("content", ""))) for message in payload.get("messages", []))
+    return chars // 4 + int(payload.get("max_tokens") or 0)
+
+
+def parse_duration(value):
+    """Parse upstream reset values such as '1s', '6m0s' or '20ms' into seconds"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    return sum(float(number) * units[unit] for number, unit in parts) if parts else None
+
+
+class Permit:
+    """One admitted upstream call; report its outcome with observe()"""
+
+    def __init__(self, governor, tokens):
+        self.governor = governor
+        self.tokens = tokens
+        self.status_code = None
+        self.headers = {}
+        self.usage = None
+
+    def observe(self, status_code, headers=None, usage=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.usage = usage
+
+
+class Governor:
+    """Admission control shared by every upstream call in the worker process"""
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=40000, initial_limit=8,
+                 min_limit=1, max_limit=64, max_queue=256, queue_timeout=10.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_limit if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.paused_until = 0.0
+        self.admitted = 0
+        self.shed = 0
+        self.throttled = 0
+        self._cond = threading.Condition()
+
+    def _try_admit(self, tokens, now):
+        """Admit the call and return 0, or return how long to wait (None: until a release)"""
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        waits = [
+            self.paused_until - now,
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens)
+        ]
+        if max(waits) > 0:
+            return max(waits)
+        if self.in_flight >= int(self.limit):
+            return None
+        self.requests.level -= 1
+        self.tokens.level -= min(tokens, self.tokens.capacity)
+        self.in_flight += 1
+        self.admitted += 1
+        return 0
+
+    def _enqueue(self):
+        if self.queued >= self.max_queue:
+            self.shed += 1
+            raise Overloaded("Upstream queue is full", retry_after=self._retry_after(time.monotonic()))
+        self.queued += 1
+
+    def _give_up(self, now):
+        self.shed += 1
+        raise Overloaded("Timed out waiting for upstream capacity", retry_after=self._retry_after(now))
+
+    def _deadline(self, timeout):
+        """Queue deadline: the caller's remaining time, capped by the queue timeout"""
+        wait_limit = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        return time.monotonic() + wait_limit
+
+    def _retry_after(self, now):
+        return max(1.0, self.paused_until - now)
+
+    def acquire(self, tokens, timeout=None):
+        """Block until a permit is granted or the deadline passes"""
+        deadline = self._deadline(timeout)
+        with self._cond:
+            self._enqueue()
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._try_admit(tokens, now)
+                    if wait == 0:
+                        return Permit(self, tokens)
+                    if now >= deadline:
+                        self._give_up(now)
+                    self._cond.wait(min(wait or deadline - now, deadline - now))
+            finally:
+                self.queued -= 1
+
+    async def aacquire(self, tokens, timeout=None, poll_interval=0.01):
+        """asyncio variant of acquire that never blocks the event loop"""
+        deadline = self._deadline(timeout)
+        with self._cond:
+            self._enqueue()
+        try:
+            while True:
+                now = time.monotonic()
+                with self._cond:
+                    wait = self._try_admit(tokens, now)
+                    if wait == 0:
+                        return Permit(self, tokens)
+                    if now >= deadline:
+                        self._give_up(now)
+                await asyncio.sleep(min(wait or poll_interval, deadline - now))
+        finally:
+            with self._cond:
+                self.queued -= 1
+
+    def release(self, permit):
+        """Return the permit's slot and learn from the call's outcome"""
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            if permit.status_code in OVERLOAD_STATUSES:
+                self.throttled += 1
+                self.limit = max(self.min_limit, self.limit / 2)
+                retry_after = parse_duration(permit.headers.get("retry-after")) or 1.0
+                self.paused_until = max(self.paused_until, now + retry_after)
+            elif permit.status_code is not None and permit.status_code < 400:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            if permit.usage and permit.usage.get("total_tokens") is not None:
+                # Settle the estimate against what the call actually used
+                self.tokens.level += min(permit.tokens, self.tokens.capacity) - permit.usage["total_tokens"]
+            self._sync_headers(permit.headers, now)
+            self._cond.notify_all()
+
+    def _sync_headers(self, headers, now):
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            bucket.refill(now)
+            bucket.clamp(remaining)
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if float(remaining) <= 0 and reset:
+                self.paused_until = max(self.paused_until, now + reset)
+
+    @contextmanager
+    def slot(self, tokens, timeout=None):
+        permit = self.acquire(tokens, timeout)
+        try:
+            yield permit
+        finally:
+            self.release(permit)
+
+    @asynccontextmanager
+    async def aslot(self, tokens, timeout=None):
+        permit = await self.aacquire(tokens, timeout)
+        try:
+            yield permit
+        finally:
+            self.release(permit)
+
+    def info(self):
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "max_queue": self.max_queue,
+            "requests_available": int(self.requests.level),
+            "tokens_available": int(self.tokens.level),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 3),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "throttled": self.throttled
+        }
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """Return the process-wide governor, or None when GOVERNOR_ENABLED is off
+
+    Budgets are per worker process; divide the account limits by the
+    number of workers when running several.
+    """
+    global _governor
+    if os.getenv("GOVERNOR_ENABLED", "true").lower() != "true":
+        return None
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = Governor(
+                    requests_per_minute=int(os.getenv("OPENAI_RPM_LIMIT", "500")),
+                    tokens_per_minute=int(os.getenv("OPENAI_TPM_LIMIT", "40000")),
+                    initial_limit=int(os.getenv("GOVERNOR_INITIAL_CONCURRENCY", "8")),
+                    max_limit=int(os.getenv("GOVERNOR_MAX_CONCURRENCY", "64")),
+                    max_queue=int(os.getenv("GOVERNOR_MAX_QUEUE", "256")),
+                    queue_timeout=float(os.getenv("GOVERNOR_QUEUE_TIMEOUT", "10"))
+                )
+    return _governor
+
+
+def reset_governor():
+    global _governor
+    with _governor_lock:
+        _governor = None
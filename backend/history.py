@@ -0,0 +1,375 @@
+"""Execution history of the AI, notification and webhook routes
+
+Every POST to /ai/*, /notification/send or /webhook/* is recorded: the
+route, the caller's key id, a hash of the input, the JSON output, the
+status, the cache status, the upstream tokens it used and its latency.
+Streamed responses are recorded without their output.
+
+Recording costs the request one append to an in-process buffer. A
+background thread turns the buffered requests into records (hashing the
+input, decoding the output) and writes them in batches of
+HISTORY_BATCH_SIZE, or every HISTORY_FLUSH_INTERVAL seconds. When the
+store is unreachable the buffer keeps up to HISTORY_MAX_BUFFER requests,
+then drops the oldest and counts them.
+
+HISTORY_BACKEND=mongodb keeps the history in the MONGODB_URI database.
+There, records expire after HISTORY_RETENTION_DAYS, and compound indexes
+on the caller, route and input hash serve each query as one index range
+scan, newest first. Pages are cursor-based: a page's next_cursor is the
+id of its last record, so reading deep into the history costs the same
+as reading the first page. Reads from MongoDB do not wait for the
+buffer, so a request shows up once its batch is written. The memory
+backend keeps the last HISTORY_MAX_ENTRIES records of a worker and is
+meant for development.
+
+The input hash is the SHA-256 of the body's canonical JSON (sorted keys,
+no whitespace), so the same input sent with different formatting finds
+the same earlier results.
+"""
+import atexit
+import contextvars
+import hashlib
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import validation
+
+try:
+    import pymongo
+    from bson import ObjectId
+except ImportError:
+    pymongo = None
+    ObjectId = None
+
+logger = logging.getLogger(__name__)
+
+RECORDED_PREFIXES = ("/ai/", "/notification/send", "/webhook/")
+FILTERS = ("endpoint", "caller", "input_hash", "status")
+MAX_PAGE = 500
+
+_trace = contextvars.ContextVar("history_trace", default=None)
+
+
+class HistoryQueryError(ValueError):
+    """Raised for a history query with bad filters or cursor"""
+
+
+def recorded(method, path):
+    return method == "POST" and path.startswith(RECORDED_PREFIXES)
+
+
+def start(method, path):
+    """Begin tracing a request when its route is recorded"""
+    trace = {"started": time.monotonic(), "input": None, "tokens": 0} if recorded(method, path) else None
+    _trace.set(trace)
+    return trace
+
+
+def set_input(body):
+    """Keep the raw request body of the request being traced"""
+    trace = _trace.get()
+    if trace is not None:
+        trace["input"] = body
+
+
+def add_tokens(usage):
+    """Add one upstream call's tokens to the request being traced"""
+    trace = _trace.get()
+    if trace is not None and usage:
+        trace["tokens"] += usage.get("total_tokens") or 0
+
+
+def finish(endpoint, path, status, caller, output=None, cache=None):
+    """Hand the traced request to the history store; output is the raw JSON body, None when streamed"""
+    trace = _trace.get()
+    if trace is None:
+        return
+    _trace.set(None)
+    store = get_history()
+    if store is not None:
+        store.append(dict(
+            input=trace["input"],
+            tokens=trace["tokens"],
+            ts=datetime.now(timezone.utc),
+            latency_ms=round((time.monotonic() - trace["started"]) * 1000, 1),
+            endpoint=endpoint,
+            path=path,
+            status=status,
+            caller=caller,
+            output=output,
+            cache=cache
+        ))
+
+
+def input_hash(body):
+    if not body:
+        return None
+    try:
+        canonical = json.dumps(validation.loads(body), sort_keys=True, separators=(",", ":"),
+                               ensure_ascii=False).encode()
+    except ValueError:
+        canonical = body
+    return hashlib.sha256(canonical).hexdigest()
+
+
+class BufferedHistory:
+    """Buffers requests and writes them as records from a background thread"""
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_buffer=50000, max_output_bytes=65536):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_output_bytes = max_output_bytes
+        self.dropped = 0
+        self.written = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        threading.Thread(target=self._run, name="execution-history", daemon=True).start()
+        atexit.register(self.close)
+
+    def append(self, entry):
+        with self._lock:
+            entry["_id"] = self.new_id()
+            self._buffer.append(entry)
+            overflow = len(self._buffer) - self.max_buffer
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self.dropped += overflow
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Execution history flush failed")
+
+    def record(self, entry):
+        """The stored form of a buffered request"""
+        output, body = None, entry.pop("output")
+        if body is not None and len(body) <= self.max_output_bytes:
+            try:
+                output = validation.loads(body)
+            except ValueError:
+                pass
+        body_in = entry.pop("input")
+        return dict(
+            entry,
+            input_hash=input_hash(body_in),
+            input_bytes=len(body_in or b""),
+            output=output,
+            output_bytes=len(body) if body is not None else None
+        )
+
+    def flush(self):
+        """Write every buffered request now"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return
+            # Records put back by a failed write are already converted
+            records = [self.record(entry) if "input" in entry else entry for entry in batch]
+            try:
+                self.write(records)
+                self.written += len(records)
+            except Exception as e:
+                logger.warning("Execution history write of %d records failed: %s", len(records), e)
+                with self._lock:
+                    self._buffer = records + self._buffer
+                    overflow = len(self._buffer) - self.max_buffer
+                    if overflow > 0:
+                        del self._buffer[:overflow]
+                        self.dropped += overflow
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self.flush()
+
+    def info(self):
+        with self._lock:
+            buffered = len(self._buffer)
+        return {"backend": self.backend, "buffered": buffered, "written": self.written, "dropped": self.dropped}
+
+
+class MemoryHistory(BufferedHistory):
+    """The most recent records of a single worker process"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries=10000, **kwargs):
+        self._records = deque(maxlen=max_entries)
+        self._ids = itertools.count(1)
+        super().__init__(**kwargs)
+
+    def new_id(self):
+        return next(self._ids)
+
+    def parse_id(self, text):
+        try:
+            return int(text)
+        except (TypeError, ValueError):
+            raise HistoryQueryError(f"Not an execution id: {text}")
+
+    def write(self, records):
+        self._records.extend(records)
+
+    def query(self, filters, since, until, limit, before=None):
+        self.flush()
+        page = []
+        for record in reversed(self._records):
+            if before is not None and record["_id"] >= before:
+                continue
+            if since <= record["ts"] < until and all(record.get(k) == v for k, v in filters.items()):
+                page.append(record)
+                if len(page) == limit:
+                    break
+        return page
+
+    def get(self, execution_id):
+        self.flush()
+        return next((record for record in self._records if record["_id"] == execution_id), None)
+
+
+class MongoHistory(BufferedHistory):
+    """History stored in the compose-provided MongoDB
+
+    Ids are ObjectIds taken when the request finishes, so ordering by id
+    is ordering by time and a cursor is a single id.
+    """
+
+    backend = "mongodb"
+
+    def __init__(self, uri, retention_days=30, collection="executions", **kwargs):
+        if pymongo is None:
+            raise RuntimeError("The pymongo package is required for HISTORY_BACKEND=mongodb")
+        self._executions = pymongo.MongoClient(
+            uri, serverSelectionTimeoutMS=2000, connectTimeoutMS=2000
+        ).get_default_database("autotasker")[collection]
+        for field in ("caller", "endpoint", "input_hash"):
+            self._executions.create_index([(field, 1), ("_id", -1)])
+        if retention_days:
+            self._executions.create_index("ts", expireAfterSeconds=int(retention_days * 86400))
+        super().__init__(**kwargs)
+
+    def new_id(self):
+        return ObjectId()
+
+    def parse_id(self, text):
+        if not ObjectId.is_valid(text):
+            raise HistoryQueryError(f"Not an execution id: {text}")
+        return ObjectId(text)
+
+    def write(self, records):
+        self._executions.insert_many(records, ordered=False)
+
+    def query(self, filters, since, until, limit, before=None):
+        # The id range bounds the index scan; ts trims the ids' whole-second resolution.
+        # An id is taken just after its ts, so it may fall in the following second.
+        ids = {"$gte": ObjectId.from_datetime(since), "$lt": ObjectId.from_datetime(until + timedelta(seconds=2))}
+        if before is not None:
+            ids["$lt"] = min(ids["$lt"], before)
+        match = dict(filters, _id=ids, ts={"$gte": since, "$lt": until})
+        return list(self._executions.find(match).sort("_id", -1).limit(limit))
+
+    def get(self, execution_id):
+        return self._executions.find_one({"_id": execution_id})
+
+
+def public(record):
+    """A record as returned by the history endpoints"""
+    record = dict(record)
+    record["id"] = str(record.pop("_id"))
+    record["ts"] = record["ts"].replace(tzinfo=timezone.utc).isoformat()
+    return record
+
+
+def query(filters, since=None, until=None, limit=50, cursor=None):
+    """A page of records matching filters between since and until, newest first"""
+    from accounting import parse_time, UsageQueryError
+    store = get_history()
+    if store is None:
+        raise HistoryQueryError("Execution history is disabled")
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise HistoryQueryError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE:
+        raise HistoryQueryError(f"limit must be between 1 and {MAX_PAGE}")
+    filters = {name: value for name, value in filters.items() if name in FILTERS and value not in (None, "")}
+    if "status" in filters:
+        try:
+            filters["status"] = int(filters["status"])
+        except ValueError:
+            raise HistoryQueryError("status must be an integer")
+    try:
+        until = parse_time(until, datetime.now(timezone.utc))
+        since = parse_time(since, datetime.fromtimestamp(0, timezone.utc))
+    except UsageQueryError as e:
+        raise HistoryQueryError(str(e))
+    before = store.parse_id(cursor) if cursor else None
+
+    page = store.query(filters, since, until, limit + 1, before)
+    more = len(page) > limit
+    page = page[:limit]
+    return {
+        "executions": [public(record) for record in page],
+        "next_cursor": str(page[-1]["_id"]) if more else None
+    }
+
+
+def get_execution(execution_id):
+    store = get_history()
+    if store is None:
+        return None
+    record = store.get(store.parse_id(execution_id))
+    return public(record) if record is not None else None
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    """Return the process-wide history store, or None when HISTORY_ENABLED is false"""
+    global _history
+    if _history is None and os.getenv("HISTORY_ENABLED", "true").lower() == "true":
+        with _history_lock:
+            if _history is None:
+                options = dict(
+                    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "500")),
+                    flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL", "1")),
+                    max_buffer=int(os.getenv("HISTORY_MAX_BUFFER", "50000")),
+                    max_output_bytes=int(os.getenv("HISTORY_MAX_OUTPUT_BYTES", "65536"))
+                )
+                if os.getenv("HISTORY_BACKEND", "memory").lower() == "mongodb":
+                    _history = MongoHistory(
+                        os.getenv("MONGODB_URI", "mongodb://localhost:27017/autotasker"),
+                        retention_days=float(os.getenv("HISTORY_RETENTION_DAYS", "30")),
+                        **options
+                    )
+                else:
+                    _history = MemoryHistory(int(os.getenv("HISTORY_MAX_ENTRIES", "10000")), **options)
+    return _history
+
+
+def reset_history():
+    global _history
+    with _history_lock:
+        if _history is not None:
+            _history.close()
+        _history = None
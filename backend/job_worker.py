@@ -0,0 +1,53 @@
+"""Job worker launcher: drains the shared job queue with a pool of processes
+
+Run it next to the API (python job_worker.py) with JOB_BACKEND set to
+redis or mongodb. Each process runs JOB_WORKER_THREADS threads, so the
+number of AI calls in flight is processes x threads and can be scaled
+apart from the request-handling workers. SIGTERM stops claiming new jobs
+and lets running ones finish; a job left unfinished becomes visible again
+after JOB_VISIBILITY_TIMEOUT.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+
+from dotenv import load_dotenv
+
+import jobs
+
+
+def run_process():
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    worker = jobs.JobWorker(jobs.get_queue(), **jobs.worker_settings()).start()
+    stopping.wait()
+    worker.stop()
+
+
+def main():
+    load_dotenv()
+    # Checked from the environment so no connection is opened before forking
+    if os.getenv("JOB_BACKEND", "memory").lower() == "memory":
+        raise SystemExit("JOB_BACKEND=memory keeps jobs inside the API process; set redis or mongodb")
+
+    processes = [multiprocessing.Process(target=run_process, name=f"job-worker-{index}")
+                 for index in range(int(os.getenv("JOB_WORKER_PROCESSES", "2")))]
+    for process in processes:
+        process.start()
+
+    def forward(signum, _frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
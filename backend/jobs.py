@@ -0,0 +1,470 @@
+"""Durable job queue for AI tasks: submit now, poll or get called back later
+
+A submitted job is stored and queued by priority, then picked up by a
+worker (job_worker.py, or threads inside the app for the memory backend).
+A worker holds a job under a visibility timeout; if the worker dies or
+stalls, the job becomes visible again and another worker runs it. Jobs
+that fail with a retryable error are requeued with backoff until
+JOB_MAX_ATTEMPTS is reached. When a job finishes, its record is POSTed to
+the callback_url given at submit time. Callback hosts must resolve to
+public addresses unless listed in JOB_CALLBACK_HOSTS, so a callback cannot
+reach Redis, MongoDB or n8n on the internal network.
+
+JOB_BACKEND selects "memory" (single process, for development), "redis"
+(REDIS_URL) or "mongodb" (MONGODB_URI).
+"""
+import heapq
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import requests
+
+import auth
+import batch
+from governor import Overloaded
+from resilience import backoff_delay, is_retryable
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import pymongo
+    from pymongo import ReturnDocument
+except ImportError:
+    pymongo = None
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+FINISHED = ("succeeded", "failed")
+
+
+class JobError(ValueError):
+    """Raised when a job cannot be submitted"""
+
+
+def callback_allowed(url):
+    """Whether url may receive job callbacks: a JOB_CALLBACK_HOSTS host, or one with only public addresses"""
+    try:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            return False
+        allowed = {host.strip().lower() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()}
+        if parts.hostname.lower() in allowed:
+            return True
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port, proto=socket.IPPROTO_TCP)}
+    except (OSError, UnicodeError, ValueError):
+        return False
+    return bool(addresses) and all(ipaddress.ip_address(address.split("%")[0]).is_global for address in addresses)
+
+
+def new_job(task_name, data, api_key_id=None):
+    """Validate a submit request and return the job record to queue
+
+    Task fields that do not match the task's schema raise ValidationError.
+    The job's upstream calls are charged to api_key_id.
+    """
+    data = dict(data or {})
+    priority = data.pop("priority", "normal")
+    callback_url = data.pop("callback_url", None)
+    if task_name not in batch.TASKS:
+        raise JobError(f"Unknown job task: {task_name}")
+    if priority not in PRIORITIES:
+        raise JobError(f"priority must be one of: {', '.join(PRIORITIES)}")
+    if callback_url is not None and not callback_allowed(str(callback_url)):
+        raise JobError("callback_url must be an http(s) URL on a public host")
+    batch.validate_item(task_name, data)
+
+    return {
+        "id": uuid.uuid4().hex,
+        "task": task_name,
+        "input": data,
+        "priority": priority,
+        "callback_url": callback_url,
+        "api_key_id": api_key_id,
+        "status": "queued",
+        "attempts": 0,
+        "result": None,
+        "error": None,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None
+    }
+
+
+def public_view(job):
+    """The job fields returned to API callers and callbacks"""
+    return {key: job.get(key) for key in (
+        "id", "task", "priority", "status", "attempts", "result", "error",
+        "created_at", "started_at", "finished_at"
+    )}
+
+
+class MemoryJobQueue:
+    """In-process queue; jobs live only as long as the app process"""
+
+    backend = "memory"
+
+    def __init__(self, max_attempts=3, result_ttl=86400):
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._ready = []
+        self._leased = {}
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            heapq.heappush(self._ready, (PRIORITIES[job["priority"]], next(self._order), job["id"]))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def claim(self, visibility_timeout):
+        """Lease the next job for visibility_timeout seconds, or return None"""
+        now = time.time()
+        with self._lock:
+            for job_id, until in list(self._leased.items()):
+                if until <= now:
+                    del self._leased[job_id]
+                    job = self._jobs[job_id]
+                    heapq.heappush(self._ready, (PRIORITIES[job["priority"]], next(self._order), job_id))
+            self._expire(now)
+            if not self._ready:
+                return None
+            _, _, job_id = heapq.heappop(self._ready)
+            self._leased[job_id] = now + visibility_timeout
+            job = self._jobs[job_id]
+            job.update(status="running", started_at=now, attempts=job["attempts"] + 1)
+            return dict(job)
+
+    def retry(self, job, error, delay):
+        """Hide the job for delay seconds, after which it is claimed again"""
+        with self._lock:
+            self._jobs[job["id"]].update(status="queued", error=error)
+            self._leased[job["id"]] = time.time() + delay
+
+    def finish(self, job):
+        with self._lock:
+            self._leased.pop(job["id"], None)
+            self._jobs[job["id"]] = job
+
+    def _expire(self, now):
+        for job_id, job in list(self._jobs.items()):
+            if job["status"] in FINISHED and now - job["finished_at"] > self.result_ttl:
+                del self._jobs[job_id]
+
+    def info(self):
+        with self._lock:
+            return {"backend": self.backend, "queued": len(self._ready), "leased": len(self._leased),
+                    "stored": len(self._jobs)}
+
+
+class RedisJobQueue:
+    """Queue shared by every app and worker process through Redis
+
+    Records are JSON strings; a sorted set of ready job ids is ordered by
+    priority then submit time, and a second sorted set holds leased ids
+    scored by the time their lease runs out.
+    """
+
+    backend = "redis"
+
+    # Requeue expired leases with their original score, then lease the next job
+    CLAIM_SCRIPT = """
+    local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+    for _, id in ipairs(expired) do
+        redis.call('ZREM', KEYS[2], id)
+        redis.call('ZADD', KEYS[1], redis.call('HGET', KEYS[3], id) or 0, id)
+    end
+    local popped = redis.call('ZPOPMIN', KEYS[1])
+    if #popped == 0 then
+        return false
+    end
+    redis.call('ZADD', KEYS[2], ARGV[2], popped[1])
+    return popped[1]
+    """
+
+    def __init__(self, url, max_attempts=3, result_ttl=86400, prefix="autotasker:jobs:"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for JOB_BACKEND=redis")
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=2.0, socket_connect_timeout=2.0)
+        self._claim = self._client.register_script(self.CLAIM_SCRIPT)
+        self._keys = [prefix + "ready", prefix + "leased", prefix + "scores"]
+
+    def _job_key(self, job_id):
+        return f"{self.prefix}job:{job_id}"
+
+    def _save(self, job):
+        self._client.set(self._job_key(job["id"]), json.dumps(job))
+
+    def submit(self, job):
+        # Priority in the high digits, submit time in milliseconds below it
+        score = PRIORITIES[job["priority"]] * 10 ** 13 + int(job["created_at"] * 1000)
+        pipe = self._client.pipeline()
+        pipe.set(self._job_key(job["id"]), json.dumps(job))
+        pipe.hset(self._keys[2], job["id"], score)
+        pipe.zadd(self._keys[0], {job["id"]: score})
+        pipe.execute()
+        return job
+
+    def get(self, job_id):
+        raw = self._client.get(self._job_key(job_id))
+        return json.loads(raw) if raw else None
+
+    def claim(self, visibility_timeout):
+        now = time.time()
+        job_id = self._claim(keys=self._keys, args=[now, now + visibility_timeout])
+        if not job_id:
+            return None
+        job = self.get(job_id.decode())
+        if job is None:
+            self._client.zrem(self._keys[1], job_id)
+            return None
+        job.update(status="running", started_at=now, attempts=job["attempts"] + 1)
+        self._save(job)
+        return job
+
+    def retry(self, job, error, delay):
+        job = dict(job, status="queued", error=error)
+        pipe = self._client.pipeline()
+        pipe.set(self._job_key(job["id"]), json.dumps(job))
+        pipe.zadd(self._keys[1], {job["id"]: time.time() + delay})
+        pipe.execute()
+
+    def finish(self, job):
+        pipe = self._client.pipeline()
+        pipe.set(self._job_key(job["id"]), json.dumps(job), ex=self.result_ttl)
+        pipe.zrem(self._keys[1], job["id"])
+        pipe.hdel(self._keys[2], job["id"])
+        pipe.execute()
+
+    def info(self):
+        return {"backend": self.backend, "queued": self._client.zcard(self._keys[0]),
+                "leased": self._client.zcard(self._keys[1])}
+
+
+class MongoJobQueue:
+    """Queue stored in the compose-provided MongoDB
+
+    Each job is one document; claiming is a single find_one_and_update on
+    queued jobs whose available_at has passed, so visibility timeouts and
+    retry delays are both just a later available_at.
+    """
+
+    backend = "mongodb"
+
+    def __init__(self, uri, max_attempts=3, result_ttl=86400, collection="jobs"):
+        if pymongo is None:
+            raise RuntimeError("The pymongo package is required for JOB_BACKEND=mongodb")
+        self.max_attempts = max_attempts
+        self.result_ttl = result_ttl
+        self._jobs = pymongo.MongoClient(
+            uri, serverSelectionTimeoutMS=2000, connectTimeoutMS=2000
+        ).get_default_database("autotasker")[collection]
+        self._jobs.create_index([("status", 1), ("rank", 1), ("created_at", 1)])
+        self._jobs.create_index("expire_at", expireAfterSeconds=0)
+
+    def submit(self, job):
+        document = dict(job, _id=job["id"], rank=PRIORITIES[job["priority"]], available_at=job["created_at"])
+        self._jobs.insert_one(document)
+        return job
+
+    def get(self, job_id):
+        document = self._jobs.find_one({"_id": job_id})
+        return _from_document(document)
+
+    def claim(self, visibility_timeout):
+        now = time.time()
+        document = self._jobs.find_one_and_update(
+            {"status": {"$in": ["queued", "running"]}, "available_at": {"$lte": now}},
+            {"$set": {"status": "running", "started_at": now, "available_at": now + visibility_timeout},
+             "$inc": {"attempts": 1}},
+            sort=[("rank", 1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        return _from_document(document)
+
+    def retry(self, job, error, delay):
+        self._jobs.update_one({"_id": job["id"]}, {"$set": {
+            "status": "queued", "error": error, "available_at": time.time() + delay
+        }})
+
+    def finish(self, job):
+        fields = {key: value for key, value in job.items() if key != "id"}
+        expire_at = datetime.fromtimestamp(job["finished_at"] + self.result_ttl, timezone.utc)
+        self._jobs.update_one({"_id": job["id"]}, {"$set": dict(fields, expire_at=expire_at)})
+
+    def info(self):
+        now = time.time()
+        return {
+            "backend": self.backend,
+            "queued": self._jobs.count_documents({"status": "queued", "available_at": {"$lte": now}}),
+            "leased": self._jobs.count_documents({"status": "running", "available_at": {"$gt": now}})
+        }
+
+
+def _from_document(document):
+    if document is None:
+        return None
+    job = {key: value for key, value in document.items()
+           if key not in ("_id", "rank", "available_at", "expire_at")}
+    job["id"] = document["_id"]
+    return job
+
+
+def run_job(queue, job, retry_delay=2.0, max_retry_delay=60.0):
+    """Run one claimed job and record its outcome; returns the final record or None if requeued"""
+    if job["attempts"] > queue.max_attempts:
+        return complete(queue, job, error="Job exceeded its attempts without finishing")
+    try:
+        with auth.acting_as(job.get("api_key_id")):
+            result = batch.run_task(job["task"], job["input"])
+    except Exception as e:
+        message = f"{batch.TASKS[job['task']][3]}: {str(e)}"
+        if (is_retryable(e) or isinstance(e, Overloaded)) and job["attempts"] < queue.max_attempts:
+            queue.retry(job, message, backoff_delay(job["attempts"] - 1, e, retry_delay, max_retry_delay))
+            return None
+        return complete(queue, job, error=message)
+    return complete(queue, job, result=result)
+
+
+def complete(queue, job, result=None, error=None):
+    job = dict(job, status="failed" if error else "succeeded", result=result, error=error,
+               finished_at=time.time())
+    queue.finish(job)
+    if job.get("callback_url"):
+        deliver_callback(job)
+    return job
+
+
+def deliver_callback(job, attempts=3, timeout=10.0):
+    """POST the finished job to its callback_url, retrying transient failures"""
+    # Checked again in case the host now resolves somewhere internal
+    if not callback_allowed(job["callback_url"]):
+        return False
+    for attempt in range(attempts):
+        try:
+            response = requests.post(job["callback_url"], json=public_view(job), timeout=timeout,
+                                     allow_redirects=False)
+            if response.status_code < 500:
+                return response.status_code < 400
+        except requests.RequestException:
+            pass
+        if attempt + 1 < attempts:
+            time.sleep(2 ** attempt)
+    return False
+
+
+class JobWorker:
+    """Pool of threads that claim and run jobs until stopped"""
+
+    def __init__(self, queue, threads=8, visibility_timeout=300.0, poll_interval=0.5):
+        self.queue = queue
+        self.threads = threads
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for index in range(self.threads):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(self.visibility_timeout)
+            except Exception:
+                job = None
+                self._stop.wait(self.poll_interval * 4)
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            try:
+                run_job(self.queue, job)
+            except Exception:
+                # The job stays leased and is handed out again after the visibility timeout
+                logger.exception("Job %s could not be completed", job["id"])
+                self._stop.wait(self.poll_interval * 4)
+
+
+_queue = None
+_local_worker = None
+_queue_lock = threading.Lock()
+
+
+def worker_settings():
+    return {
+        "threads": int(os.getenv("JOB_WORKER_THREADS", "8")),
+        "visibility_timeout": float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300")),
+        "poll_interval": float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+    }
+
+
+def get_queue():
+    """Return the process-wide job queue built from the environment"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                backend = os.getenv("JOB_BACKEND", "memory").lower()
+                options = {
+                    "max_attempts": int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+                    "result_ttl": int(os.getenv("JOB_RESULT_TTL", "86400"))
+                }
+                if backend == "redis":
+                    _queue = RedisJobQueue(os.getenv("REDIS_URL", "redis://localhost:6379/0"), **options)
+                elif backend == "mongodb":
+                    _queue = MongoJobQueue(os.getenv("MONGODB_URI", "mongodb://localhost:27017/autotasker"),
+                                           **options)
+                else:
+                    _queue = MemoryJobQueue(**options)
+    return _queue
+
+
+def ensure_local_worker():
+    """Start in-process workers for the memory backend, which no other process can reach"""
+    global _local_worker
+    queue = get_queue()
+    if queue.backend != "memory" or _local_worker is not None:
+        return
+    with _queue_lock:
+        if _local_worker is None:
+            _local_worker = JobWorker(queue, **worker_settings()).start()
+
+
+def reset_queue():
+    global _queue, _local_worker
+    with _queue_lock:
+        if _local_worker is not None:
+            _local_worker.stop()
+        _queue = None
+        _local_worker = None
@@ -0,0 +1,175 @@
+"""Prometheus metrics and Server-Timing headers for the backend
+
+Route metrics are recorded by the Flask hooks in app.py and by the ASGI
+middleware in asgi.py; upstream phases, token usage and error classes
+are recorded by the completion pipeline. Each request also collects its
+phase timings (cache lookup, governor queue, upstream connect/TTFB/total)
+and returns them in a Server-Timing header.
+
+When PROMETHEUS_MULTIPROC_DIR is set, /metrics aggregates every worker
+process; the component gauges (cache, governor, circuit) always describe
+the worker that answers the scrape.
+"""
+import contextvars
+import os
+import time
+
+import requests
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+from accounting import QuotaExceeded
+from completion_client import UpstreamError
+from governor import Overloaded, get_governor
+from resilience import CircuitOpen, DeadlineExceeded, get_resilience
+from response_cache import get_cache
+from singleflight import get_flight
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+REQUESTS = Counter(
+    "autotasker_http_requests_total", "HTTP requests handled", ["route", "method", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "autotasker_http_request_duration_seconds", "Time to produce the response headers", ["route"],
+    buckets=LATENCY_BUCKETS
+)
+IN_FLIGHT = Gauge(
+    "autotasker_http_requests_in_flight", "Requests currently being handled", ["route"],
+    multiprocess_mode="livesum"
+)
+UPSTREAM_LATENCY = Histogram(
+    "autotasker_upstream_duration_seconds", "Upstream completion call latency by phase", ["phase"],
+    buckets=LATENCY_BUCKETS
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "autotasker_upstream_requests_in_flight", "Upstream completion calls in progress",
+    multiprocess_mode="livesum"
+)
+TOKENS = Counter(
+    "autotasker_upstream_tokens_total", "Tokens reported in upstream usage", ["model", "kind"]
+)
+ROUTED = Counter(
+    "autotasker_upstream_routed_total", "Upstream calls by routing target and outcome", ["target", "outcome"]
+)
+ERRORS = Counter(
+    "autotasker_errors_total", "Failed AI requests by error class", ["error_class"]
+)
+
+_timings = contextvars.ContextVar("server_timing", default=None)
+
+
+def error_class(e):
+    """Coarse, low-cardinality class of a failed completion"""
+    if isinstance(e, QuotaExceeded):
+        return "quota_exceeded"
+    if isinstance(e, CircuitOpen):
+        return "circuit_open"
+    if isinstance(e, Overloaded):
+        return "shed"
+    if isinstance(e, DeadlineExceeded):
+        return "deadline"
+    if isinstance(e, UpstreamError):
+        if e.status_code == 429:
+            return "rate_limited"
+        return "upstream_5xx" if e.status_code >= 500 else "upstream_4xx"
+    if isinstance(e, requests.Timeout) or (httpx is not None and isinstance(e, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(e, requests.ConnectionError) or (httpx is not None and isinstance(e, httpx.TransportError)):
+        return "connection"
+    return "internal"
+
+
+def record_error(e):
+    ERRORS.labels(error_class(e)).inc()
+
+
+def record_upstream(timings):
+    """Record one upstream call's connect, TTFB and total latencies"""
+    for phase, seconds in timings.items():
+        UPSTREAM_LATENCY.labels(phase).observe(seconds)
+        add_timing(f"upstream-{phase}", seconds)
+
+
+def record_usage(usage, model=None):
+    if not usage:
+        return
+    for kind in ("prompt", "completion"):
+        if usage.get(f"{kind}_tokens"):
+            TOKENS.labels(model or "unknown", kind).inc(usage[f"{kind}_tokens"])
+
+
+def start_request(route):
+    """Count the request as in flight and begin collecting its Server-Timing entries"""
+    IN_FLIGHT.labels(route).inc()
+    _timings.set([])
+    return time.monotonic()
+
+
+def finish_request(route, method, status_code, started):
+    """Record the finished request and return its Server-Timing header value"""
+    elapsed = time.monotonic() - started
+    IN_FLIGHT.labels(route).dec()
+    REQUESTS.labels(route, method, str(status_code)).inc()
+    REQUEST_LATENCY.labels(route).observe(elapsed)
+    add_timing("app", elapsed)
+    return ", ".join(_timings.get() or [])
+
+
+def add_timing(name, seconds=None, description=None):
+    entries = _timings.get()
+    if entries is None:
+        return
+    entry = name
+    if description is not None:
+        entry += f';desc="{description}"'
+    if seconds is not None:
+        entry += f";dur={seconds * 1000:.1f}"
+    entries.append(entry)
+
+
+class ComponentCollector:
+    """Exposes the cache, single-flight, governor and circuit counters on scrape"""
+
+    def collect(self):
+        values = {}
+        cache = get_cache()
+        if cache is not None:
+            info = cache.info()
+            values.update({"cache_hits": info["hits"], "cache_misses": info["misses"],
+                           "cache_hit_ratio": info["hit_ratio"], "cache_bytes": info.get("bytes")})
+        flight = get_flight()
+        if flight is not None:
+            values["singleflight_followers"] = flight.info()["followers"]
+        governor = get_governor()
+        if governor is not None:
+            info = governor.info()
+            values.update({"governor_limit": info["limit"], "governor_queue_depth": info["queue_depth"],
+                           "governor_in_flight": info["in_flight"], "governor_shed": info["shed"],
+                           "governor_throttled": info["throttled"]})
+        layer = get_resilience()
+        values.update({"upstream_retries": layer.retries, "upstream_hedges": layer.hedges,
+                       "circuit_open": int(layer.breaker.state != "closed")})
+
+        for name, value in values.items():
+            if value is not None:
+                yield GaugeMetricFamily(f"autotasker_{name}", name.replace("_", " "), value=value)
+
+
+REGISTRY.register(ComponentCollector())
+
+
+def exposition():
+    """Return (body, content_type) for the /metrics endpoint"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(ComponentCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
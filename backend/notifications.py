@@ -0,0 +1,430 @@
+"""Background dispatch of notifications with per-channel batching
+
+/notification/send validates and enqueues a notification, then returns.
+Each channel has its own queue and worker threads; a worker waits up to
+NOTIFY_BATCH_WINDOW after the first message for more to arrive, so a burst
+goes out in one SMTP session or one bulk push call. Failed deliveries are
+retried with backoff, and messages that fail for good or run out of
+attempts are kept in a dead-letter store for inspection.
+
+Channels are pluggable: register_channel(name, factory) adds one, and the
+factory is called once with no arguments when the channel is first used.
+Queued messages live in the API process and are flushed on shutdown.
+"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from collections import deque
+from email.message import EmailMessage
+from email.utils import formataddr
+
+import requests
+
+from resilience import backoff_delay
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationError(ValueError):
+    """Raised when a notification request cannot be accepted"""
+
+
+class DeliveryError(Exception):
+    """A failed delivery; permanent failures are dead-lettered without retrying"""
+
+    def __init__(self, message, permanent=False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+class LogChannel:
+    """Writes notifications to the application log; the default when nothing is configured"""
+
+    max_batch = 100
+
+    def send_batch(self, notifications):
+        for notification in notifications:
+            logger.info("Notification %s: %s", notification["subject"], notification["message"])
+        return {}
+
+
+class SmtpChannel:
+    """Delivers a batch of emails over one SMTP session"""
+
+    max_batch = 50
+
+    def __init__(self, host, port=587, username=None, password=None, from_address=None, from_name=None,
+                 use_tls=True, use_ssl=False, default_to=(), timeout=30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = formataddr((from_name or "", from_address or username or "autotasker@localhost"))
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.default_to = list(default_to)
+        self.timeout = timeout
+
+    def _connect(self):
+        if self.use_ssl:
+            session = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.use_tls:
+                session.starttls()
+        if self.username:
+            session.login(self.username, self.password)
+        return session
+
+    def _message(self, notification):
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = ", ".join(notification["to"] or self.default_to)
+        message["Subject"] = notification["subject"]
+        message.set_content(notification["message"])
+        return message
+
+    def send_batch(self, notifications):
+        """Send each message, returning {id: DeliveryError} for those that failed"""
+        failures = {}
+        try:
+            session = self._connect()
+        except (smtplib.SMTPException, OSError) as e:
+            raise DeliveryError(f"SMTP connection failed: {e}")
+
+        try:
+            for position, notification in enumerate(notifications):
+                if not (notification["to"] or self.default_to):
+                    failures[notification["id"]] = DeliveryError("No email recipients", permanent=True)
+                    continue
+                try:
+                    message = self._message(notification)
+                except (ValueError, TypeError) as e:
+                    # A malformed header can never be sent
+                    failures[notification["id"]] = DeliveryError(f"Invalid email: {e}", permanent=True)
+                    continue
+                try:
+                    session.send_message(message)
+                except smtplib.SMTPRecipientsRefused as e:
+                    failures[notification["id"]] = DeliveryError(f"Recipients refused: {e}", permanent=True)
+                except smtplib.SMTPResponseException as e:
+                    failures[notification["id"]] = DeliveryError(
+                        f"SMTP error {e.smtp_code}: {e.smtp_error!r}", permanent=500 <= e.smtp_code < 600
+                    )
+                except (smtplib.SMTPServerDisconnected, OSError) as e:
+                    # The session is gone; everything not yet sent is retried
+                    for pending in notifications[position:]:
+                        failures[pending["id"]] = DeliveryError(f"SMTP session lost: {e}")
+                    return failures
+        finally:
+            try:
+                session.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        return failures
+
+
+class WebhookPushChannel:
+    """Delivers a batch of push notifications in one bulk POST to a push gateway"""
+
+    max_batch = 500
+
+    def __init__(self, url, token=None, timeout=10.0):
+        self.url = url
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def send_batch(self, notifications):
+        body = {"notifications": [
+            {"id": n["id"], "to": n["to"], "title": n["subject"], "body": n["message"], "data": n["data"]}
+            for n in notifications
+        ]}
+        try:
+            response = self._session.post(self.url, json=body, headers=self.headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise DeliveryError(f"Push gateway unreachable: {e}")
+        if response.status_code >= 400:
+            permanent = response.status_code < 500 and response.status_code != 429
+            raise DeliveryError(f"Push gateway returned {response.status_code}", permanent=permanent)
+        return {}
+
+
+def _env_list(name):
+    return [value.strip() for value in os.getenv(name, "").split(",") if value.strip()]
+
+
+CHANNELS = {
+    "log": LogChannel,
+    "email": lambda: SmtpChannel(
+        host=os.getenv("SMTP_HOST", "localhost"),
+        port=int(os.getenv("SMTP_PORT", "587")),
+        username=os.getenv("SMTP_USERNAME") or None,
+        password=os.getenv("SMTP_PASSWORD") or None,
+        from_address=os.getenv("SMTP_FROM_ADDRESS") or None,
+        from_name=os.getenv("SMTP_FROM_NAME") or None,
+        use_tls=os.getenv("SMTP_USE_TLS", "true").lower() == "true",
+        use_ssl=os.getenv("SMTP_USE_SSL", "false").lower() == "true",
+        default_to=_env_list("NOTIFY_EMAIL_TO")
+    ),
+    "push": lambda: WebhookPushChannel(os.getenv("PUSH_GATEWAY_URL", ""), os.getenv("PUSH_GATEWAY_TOKEN"))
+}
+
+
+def register_channel(name, factory):
+    """Add or replace a delivery channel; factory builds an object with send_batch()"""
+    CHANNELS[name] = factory
+
+
+class MemoryDeadLetters:
+    """Most recent undeliverable notifications, kept in the API process"""
+
+    backend = "memory"
+
+    def __init__(self, max_items=1000):
+        self._items = deque(maxlen=max_items)
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self._items.appendleft(record)
+
+    def list(self, limit=100):
+        with self._lock:
+            return list(itertools.islice(self._items, limit))
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RedisDeadLetters:
+    """Dead letters shared by every worker, as a capped Redis list"""
+
+    backend = "redis"
+
+    def __init__(self, url, max_items=1000, key="autotasker:notifications:dead"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for NOTIFY_DEAD_LETTER_BACKEND=redis")
+        self.max_items = max_items
+        self.key = key
+        self._client = redis.Redis.from_url(url, socket_timeout=2.0, socket_connect_timeout=2.0)
+
+    def add(self, record):
+        pipe = self._client.pipeline()
+        pipe.lpush(self.key, json.dumps(record))
+        pipe.ltrim(self.key, 0, self.max_items - 1)
+        pipe.execute()
+
+    def list(self, limit=100):
+        return [json.loads(raw) for raw in self._client.lrange(self.key, 0, limit - 1)]
+
+    def __len__(self):
+        return self._client.llen(self.key)
+
+
+def new_notification(data, default_channel="log"):
+    """Validate a send request and return the notification record to queue"""
+    if not data or "subject" not in data or "message" not in data:
+        raise NotificationError("Missing required fields: subject and message")
+    channel = data.get("channel", default_channel)
+    if channel not in CHANNELS:
+        raise NotificationError(f"Unknown notification channel: {channel}")
+    to = data.get("to") or []
+    return {
+        "id": uuid.uuid4().hex,
+        "channel": channel,
+        "to": [to] if isinstance(to, str) else list(to),
+        "subject": str(data["subject"]),
+        "message": str(data["message"]),
+        "data": data.get("data") or {},
+        "attempts": 0,
+        "created_at": time.time()
+    }
+
+
+class Dispatcher:
+    """Per-channel queues drained in batches by background worker threads"""
+
+    def __init__(self, workers_per_channel=2, batch_window=0.05, max_attempts=5,
+                 retry_delay=1.0, max_retry_delay=300.0, dead_letters=None):
+        self.workers_per_channel = workers_per_channel
+        self.batch_window = batch_window
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.dead_letters = dead_letters if dead_letters is not None else MemoryDeadLetters()
+        self.counts = {"accepted": 0, "sent": 0, "batches": 0, "retried": 0, "dead_lettered": 0}
+        self._channels = {}
+        self._queues = {}
+        self._retries = set()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def _queue(self, channel_name):
+        """The channel's queue, starting its adapter and workers on first use"""
+        if channel_name not in self._queues:
+            with self._lock:
+                if channel_name not in self._queues:
+                    self._channels[channel_name] = CHANNELS[channel_name]()
+                    self._queues[channel_name] = queue.Queue()
+                    for index in range(self.workers_per_channel):
+                        threading.Thread(target=self._work, args=(channel_name,),
+                                         name=f"notify-{channel_name}-{index}", daemon=True).start()
+        return self._queues[channel_name]
+
+    def submit(self, notification):
+        self._queue(notification["channel"]).put(notification)
+        self._count("accepted")
+        return notification
+
+    def _next_batch(self, channel_name):
+        """Block for one message, then gather more until the window closes or the batch is full"""
+        pending = self._queues[channel_name]
+        try:
+            batch = [pending.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        limit = getattr(self._channels[channel_name], "max_batch", 1)
+        closes_at = time.monotonic() + self.batch_window
+        while len(batch) < limit:
+            wait = closes_at - time.monotonic()
+            try:
+                batch.append(pending.get(timeout=wait) if wait > 0 else pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self, channel_name):
+        pending = self._queues[channel_name]
+        while not (self._stopping.is_set() and pending.empty()):
+            batch = self._next_batch(channel_name)
+            if not batch:
+                continue
+            try:
+                self.deliver(channel_name, batch)
+            except Exception:
+                logger.exception("Delivering a %s batch failed", channel_name)
+            finally:
+                for _ in batch:
+                    pending.task_done()
+
+    def deliver(self, channel_name, batch):
+        """Send one batch through its channel and route failures to retry or dead letters"""
+        for notification in batch:
+            notification["attempts"] += 1
+        try:
+            failures = self._channels[channel_name].send_batch(batch)
+        except DeliveryError as e:
+            failures = {notification["id"]: e for notification in batch}
+        except Exception as e:
+            logger.exception("Notification channel %s crashed", channel_name)
+            failures = {notification["id"]: DeliveryError(str(e)) for notification in batch}
+
+        self._count("batches")
+        self._count("sent", len(batch) - len(failures))
+        for notification in batch:
+            error = failures.get(notification["id"])
+            if error is None:
+                continue
+            if error.permanent or notification["attempts"] >= self.max_attempts:
+                self._dead_letter(notification, error)
+            else:
+                self._retry_later(notification, error)
+
+    def _retry_later(self, notification, error):
+        delay = backoff_delay(notification["attempts"] - 1, error, self.retry_delay, self.max_retry_delay)
+        notification["last_error"] = str(error)
+        self._count("retried")
+
+        def requeue():
+            self._retries.discard(timer)
+            self._queues[notification["channel"]].put(notification)
+
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        self._retries.add(timer)
+        timer.start()
+
+    def _dead_letter(self, notification, error):
+        self._count("dead_lettered")
+        try:
+            self.dead_letters.add(dict(notification, error=str(error), failed_at=time.time()))
+        except Exception:
+            logger.exception("Dead-lettering notification %s failed", notification["id"])
+        logger.warning("Notification %s dead-lettered: %s", notification["id"], error)
+
+    def flush(self, timeout=None):
+        """Wait until every queued message has been delivered or dead-lettered"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                busy = [q for q in self._queues.values() if q.unfinished_tasks] or self._retries
+            if not busy:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def stop(self, timeout=5.0):
+        self.flush(timeout)
+        self._stopping.set()
+
+    def info(self):
+        with self._lock:
+            return dict(self.counts, queued={name: q.qsize() for name, q in self._queues.items()},
+                        retrying=len(self._retries), dead_letters=len(self.dead_letters))
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """Return the process-wide dispatcher built from the environment"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                max_items = int(os.getenv("NOTIFY_DEAD_LETTER_MAX", "1000"))
+                if os.getenv("NOTIFY_DEAD_LETTER_BACKEND", "memory").lower() == "redis":
+                    dead_letters = RedisDeadLetters(os.getenv("REDIS_URL", "redis://localhost:6379/0"), max_items)
+                else:
+                    dead_letters = MemoryDeadLetters(max_items)
+                _dispatcher = Dispatcher(
+                    workers_per_channel=int(os.getenv("NOTIFY_WORKERS", "2")),
+                    batch_window=float(os.getenv("NOTIFY_BATCH_WINDOW", "0.05")),
+                    max_attempts=int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5")),
+                    retry_delay=float(os.getenv("NOTIFY_RETRY_DELAY", "1")),
+                    max_retry_delay=float(os.getenv("NOTIFY_RETRY_MAX_DELAY", "300")),
+                    dead_letters=dead_letters
+                )
+                atexit.register(_dispatcher.stop)
+    return _dispatcher
+
+
+def default_channel():
+    return os.getenv("NOTIFY_DEFAULT_CHANNEL", "log")
+
+
+def reset_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is not None:
+            _dispatcher.stop(timeout=1.0)
+        _dispatcher = None
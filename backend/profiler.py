@@ -0,0 +1,351 @@
+"""Sampling profiler for the backend's request threads
+
+While running, a background thread wakes every PROFILER_INTERVAL seconds
+and records the Python stack of each thread that is serving a request,
+under that request's route, plus the ASGI event loop thread. Nothing is
+added to the requests themselves beyond marking which thread serves which
+route, so it can stay on in production: at the default 10 ms interval a
+sample costs a few microseconds per busy thread. Stacks are kept as
+counts per distinct (route, stack), up to PROFILER_MAX_STACKS of them.
+
+How late the sampler wakes is recorded too. It needs the GIL to run, so
+its lag is a direct measure of how long threads wait for the GIL.
+
+The admin endpoints start and stop it at runtime (PROFILER_ENABLED=true
+starts it with each worker) and export the stacks in the collapsed
+format read by flamegraph.pl and speedscope, or as a flame graph SVG.
+Each worker process profiles itself, so with several workers a call
+reaches one of them.
+
+Only admin keys may use it. With authentication off, only callers on
+loopback may, unless PROFILER_OPEN=true opens it to everyone.
+
+A request sent with an "X-Profile: 1" header by such a caller is traced
+on its own: its thread is sampled every PROFILER_TRACE_INTERVAL seconds
+while it runs, and the response's Server-Timing header gets the time
+spent in each of JSON handling, prompt building, cache lookups, governor
+queueing, the upstream call and everything else. On the natively served ASGI routes the event loop is
+shared, so the breakdown includes whatever else it ran meanwhile.
+"""
+import html
+import ipaddress
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, deque
+
+import auth
+
+PROFILE_HEADER = "X-Profile"
+EVENT_LOOP = "asgi event loop"
+OVERFLOW = "[other stacks]"
+
+# Innermost match wins, so JSON encoding inside the HTTP client counts as JSON
+CATEGORIES = (
+    ("json", ("/json/", "validation.py:loads", "validation.py:dumps")),
+    ("prompt", ("prompts.py:", "chunking.py:")),
+    ("cache", ("response_cache.py:", "semantic_cache.py:", "singleflight.py:")),
+    ("queue", ("governor.py:",)),
+    ("upstream", ("completion_client.py:", "/requests/", "/urllib3/", "/httpx/", "/httpcore/", "/ssl.py:",
+                  "/socket.py:", "replay.py:"))
+)
+
+_labels = {}
+
+
+def _label(code):
+    """'file.py:function' for a code object, cached per code object"""
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    return label
+
+
+def collapse(frame, max_depth):
+    """Semicolon-joined stack of frame, outermost first"""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def category(frame):
+    while frame is not None:
+        code = frame.f_code
+        where = f"{code.co_filename}:{code.co_name}"
+        for name, markers in CATEGORIES:
+            if any(marker in where for marker in markers):
+                return name
+        frame = frame.f_back
+    return "app"
+
+
+class Profiler:
+    """Samples the stacks of the threads serving requests, per route"""
+
+    def __init__(self, interval=0.01, max_stacks=20000, max_depth=64):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self._threads = {}
+        self._stacks = Counter()
+        self._lags = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.samples = 0
+        self.started_at = None
+        self.stops_at = None
+
+    # Threads serving requests
+
+    def begin(self, route):
+        self._threads[threading.get_ident()] = route
+
+    def end(self):
+        self._threads.pop(threading.get_ident(), None)
+
+    # Sampling
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None, duration=None):
+        """Start sampling, for duration seconds when given"""
+        with self._lock:
+            if interval:
+                self.interval = interval
+            self.stops_at = time.time() + duration if duration else None
+            if not self.running:
+                self._stop = threading.Event()
+                self.started_at = time.time()
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(1.0)
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._lags.clear()
+            self.samples = 0
+
+    def _run(self):
+        me = threading.get_ident()
+        expected = time.perf_counter() + self.interval
+        while not self._stop.wait(max(0.0, expected - time.perf_counter())):
+            now = time.perf_counter()
+            self._lags.append(now - expected)
+            expected = max(expected + self.interval, now)
+            if self.stops_at is not None and time.time() >= self.stops_at:
+                break
+            self.sample(exclude=me)
+
+    def sample(self, exclude=None):
+        frames = sys._current_frames()
+        with self._lock:
+            for thread_id, route in list(self._threads.items()):
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == exclude:
+                    continue
+                key = (route, collapse(frame, self.max_depth))
+                if key not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    key = (route, OVERFLOW)
+                self._stacks[key] += 1
+            self.samples += 1
+
+    # Export
+
+    def stacks(self, route=None):
+        """{collapsed stack: count}, each stack rooted at its route"""
+        with self._lock:
+            items = list(self._stacks.items())
+        collapsed = Counter()
+        for (stack_route, stack), count in items:
+            if route is None or stack_route == route:
+                collapsed[f"{stack_route};{stack}"] += count
+        return collapsed
+
+    def collapsed(self, route=None):
+        """The stacks in the collapsed format of flamegraph.pl and speedscope"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks(route).items()))
+
+    def info(self):
+        with self._lock:
+            stacks = dict(self._stacks)
+            lags = sorted(self._lags)
+        routes = Counter()
+        for (route, _), count in stacks.items():
+            routes[route] += count
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "started_at": self.started_at,
+            "stops_at": self.stops_at,
+            "samples": self.samples,
+            "stacks": len(stacks),
+            "routes": dict(routes.most_common()),
+            # The sampler waits for the GIL like any thread; its lag is the GIL wait
+            "sampler_lag_ms": {
+                "p50": round(lags[len(lags) // 2] * 1000, 2) if lags else None,
+                "p99": round(lags[int(len(lags) * 0.99)] * 1000, 2) if lags else None
+            }
+        }
+
+
+def flamegraph(stacks, title="AutoTasker backend", width=1200, row=16):
+    """Render {collapsed stack: count} as a flame graph SVG"""
+    root = {"count": 0, "children": {}}
+    for stack, count in stacks.items():
+        node = root
+        node["count"] += count
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"count": 0, "children": {}})
+            node["count"] += count
+
+    total = root["count"] or 1
+    boxes = []
+
+    def place(node, name, x, depth):
+        boxes.append((name, x, depth, node["count"]))
+        for child_name, child in sorted(node["children"].items()):
+            place(child, child_name, x, depth + 1)
+            x += child["count"]
+
+    place(root, "all", 0, 0)
+    depth = max(box[2] for box in boxes) + 1
+    height = (depth + 2) * row
+    scale = width / total
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" '
+        f'font-size="11">',
+        f'<text x="4" y="{row - 4}">{html.escape(title)} ({total} samples)</text>'
+    ]
+    for name, x, level, count in boxes:
+        box_width = count * scale
+        if box_width < 0.5:
+            continue
+        y = height - (level + 1) * row
+        hue = zlib.crc32(name.encode()) % 50
+        label = html.escape(name)
+        text = html.escape(name[:int(box_width / 7)]) if box_width > 21 else ""
+        parts.append(
+            f'<g><title>{label} ({count} samples, {count * 100 / total:.1f}%)</title>'
+            f'<rect x="{x * scale:.1f}" y="{y}" width="{box_width:.1f}" height="{row - 1}" '
+            f'fill="hsl({hue}, 85%, 60%)"/><text x="{x * scale + 2:.1f}" y="{y + row - 4}">{text}</text></g>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+class RequestTrace:
+    """Samples one thread while it serves one traced request"""
+
+    active = 0
+    _active_lock = threading.Lock()
+
+    def __init__(self, interval=0.001, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.categories = Counter()
+        self.started = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-trace", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.categories[category(frame)] += 1
+
+    def finish(self):
+        """[(category, seconds)] of the traced request, largest first"""
+        self._stop.set()
+        self._thread.join(1.0)
+        elapsed = time.perf_counter() - self.started
+        samples = sum(self.categories.values())
+        if not samples:
+            return []
+        return [(name, elapsed * count / samples) for name, count in self.categories.most_common()]
+
+
+def allowed(key_id, remote_addr):
+    """Whether a caller may control the profiler and trace requests"""
+    if auth.enabled():
+        return auth.is_admin(key_id)
+    if os.getenv("PROFILER_OPEN", "false").lower() == "true":
+        return True
+    try:
+        return remote_addr is not None and ipaddress.ip_address(remote_addr).is_loopback
+    except ValueError:
+        return False
+
+
+def wants_trace(headers, remote_addr):
+    """Whether a request asked to be traced, and may be"""
+    if headers.get(PROFILE_HEADER, "").lower() not in ("1", "true"):
+        return False
+    try:
+        key_id = auth.authenticate(headers) if auth.enabled() else None
+    except auth.AuthError:
+        return False
+    return allowed(key_id, remote_addr)
+
+
+def start_trace(headers, remote_addr):
+    """A RequestTrace for the current thread when the request asked for one, else None"""
+    if not wants_trace(headers, remote_addr):
+        return None
+    with RequestTrace._active_lock:
+        if RequestTrace.active >= int(os.getenv("PROFILER_MAX_TRACES", "4")):
+            return None
+        RequestTrace.active += 1
+    return RequestTrace(float(os.getenv("PROFILER_TRACE_INTERVAL", "0.001")))
+
+
+def finish_trace(trace):
+    """Add the traced request's time per category to its Server-Timing header"""
+    import metrics
+    try:
+        for name, seconds in trace.finish():
+            metrics.add_timing(f"prof-{name}", seconds)
+    finally:
+        with RequestTrace._active_lock:
+            RequestTrace.active -= 1
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """Return the process-wide profiler, started when PROFILER_ENABLED is true"""
+    global _profiler
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = Profiler(
+                    interval=float(os.getenv("PROFILER_INTERVAL", "0.01")),
+                    max_stacks=int(os.getenv("PROFILER_MAX_STACKS", "20000")),
+                    max_depth=int(os.getenv("PROFILER_MAX_DEPTH", "64"))
+                )
+                if os.getenv("PROFILER_ENABLED", "false").lower() == "true":
+                    _profiler.start()
+    return _profiler
+
+
+def reset_profiler():
+    global _profiler
+    with _profiler_lock:
+        if _profiler is not None:
+            _profiler.stop()
+        _profiler = None
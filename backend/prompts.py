@@ -0,0 +1,129 @@
+"""Chat completion payloads for each AI endpoint, shared by the WSGI and ASGI apps
+
+Each payload names the task it was built for; the model router matches
+routes on it and strips it, and replaces DEFAULT_MODEL with the model of
+the provider it picks.
+"""
+
+DEFAULT_MODEL = "gpt-4"
+
+
+def summary_payload(data):
+    """Build the completion request for /ai/summary"""
+    return {
+        "task": "summary",
+        "model": DEFAULT_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that summarizes text."
+            },
+            {
+                "role": "user",
+                "content": f"Summarize the following text concisely: {data['text']}"
+            }
+        ],
+        "max_tokens": 150
+    }
+
+
+def chunk_summary_payload(text):
+    """Build the map-stage request summarizing one part of a long document"""
+    return {
+        "task": "summary_chunk",
+        "model": DEFAULT_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that summarizes parts of long documents."
+            },
+            {
+                "role": "user",
+                "content": f"Summarize this part of a longer document, keeping names, dates, figures and decisions: {text}"
+            }
+        ],
+        "max_tokens": 200
+    }
+
+
+def reduce_summary_payload(summaries):
+    """Build the reduce-stage request combining the part summaries of a long document"""
+    parts = "\n\n".join(f"Part {index}: {summary}" for index, summary in enumerate(summaries, 1))
+    return {
+        "task": "summary_reduce",
+        "model": DEFAULT_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a helpful assistant that summarizes text."
+            },
+            {
+                "role": "user",
+                "content": f"These are summaries of consecutive parts of one document. Combine them into one concise summary of the whole document:\n\n{parts}"
+            }
+        ],
+        "max_tokens": 150
+    }
+
+
+def social_payload(data):
+    """Build the completion request for /ai/post_social"""
+    platform = data["platform"]  # e.g., "twitter", "linkedin", "instagram"
+    return {
+        "task": "post_social",
+        "model": DEFAULT_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": f"You are a social media expert who creates engaging posts for {platform}."
+            },
+            {
+                "role": "user",
+                "content": f"Create a {platform} post based on this content: {data['content']}"
+            }
+        ],
+        "max_tokens": 150
+    }
+
+
+def resume_payload(data):
+    """Build the completion request for /ai/screen_resume"""
+    return {
+        "task": "screen_resume",
+        "model": DEFAULT_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an HR assistant who screens resumes for job positions."
+            },
+            {
+                "role": "user",
+                "content": f"Evaluate this resume for the following job description. Provide a match percentage and brief explanation.\n\nJob Description: {data['job_description']}\n\nResume: {data['resume']}"
+            }
+        ],
+        "max_tokens": 300
+    }
+
+
+def resume_match_payload(job_description, resume):
+    """Build the request scoring one resume against a job description as JSON"""
+    return {
+        "task": "resume_match",
+        "model": DEFAULT_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an HR assistant who screens resumes for job positions. Reply with a JSON object only."
+            },
+            {
+                "role": "user",
+                "content": f"Evaluate this resume for the following job description. Reply with a JSON object with the keys match_percentage (integer 0-100), summary (one or two sentences), strengths (list of strings) and gaps (list of strings).\n\nJob Description: {job_description}\n\nResume: {resume}"
+            }
+        ],
+        "max_tokens": 300
+    }
+
+
+def message_content(response_data):
+    """Extract the assistant's reply from a chat completion response"""
+    return response_data["choices"][0]["message"]["content"].strip()
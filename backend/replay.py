@@ -0,0 +1,427 @@
+"""Record and replay of upstream completion calls
+
+UPSTREAM_MODE=record sends completions upstream as usual and saves each
+successful request/response pair to UPSTREAM_RECORDING; UPSTREAM_MODE=
+replay answers from that file without an API key or network access, so
+benchmarks and the e2e suite run offline and give the same answers every
+time. Streaming calls are recorded as the completion they add up to and
+replayed as a stream.
+
+Requests are matched by a hash of the payload sent upstream (model,
+messages and settings; the stream flags are ignored). A request recorded
+several times (up to UPSTREAM_RECORD_VARIANTS) is replayed by cycling
+through its recordings in order. A request that was never recorded fails
+with a 404 from the upstream.
+
+UPSTREAM_REPLAY_LATENCY scales the recorded latencies: 0 answers at once,
+1 waits as long as the original call took to its first byte and to the
+end, 0.5 half as long.
+
+The recording is two files. <path> is an append-only log of records,
+each a fixed header (hash, status, first byte and total seconds, body
+length) followed by the zlib-compressed response body. <path>.idx holds
+the (hash, offset) pairs sorted by hash, written when the recorder closes
+and rebuilt by scanning the log when it is missing or stale. Both are
+memory-mapped for replay, so a lookup is a binary search over the index
+and pages are read from disk only when touched.
+
+Every worker of the multi-worker server records into the same log: each
+record is appended under an exclusive file lock, and each process writes
+the index through its own temporary file. Variants are counted per
+worker, so several workers may each add up to UPSTREAM_RECORD_VARIANTS.
+"""
+import asyncio
+import atexit
+import hashlib
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAGIC = b"ATRC\x01\x00"
+INDEX_MAGIC = b"ATRI\x01\x00"
+RECORD = struct.Struct("<16sHffI")
+INDEX_HEADER = struct.Struct("<QQ")
+INDEX_ENTRY = struct.Struct("<16sQ")
+MODES = ("live", "record", "replay")
+IGNORED_FIELDS = ("stream", "stream_options")
+
+
+class RecordingError(ValueError):
+    """Raised for a recording file that cannot be read"""
+
+
+def request_hash(payload):
+    """16-byte digest of a completion payload, without its stream flags"""
+    canonical = json.dumps({key: value for key, value in payload.items() if key not in IGNORED_FIELDS},
+                           sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+
+class Recording:
+    """An indexed file of recorded completions"""
+
+    def __init__(self, path, max_variants=1):
+        self.path = path
+        self.max_variants = max_variants
+        self._lock = threading.Lock()
+        self._cursors = {}
+        self._pending = {}
+        self._writer = None
+        self._data = None
+        self._index = None
+        self._count = 0
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._load()
+
+    # Reading
+
+    def _load(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= len(MAGIC):
+            return
+        with open(self.path, "rb") as data_file:
+            self._data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._data[:len(MAGIC)] != MAGIC:
+            raise RecordingError(f"{self.path} is not a completion recording")
+
+        index_path = self.path + ".idx"
+        if not self._index_is_current(index_path):
+            self._write_index(index_path, self._scan())
+        with open(index_path, "rb") as index_file:
+            self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        _, self._count = INDEX_HEADER.unpack_from(self._index, len(INDEX_MAGIC))
+
+    def _index_is_current(self, index_path):
+        if not os.path.exists(index_path):
+            return False
+        with open(index_path, "rb") as index_file:
+            header = index_file.read(len(INDEX_MAGIC) + INDEX_HEADER.size)
+        if len(header) < len(INDEX_MAGIC) + INDEX_HEADER.size or header[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            return False
+        covered, _ = INDEX_HEADER.unpack_from(header, len(INDEX_MAGIC))
+        return covered == len(self._data)
+
+    def _scan(self):
+        """(hash, offset) of every complete record in the log"""
+        entries = []
+        offset = len(MAGIC)
+        size = len(self._data)
+        while offset + RECORD.size <= size:
+            digest, _, _, _, length = RECORD.unpack_from(self._data, offset)
+            if offset + RECORD.size + length > size:
+                break
+            entries.append((digest, offset))
+            offset += RECORD.size + length
+        return entries
+
+    def _write_index(self, index_path, entries):
+        entries = sorted(entries)
+        temporary = f"{index_path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as index_file:
+            index_file.write(INDEX_MAGIC + INDEX_HEADER.pack(len(self._data), len(entries)))
+            for digest, offset in entries:
+                index_file.write(INDEX_ENTRY.pack(digest, offset))
+        os.replace(temporary, index_path)
+
+    def _entry(self, position):
+        return INDEX_ENTRY.unpack_from(self._index, len(INDEX_MAGIC) + INDEX_HEADER.size + position * INDEX_ENTRY.size)
+
+    def _offsets(self, digest):
+        """Offsets of every recording of digest, in the order they were recorded"""
+        if self._index is None:
+            return []
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < digest:
+                low = middle + 1
+            else:
+                high = middle
+        offsets = []
+        while low < self._count:
+            entry_digest, offset = self._entry(low)
+            if entry_digest != digest:
+                break
+            offsets.append(offset)
+            low += 1
+        return offsets
+
+    def _read(self, offset):
+        _, status, ttfb, total, length = RECORD.unpack_from(self._data, offset)
+        start = offset + RECORD.size
+        return status, ttfb, total, zlib.decompress(self._data[start:start + length])
+
+    def lookup(self, payload):
+        """(status, ttfb, total, body) of the next recording of payload, None when it has none"""
+        digest = request_hash(payload)
+        offsets = self._offsets(digest)
+        with self._lock:
+            if not offsets:
+                self.misses += 1
+                return None
+            cursor = self._cursors.setdefault(digest, itertools.count())
+            position = next(cursor) % len(offsets)
+            self.hits += 1
+        return self._read(offsets[position])
+
+    # Writing
+
+    def record(self, payload, status, ttfb, total, body):
+        """Append one response unless payload already has max_variants recordings"""
+        digest = request_hash(payload)
+        with self._lock:
+            known = len(self._offsets(digest)) + self._pending.get(digest, 0)
+            if self.max_variants and known >= self.max_variants:
+                return False
+            if self._writer is None:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                self._writer = open(self.path, "ab")
+            compressed = zlib.compress(body, 6)
+            record = RECORD.pack(digest, status, ttfb, total, len(compressed)) + compressed
+            # Other workers append to the same log; the lock keeps the header and records whole
+            if fcntl is not None:
+                fcntl.flock(self._writer, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._writer.fileno()).st_size == 0:
+                    record = MAGIC + record
+                self._writer.write(record)
+                # Flushed per record so a crash loses at most the index, which is rebuilt from the log
+                self._writer.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._writer, fcntl.LOCK_UN)
+            self._pending[digest] = self._pending.get(digest, 0) + 1
+            self.recorded += 1
+        return True
+
+    def close(self):
+        """Stop writing and bring the index up to date"""
+        with self._lock:
+            if self._writer is None:
+                return
+            self._writer.close()
+            self._writer = None
+            self._pending = {}
+            for view in (self._data, self._index):
+                if view is not None:
+                    view.close()
+            self._data = self._index = None
+            self._load()
+
+    def info(self):
+        return {"path": self.path, "requests": self._count, "recorded": self.recorded,
+                "hits": self.hits, "misses": self.misses}
+
+
+def _completion_body(chunks):
+    """The completion a list of streamed chunks adds up to"""
+    content, usage, model, finish_reason = [], None, None, None
+    for chunk in chunks:
+        model = chunk.get("model", model)
+        usage = chunk.get("usage") or usage
+        for choice in chunk.get("choices") or []:
+            finish_reason = choice.get("finish_reason") or finish_reason
+            content.append((choice.get("delta") or {}).get("content") or "")
+    return json.dumps({
+        "object": "chat.completion",
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(content)},
+                     "finish_reason": finish_reason}],
+        "usage": usage
+    }).encode()
+
+
+def _stream_chunks(body):
+    """A recorded completion as the chunks a streaming call would have produced"""
+    data = json.loads(body)
+    message = data["choices"][0]["message"]
+    model = data.get("model")
+    yield {"model": model, "choices": [{"index": 0, "delta": {"role": "assistant", "content": message["content"]},
+                                        "finish_reason": None}]}
+    yield {"model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": data["choices"][0].get("finish_reason")}]}
+    if data.get("usage"):
+        yield {"model": model, "choices": [], "usage": data["usage"]}
+
+
+class ReplayResponse:
+    """Stands in for the upstream HTTP response of a recorded call"""
+
+    def __init__(self, status_code, body, timings):
+        self.status_code = status_code
+        self.content = body
+        self.headers = {"content-type": "application/json", "x-replayed": "true"}
+        self.timings = timings
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _not_recorded():
+    from completion_client import UpstreamError
+    return UpstreamError(404, "No recorded completion for this request; record it with UPSTREAM_MODE=record")
+
+
+class RecordingClient:
+    """Wraps a completion client, saving what it receives"""
+
+    def __init__(self, client, recording):
+        self.client = client
+        self.recording = recording
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def post(self, payload, timeout=None):
+        response = self.client.post(payload, timeout=timeout)
+        if response.status_code < 400:
+            self.recording.record(payload, response.status_code, response.timings.get("ttfb", 0.0),
+                                  response.timings.get("total", 0.0), response.content)
+        return response
+
+    def stream(self, payload):
+        started = time.perf_counter()
+        first = None
+        chunks = []
+        for chunk in self.client.stream(payload):
+            first = first or time.perf_counter() - started
+            chunks.append(chunk)
+            yield chunk
+        self.recording.record(payload, 200, first or 0.0, time.perf_counter() - started, _completion_body(chunks))
+
+
+class AsyncRecordingClient(RecordingClient):
+    """asyncio variant of RecordingClient"""
+
+    async def post(self, payload, timeout=None):
+        response = await self.client.post(payload, timeout=timeout)
+        if response.status_code < 400:
+            self.recording.record(payload, response.status_code, response.timings.get("ttfb", 0.0),
+                                  response.timings.get("total", 0.0), response.content)
+        return response
+
+    async def stream(self, payload):
+        started = time.perf_counter()
+        first = None
+        chunks = []
+        async for chunk in self.client.stream(payload):
+            first = first or time.perf_counter() - started
+            chunks.append(chunk)
+            yield chunk
+        self.recording.record(payload, 200, first or 0.0, time.perf_counter() - started, _completion_body(chunks))
+
+
+class ReplayClient:
+    """Answers completion calls from a recording instead of the upstream"""
+
+    def __init__(self, recording, latency_scale=0.0, api_url=None):
+        self.recording = recording
+        self.latency_scale = latency_scale
+        self.api_url = api_url
+
+    def _find(self, payload):
+        found = self.recording.lookup(payload)
+        if found is None:
+            raise _not_recorded()
+        status, ttfb, total, body = found
+        return status, ttfb * self.latency_scale, total * self.latency_scale, body
+
+    def post(self, payload, timeout=None):
+        status, ttfb, total, body = self._find(payload)
+        time.sleep(total)
+        return ReplayResponse(status, body, {"connect": 0.0, "ttfb": ttfb, "total": total})
+
+    def complete(self, payload):
+        return self.post(payload).json()
+
+    def stream(self, payload):
+        _, ttfb, total, body = self._find(payload)
+        time.sleep(ttfb)
+        chunks = list(_stream_chunks(body))
+        for chunk in chunks:
+            yield chunk
+            time.sleep((total - ttfb) / len(chunks))
+
+    def close(self):
+        pass
+
+
+class AsyncReplayClient(ReplayClient):
+    """asyncio variant of ReplayClient"""
+
+    async def post(self, payload, timeout=None):
+        status, ttfb, total, body = self._find(payload)
+        await asyncio.sleep(total)
+        return ReplayResponse(status, body, {"connect": 0.0, "ttfb": ttfb, "total": total})
+
+    async def complete(self, payload):
+        return (await self.post(payload)).json()
+
+    async def stream(self, payload):
+        _, ttfb, total, body = self._find(payload)
+        await asyncio.sleep(ttfb)
+        chunks = list(_stream_chunks(body))
+        for chunk in chunks:
+            yield chunk
+            await asyncio.sleep((total - ttfb) / len(chunks))
+
+    async def close(self):
+        pass
+
+
+def mode():
+    setting = os.getenv("UPSTREAM_MODE", "live").lower()
+    return setting if setting in MODES else "live"
+
+
+def wrap_client(client, asynchronous=False):
+    """The completion client to use for client in the configured UPSTREAM_MODE"""
+    current = mode()
+    if current == "live":
+        return client
+    recording = get_recording()
+    if current == "record":
+        return (AsyncRecordingClient if asynchronous else RecordingClient)(client, recording)
+    latency_scale = float(os.getenv("UPSTREAM_REPLAY_LATENCY", "0"))
+    return (AsyncReplayClient if asynchronous else ReplayClient)(recording, latency_scale, client.api_url)
+
+
+_recording = None
+_recording_lock = threading.Lock()
+
+
+def get_recording():
+    """Return the process-wide recording at UPSTREAM_RECORDING"""
+    global _recording
+    if _recording is None:
+        with _recording_lock:
+            if _recording is None:
+                _recording = Recording(
+                    os.getenv("UPSTREAM_RECORDING", "recordings/completions.rec"),
+                    max_variants=int(os.getenv("UPSTREAM_RECORD_VARIANTS", "1"))
+                )
+                atexit.register(_recording.close)
+    return _recording
+
+
+def reset_recording():
+    global _recording
+    with _recording_lock:
+        if _recording is not None:
+            _recording.close()
+        _recording = None
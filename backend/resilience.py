@@ -0,0 +1,349 @@
+"""Retries, hedged requests, deadlines and a circuit breaker for upstream calls
+
+Completion requests have no side effects, so a failed call can be retried
+safely. Retries use exponential backoff with full jitter and only happen
+for 429s, 5xx responses and transport errors. With hedging on, a call that
+has not answered after the recent p95 latency gets a duplicate, and
+whichever answers first wins. The circuit breaker fails calls fast while
+the upstream keeps failing, then lets a single probe through once the
+cooldown ends.
+
+Callers set a deadline per request with the X-Request-Timeout header (in
+seconds). Retries, queueing and the upstream timeouts all stay inside it.
+"""
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from completion_client import UpstreamError
+from governor import Overloaded, parse_duration
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the caller's deadline leaves no time for another attempt"""
+
+
+class CircuitOpen(Overloaded):
+    """Raised while the circuit breaker is failing calls fast"""
+
+
+def start_deadline(header_value, default=None):
+    """Start the current request's deadline from its X-Request-Timeout header"""
+    try:
+        seconds = float(header_value) if header_value else default
+    except ValueError:
+        seconds = default
+    _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def remaining():
+    """Seconds left before the current request's deadline, or None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left
+
+
+def from_upstream(e):
+    """Whether e is an outcome of the upstream call rather than a local rejection"""
+    if isinstance(e, (UpstreamError, requests.ConnectionError, requests.Timeout)):
+        return True
+    return httpx is not None and isinstance(e, httpx.TransportError)
+
+
+def expired():
+    """Whether the current request's deadline has passed"""
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def is_retryable(e):
+    if isinstance(e, UpstreamError):
+        return e.status_code == 429 or e.status_code >= 500
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return httpx is not None and isinstance(e, httpx.TransportError)
+
+
+def backoff_delay(attempt, e, base_delay, max_delay):
+    """Full-jitter exponential backoff, never shorter than an upstream Retry-After
+
+    Background jobs also retry calls shed with Overloaded, and wait at least
+    their retry_after.
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    if isinstance(e, UpstreamError):
+        delay = max(delay, parse_duration(e.headers.get("retry-after")) or 0)
+    elif isinstance(e, Overloaded):
+        delay = max(delay, e.retry_after)
+    return delay
+
+
+def _first_success(done, pending):
+    """The finished call to answer with, or None to keep waiting on the others"""
+    for future in done:
+        if future.exception() is None:
+            return future
+    return None if pending else next(iter(done))
+
+
+class CircuitBreaker:
+    """Opens after consecutive upstream failures and half-opens after a cooldown"""
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise CircuitOpen unless a call may go upstream now
+
+        Returns True when the call is the half-open probe; its caller must
+        then call release() once the call is over, however it ends.
+        """
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "closed":
+                return False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            retry_after = max(1.0, self.cooldown - (time.monotonic() - self.opened_at))
+        raise CircuitOpen("Upstream circuit is open", retry_after=retry_after)
+
+    def record(self, e=None):
+        """Record a call's outcome; e is the exception it raised, if any
+
+        Local rejections (shedding, quotas, deadlines) say nothing about the
+        upstream and are ignored.
+        """
+        if e is not None and not from_upstream(e):
+            return
+        failed = e is not None and is_retryable(e) and not (
+            isinstance(e, UpstreamError) and e.status_code == 429
+        )
+        with self._lock:
+            if not failed:
+                self.state = "closed"
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release(self, probe):
+        """Let the next probe through once the half-open probe has finished"""
+        if probe:
+            with self._lock:
+                self._probing = False
+
+    def info(self):
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies used to pick the hedge delay"""
+
+    def __init__(self, size=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Resilience:
+    """Wraps an upstream call with retries, hedging, deadlines and the breaker"""
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=8.0, hedge=False,
+                 hedge_min_delay=0.5, breaker=None):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self._executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge") if hedge else None
+
+    def hedge_delay(self):
+        if not self.hedge:
+            return None
+        p95 = self.latency.percentile(0.95)
+        return None if p95 is None else max(self.hedge_min_delay, p95)
+
+    def _next_delay(self, attempt, e):
+        """Backoff before the next attempt, or None when the error is final"""
+        if attempt + 1 >= self.attempts or not is_retryable(e):
+            return None
+        delay = backoff_delay(attempt, e, self.base_delay, self.max_delay)
+        left = remaining()
+        if left is not None and delay >= left:
+            return None
+        self.retries += 1
+        return delay
+
+    def call(self, fn, payload):
+        """Run fn(payload, timeout) until it succeeds, fails for good, or time runs out"""
+        for attempt in range(self.attempts):
+            probe = self.breaker.allow()
+            start = time.monotonic()
+            try:
+                result = self._hedged(fn, payload)
+            except Exception as e:
+                self.breaker.record(e)
+                delay = self._next_delay(attempt, e)
+                if delay is None:
+                    if expired():
+                        # A timeout cut short by the deadline is the deadline's failure
+                        raise DeadlineExceeded("Request deadline exceeded") from e
+                    raise
+            else:
+                self.breaker.record()
+                self.latency.record(time.monotonic() - start)
+                return result
+            finally:
+                self.breaker.release(probe)
+            time.sleep(delay)
+
+    def _hedged(self, fn, payload):
+        delay = self.hedge_delay()
+        if delay is None:
+            return fn(payload, remaining())
+
+        # Copy the request context so the deadline follows the call into the pool
+        primary = self._executor.submit(contextvars.copy_context().run, fn, payload, remaining())
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self.hedges += 1
+        hedge = self._executor.submit(contextvars.copy_context().run, fn, payload, remaining())
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = _first_success(done, pending)
+            if winner is not None:
+                return winner.result()
+
+    async def acall(self, fn, payload):
+        """asyncio variant of call; fn is a coroutine function"""
+        for attempt in range(self.attempts):
+            probe = self.breaker.allow()
+            start = time.monotonic()
+            try:
+                result = await self._ahedged(fn, payload)
+            except Exception as e:
+                self.breaker.record(e)
+                delay = self._next_delay(attempt, e)
+                if delay is None:
+                    if expired():
+                        # A timeout cut short by the deadline is the deadline's failure
+                        raise DeadlineExceeded("Request deadline exceeded") from e
+                    raise
+            else:
+                self.breaker.record()
+                self.latency.record(time.monotonic() - start)
+                return result
+            finally:
+                self.breaker.release(probe)
+            await asyncio.sleep(delay)
+
+    async def _ahedged(self, fn, payload):
+        delay = self.hedge_delay()
+        if delay is None:
+            return await fn(payload, remaining())
+
+        primary = asyncio.ensure_future(fn(payload, remaining()))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self.hedges += 1
+        pending = {primary, asyncio.ensure_future(fn(payload, remaining()))}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = _first_success(done, pending)
+                if winner is not None:
+                    return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def info(self):
+        return {
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_delay": self.hedge_delay(),
+            "circuit": self.breaker.info()
+        }
+
+
+_resilience = None
+_resilience_lock = threading.Lock()
+
+
+def get_resilience():
+    """Return the process-wide resilience layer built from the environment"""
+    global _resilience
+    if _resilience is None:
+        with _resilience_lock:
+            if _resilience is None:
+                _resilience = Resilience(
+                    attempts=int(os.getenv("AI_RETRY_ATTEMPTS", "3")),
+                    base_delay=float(os.getenv("AI_RETRY_DELAY", "0.5")),
+                    max_delay=float(os.getenv("AI_RETRY_MAX_DELAY", "8")),
+                    hedge=os.getenv("HEDGE_ENABLED", "false").lower() == "true",
+                    hedge_min_delay=float(os.getenv("HEDGE_MIN_DELAY", "0.5")),
+                    breaker=CircuitBreaker(
+                        failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+                        cooldown=float(os.getenv("CIRCUIT_COOLDOWN", "30"))
+                    )
+                )
+    return _resilience
+
+
+def reset_resilience():
+    global _resilience
+    with _resilience_lock:
+        _resilience = None
@@ -0,0 +1,158 @@
+"""Content-addressed cache for chat completion responses"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# redis is optional and only needed for the shared cache backend
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(payload):
+    """Hash the parts of a completion request that determine its answer"""
+    material = json.dumps(
+        [payload.get("model"), payload.get("messages"), payload.get("max_tokens")],
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class CacheStats:
+    """Thread-safe hit/miss counters shared by every cache backend"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class MemoryCache:
+    """In-process LRU cache bounded by total value size and entry age"""
+
+    backend = "memory"
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self.stats.record(entry is not None)
+        return json.loads(entry[1]) if entry is not None else None
+
+    def set(self, key, value):
+        data = json.dumps(value, separators=(",", ":")).encode()
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, data = self._entries.pop(key)
+        self.size -= len(data)
+
+    def info(self):
+        return dict(self.stats.as_dict(), backend=self.backend,
+                    entries=len(self._entries), bytes=self.size, max_bytes=self.max_bytes)
+
+
+class RedisCache:
+    """Cache shared by every worker through the compose-provided Redis"""
+
+    backend = "redis"
+
+    def __init__(self, url, ttl=3600, prefix="autotasker:completion:"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for RESPONSE_CACHE_BACKEND=redis")
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def get(self, key):
+        try:
+            data = self._redis.get(self.prefix + key)
+        except redis.RedisError as e:
+            logger.warning("Response cache lookup failed: %s", e)
+            data = None
+        self.stats.record(data is not None)
+        return json.loads(data) if data is not None else None
+
+    def set(self, key, value):
+        data = json.dumps(value, separators=(",", ":"))
+        try:
+            self._redis.set(self.prefix + key, data, ex=self.ttl)
+        except redis.RedisError as e:
+            logger.warning("Response cache store failed: %s", e)
+
+    def info(self):
+        return dict(self.stats.as_dict(), backend=self.backend)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the configured process-wide cache, or None when caching is off"""
+    global _cache
+    if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() != "true":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                ttl = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+                if os.getenv("RESPONSE_CACHE_BACKEND", "memory") == "redis":
+                    _cache = RedisCache(os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl=ttl)
+                else:
+                    _cache = MemoryCache(
+                        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+                        ttl=ttl
+                    )
+    return _cache
+
+
+def reset_cache():
+    """Drop the shared cache so the next call rebuilds it from the environment"""
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,345 @@
+"""Declarative model routing across OpenAI-compatible providers
+
+MODEL_ROUTER_CONFIG names a JSON file with three sections: providers
+(an OpenAI-compatible chat completions URL and its key, which can be a
+local inference server), models (a provider plus the model name to send
+and an optional cost), and routes. Routes are tried in order and the
+first whose conditions match the request picks its candidate models:
+
+    {"tasks": ["summary"], "max_input_tokens": 800,
+     "targets": ["fast", "primary"], "strategy": "latency"}
+
+Conditions are the task (the endpoint a payload was built for) and the
+estimated input size. Candidates are ordered by strategy ("ordered",
+"latency" or "cost") after demoting any whose rolling error rate is too
+high, who failed several calls in a row, or whose median latency is over
+the route's max_latency. A call that fails with a retryable error falls
+back to the next candidate straight away.
+
+Without a config file, every request goes to OPENAI_API_URL with
+OPENAI_MODEL, as before.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import metrics
+from completion_client import DEFAULT_API_URL, get_async_client, get_client
+from resilience import is_retryable, remaining
+
+STRATEGIES = ("ordered", "latency", "cost")
+HEALTH_DEFAULTS = {"window": 60.0, "min_samples": 5, "max_error_rate": 0.5, "eject_after": 3, "cooldown": 30.0}
+
+
+class RouterConfigError(ValueError):
+    """Raised when the model router configuration is invalid"""
+
+
+def input_tokens(payload):
+    chars = sum(len(str(message.get("content", ""))) for message in payload.get("messages", []))
+    return chars // 4
+
+
+class TargetHealth:
+    """Rolling outcomes and latencies of one routing target"""
+
+    def __init__(self, window=60.0, min_samples=5, max_error_rate=0.5, eject_after=3, cooldown=30.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.eject_after = eject_after
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self._samples = deque(maxlen=500)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok):
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, seconds, ok))
+            self.consecutive_failures = 0 if ok else self.consecutive_failures + 1
+            if self.consecutive_failures >= self.eject_after:
+                self.ejected_until = now + self.cooldown
+
+    def _recent(self):
+        cutoff = time.monotonic() - self.window
+        with self._lock:
+            return [sample for sample in self._samples if sample[0] >= cutoff]
+
+    def error_rate(self):
+        recent = self._recent()
+        if len(recent) < self.min_samples:
+            return 0.0
+        return sum(1 for _, _, ok in recent if not ok) / len(recent)
+
+    def latency(self):
+        """Median latency of recent successful calls, or None before there are any"""
+        latencies = sorted(seconds for _, seconds, ok in self._recent() if ok)
+        return latencies[len(latencies) // 2] if latencies else None
+
+    def degraded(self):
+        return time.monotonic() < self.ejected_until or self.error_rate() > self.max_error_rate
+
+    def info(self):
+        latency = self.latency()
+        return {
+            "calls": len(self._recent()),
+            "error_rate": round(self.error_rate(), 4),
+            "latency_p50": round(latency, 4) if latency is not None else None,
+            "degraded": self.degraded()
+        }
+
+
+class Target:
+    """One model on one provider that requests can be routed to"""
+
+    def __init__(self, name, api_url, api_key, model=None, cost_per_1k_tokens=None, health=None):
+        self.name = name
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.health = health or TargetHealth()
+
+    def prepare(self, payload):
+        """The payload to send upstream: the target's model, without the routing task tag"""
+        upstream = {key: value for key, value in payload.items() if key != "task"}
+        if self.model:
+            upstream["model"] = self.model
+        return upstream
+
+
+class Route:
+    """Request conditions and the candidate targets they select"""
+
+    def __init__(self, targets, tasks=None, min_input_tokens=None, max_input_tokens=None,
+                 strategy="ordered", max_latency=None):
+        if strategy not in STRATEGIES:
+            raise RouterConfigError(f"Unknown routing strategy: {strategy}")
+        self.targets = targets
+        self.tasks = set(tasks) if tasks else None
+        self.min_input_tokens = min_input_tokens
+        self.max_input_tokens = max_input_tokens
+        self.strategy = strategy
+        self.max_latency = max_latency
+
+    def matches(self, task, tokens):
+        if self.tasks is not None and task not in self.tasks:
+            return False
+        if self.min_input_tokens is not None and tokens < self.min_input_tokens:
+            return False
+        return self.max_input_tokens is None or tokens <= self.max_input_tokens
+
+    def order(self):
+        """Candidates best first: healthy before degraded, fast enough before slow, then by strategy"""
+        def key(target):
+            latency = target.health.latency()
+            slow = self.max_latency is not None and latency is not None and latency > self.max_latency
+            if self.strategy == "latency":
+                # Targets without samples yet sort first so they get measured
+                preference = latency or 0.0
+            elif self.strategy == "cost":
+                preference = target.cost_per_1k_tokens if target.cost_per_1k_tokens is not None else float("inf")
+            else:
+                preference = 0
+            return target.health.degraded(), slow, preference
+        return sorted(self.targets, key=key)
+
+
+class Router:
+    """Picks the target for each completion and falls back when it fails"""
+
+    def __init__(self, targets, routes):
+        if not routes:
+            raise RouterConfigError("The model router needs at least one route")
+        self.targets = targets
+        self.routes = routes
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def plan(self, payload):
+        """Candidate targets for a payload, best first"""
+        task, tokens = payload.get("task"), input_tokens(payload)
+        for route in self.routes:
+            if route.matches(task, tokens):
+                return route.order()
+        raise RouterConfigError(f"No route matches task {task!r} with {tokens} input tokens")
+
+    def _record(self, target, started, e=None):
+        # Client errors such as a bad request say nothing about the provider's health
+        if e is not None and not is_retryable(e):
+            return
+        target.health.record(time.monotonic() - started, e is None)
+        metrics.ROUTED.labels(target=target.name, outcome="error" if e is not None else "ok").inc()
+
+    def _fall_back(self, targets, index, e):
+        """True when a failed call should move on to the next candidate"""
+        if index + 1 >= len(targets) or not is_retryable(e):
+            return False
+        with self._lock:
+            self.fallbacks += 1
+        return True
+
+    def call(self, send, payload, timeout=None):
+        """Run send(target, upstream_payload, timeout) against each candidate until one succeeds"""
+        targets = self.plan(payload)
+        for index, target in enumerate(targets):
+            started = time.monotonic()
+            try:
+                result = send(target, target.prepare(payload), timeout)
+            except Exception as e:
+                self._record(target, started, e)
+                if not self._fall_back(targets, index, e):
+                    raise
+                timeout = remaining() if timeout is not None else None
+                continue
+            self._record(target, started)
+            return result
+
+    async def acall(self, send, payload, timeout=None):
+        """asyncio variant of call; send is a coroutine function"""
+        targets = self.plan(payload)
+        for index, target in enumerate(targets):
+            started = time.monotonic()
+            try:
+                result = await send(target, target.prepare(payload), timeout)
+            except Exception as e:
+                self._record(target, started, e)
+                if not self._fall_back(targets, index, e):
+                    raise
+                timeout = remaining() if timeout is not None else None
+                continue
+            self._record(target, started)
+            return result
+
+    def stream(self, payload):
+        """Yield streamed chunks, falling back only while nothing has been sent yet"""
+        targets = self.plan(payload)
+        for index, target in enumerate(targets):
+            started = time.monotonic()
+            streaming = False
+            try:
+                for chunk in get_client(target.api_url, target.api_key).stream(target.prepare(payload)):
+                    streaming = True
+                    yield chunk
+            except Exception as e:
+                self._record(target, started, e)
+                if streaming or not self._fall_back(targets, index, e):
+                    raise
+                continue
+            self._record(target, started)
+            return
+
+    async def astream(self, payload):
+        """asyncio variant of stream"""
+        targets = self.plan(payload)
+        for index, target in enumerate(targets):
+            started = time.monotonic()
+            streaming = False
+            try:
+                async for chunk in get_async_client(target.api_url, target.api_key).stream(target.prepare(payload)):
+                    streaming = True
+                    yield chunk
+            except Exception as e:
+                self._record(target, started, e)
+                if streaming or not self._fall_back(targets, index, e):
+                    raise
+                continue
+            self._record(target, started)
+            return
+
+    def cost(self, model, tokens):
+        """Price of tokens on the first target serving model, None when it has no cost"""
+        for target in self.targets.values():
+            if target.model == model and target.cost_per_1k_tokens is not None:
+                return round(tokens / 1000 * target.cost_per_1k_tokens, 6)
+        return None
+
+    def info(self):
+        return {
+            "fallbacks": self.fallbacks,
+            "routes": len(self.routes),
+            "targets": {
+                name: dict(target.health.info(), model=target.model, api_url=target.api_url)
+                for name, target in self.targets.items()
+            }
+        }
+
+
+def default_config():
+    """Single-provider config equivalent to the OPENAI_* environment settings"""
+    return {
+        "providers": {
+            "openai": {"url": os.getenv("OPENAI_API_URL", DEFAULT_API_URL), "api_key_env": "OPENAI_API_KEY"}
+        },
+        "models": {
+            "default": {"provider": "openai", "model": os.getenv("OPENAI_MODEL") or None}
+        },
+        "routes": [{"targets": ["default"]}]
+    }
+
+
+def build_router(config):
+    """Build a Router from a parsed configuration dict"""
+    health = dict(HEALTH_DEFAULTS, **config.get("health", {}))
+    providers = config.get("providers") or {}
+    targets = {}
+    for name, spec in (config.get("models") or {}).items():
+        provider = providers.get(spec.get("provider"))
+        if provider is None or "url" not in provider:
+            raise RouterConfigError(f"Model {name} needs a provider with a url")
+        api_key = provider.get("api_key")
+        if api_key is None:
+            api_key = os.getenv(provider["api_key_env"], "") if provider.get("api_key_env") else ""
+        targets[name] = Target(
+            name,
+            provider["url"],
+            api_key,
+            model=spec.get("model"),
+            cost_per_1k_tokens=spec.get("cost_per_1k_tokens"),
+            health=TargetHealth(**health)
+        )
+
+    routes = []
+    for spec in config.get("routes") or []:
+        unknown = [name for name in spec.get("targets", []) if name not in targets]
+        if unknown or not spec.get("targets"):
+            raise RouterConfigError(f"Route targets must name configured models: {unknown or spec.get('targets')}")
+        routes.append(Route(
+            [targets[name] for name in spec["targets"]],
+            tasks=spec.get("tasks"),
+            min_input_tokens=spec.get("min_input_tokens"),
+            max_input_tokens=spec.get("max_input_tokens"),
+            strategy=spec.get("strategy", "ordered"),
+            max_latency=spec.get("max_latency")
+        ))
+    return Router(targets, routes)
+
+
+def load_config(path):
+    with open(path) as config_file:
+        return json.load(config_file)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide router built from MODEL_ROUTER_CONFIG, or the OPENAI_* defaults"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                path = os.getenv("MODEL_ROUTER_CONFIG")
+                _router = build_router(load_config(path) if path else default_config())
+    return _router
+
+
+def reset_router():
+    global _router
+    with _router_lock:
+        _router = None
@@ -0,0 +1,315 @@
+"""Resume screening against an indexed job description
+
+A job description is parsed once into weighted terms (requirement and
+bullet lines count double) and stored under an id. Screening a pool of
+resumes against it is then two passes: every resume is scored locally
+with TF-IDF cosine similarity and keyword coverage over the job's terms,
+and only the top_k best go to the model, which returns a structured match
+percentage, strengths and gaps. The rest keep their local score and are
+marked as not evaluated, so a pool of hundreds costs top_k completions.
+
+Job descriptions and screening results are kept in memory, or in Redis
+with SCREENING_BACKEND=redis so every worker process can serve them.
+"""
+import contextvars
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import prompts
+from completion_service import fetch_completion
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9+#.]*")
+_REQUIREMENT = re.compile(r"^\s*(?:[-*•]|\d+[.)])|\b(?:required|must|requirements?|experience with|proficien\w*)\b",
+                          re.IGNORECASE)
+STOPWORDS = frozenset("""
+a about above after all also an and any are as at be been being both but by can could do does for from
+has have having he her his i if in into is it its job looking may more most must not of on or our out
+over role she should so some such than that the their them then there these they this those through to
+under up us we well were what when where which while who will with within work would you your years
+""".split())
+SORT_KEYS = ("match", "score")
+
+
+class ScreeningError(ValueError):
+    """Raised when a job description or screening request is invalid"""
+
+
+class StoreUnavailable(Exception):
+    """Raised when the screening store cannot be reached"""
+
+
+def tokenize(text):
+    words = [word.rstrip(".") for word in _TOKEN.findall(text.lower())]
+    return [word for word in words if word and word not in STOPWORDS and not word.isdigit()]
+
+
+def terms(text):
+    """Unigram and bigram terms of text"""
+    words = tokenize(text)
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def index_job_description(text, title=None):
+    """Parse a job description into its weighted term vocabulary"""
+    if not isinstance(text, str) or not text.strip():
+        raise ScreeningError("Missing required field: job_description")
+    weights = Counter()
+    for line in text.splitlines():
+        boost = 2.0 if _REQUIREMENT.search(line) else 1.0
+        for term in terms(line):
+            weights[term] += boost
+    if not weights:
+        raise ScreeningError("Job description has no searchable terms")
+    return {
+        "id": uuid.uuid4().hex,
+        "title": title,
+        "text": text,
+        "terms": dict(weights),
+        "created_at": time.time()
+    }
+
+
+def local_scores(job, resumes):
+    """TF-IDF score (0-100) of each resume against the job's terms
+
+    IDF comes from the submitted pool plus the job description itself, so
+    a skill every candidate lists counts for less than a rare one. The
+    score blends cosine similarity with the weighted share of job terms the
+    resume mentions at all.
+    """
+    if np is None:
+        raise RuntimeError("The numpy package is required for resume screening")
+    vocabulary = list(job["terms"])
+    column = {term: index for index, term in enumerate(vocabulary)}
+    counts = np.zeros((len(resumes), len(vocabulary)), dtype=np.float64)
+    for row, resume in enumerate(resumes):
+        for term, count in Counter(terms(resume)).items():
+            if term in column:
+                counts[row, column[term]] = count
+
+    documents = len(resumes) + 1
+    frequency = (counts > 0).sum(axis=0) + 1
+    idf = np.log((1 + documents) / (1 + frequency)) + 1
+    job_weights = np.array([job["terms"][term] for term in vocabulary]) * idf
+    job_vector = job_weights / np.linalg.norm(job_weights)
+
+    tfidf = np.log1p(counts) * idf
+    norms = np.linalg.norm(tfidf, axis=1)
+    norms[norms == 0] = 1.0
+    cosine = (tfidf / norms[:, None]) @ job_vector
+    coverage = ((counts > 0) * job_weights).sum(axis=1) / job_weights.sum()
+    return [round(float(score) * 100, 2) for score in 0.7 * cosine + 0.3 * coverage]
+
+
+def parse_evaluation(content):
+    """Read the model's JSON verdict, tolerating prose or code fences around it"""
+    start, end = content.find("{"), content.rfind("}")
+    try:
+        verdict = json.loads(content[start:end + 1]) if start != -1 and end > start else {}
+    except ValueError:
+        verdict = {}
+    try:
+        match = max(0, min(100, int(round(float(verdict.get("match_percentage"))))))
+    except (TypeError, ValueError):
+        match = None
+    return {
+        "match_percentage": match,
+        "summary": verdict.get("summary") if isinstance(verdict.get("summary"), str) else content.strip(),
+        "strengths": [str(item) for item in verdict.get("strengths") or [] if item],
+        "gaps": [str(item) for item in verdict.get("gaps") or [] if item]
+    }
+
+
+def _evaluate(job, candidate):
+    try:
+        response_data, _ = fetch_completion(prompts.resume_match_payload(job["text"], candidate["resume"]))
+    except Exception as e:
+        return {"evaluated": False, "error": str(e)}
+    return dict(parse_evaluation(prompts.message_content(response_data)), evaluated=True)
+
+
+def _settings():
+    return {
+        "top_k": int(os.getenv("SCREENING_TOP_K", "10")),
+        "max_top_k": int(os.getenv("SCREENING_MAX_TOP_K", "50")),
+        "max_resumes": int(os.getenv("SCREENING_MAX_RESUMES", "1000")),
+        "concurrency": int(os.getenv("SCREENING_CONCURRENCY", "8"))
+    }
+
+
+def parse_screening(data):
+    """Validate a screening request; returns (candidates, top_k)"""
+    settings = _settings()
+    if not isinstance(data, dict) or not isinstance(data.get("resumes"), list) or not data["resumes"]:
+        raise ScreeningError("Missing required field: resumes")
+    if len(data["resumes"]) > settings["max_resumes"]:
+        raise ScreeningError(f"Too many resumes: at most {settings['max_resumes']} per screening")
+    candidates = []
+    for index, item in enumerate(data["resumes"]):
+        if isinstance(item, str):
+            item = {"resume": item}
+        if not isinstance(item, dict) or not isinstance(item.get("resume"), str) or not item["resume"].strip():
+            raise ScreeningError(f"Resume {index} is missing its resume text")
+        candidates.append({"id": str(item.get("id", index)), "resume": item["resume"]})
+    top_k = data.get("top_k", settings["top_k"])
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 0:
+        raise ScreeningError("top_k must be a non-negative integer")
+    return candidates, min(top_k, settings["max_top_k"])
+
+
+def screen(job, candidates, top_k):
+    """Rank candidates locally, evaluate the top_k with the model and return the screening"""
+    scores = local_scores(job, [candidate["resume"] for candidate in candidates])
+    order = sorted(range(len(candidates)), key=lambda index: -scores[index])
+    shortlist = order[:top_k]
+    evaluations = {}
+    if shortlist:
+        workers = max(1, min(_settings()["concurrency"], len(shortlist)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {index: pool.submit(contextvars.copy_context().run, _evaluate, job, candidates[index])
+                       for index in shortlist}
+            evaluations = {index: future.result() for index, future in futures.items()}
+
+    results = []
+    for rank, index in enumerate(order, start=1):
+        result = {"id": candidates[index]["id"], "score": scores[index], "rank": rank}
+        result.update(evaluations.get(index, {"evaluated": False}))
+        results.append(result)
+    return {
+        "id": uuid.uuid4().hex,
+        "job_description_id": job["id"],
+        "top_k": top_k,
+        "evaluated": sum(1 for result in results if result["evaluated"]),
+        "total": len(results),
+        "results": results,
+        "created_at": time.time()
+    }
+
+
+def page(screening, sort="match", order="desc", page_number=1, per_page=20):
+    """One page of a screening's results in the requested order"""
+    if sort not in SORT_KEYS:
+        raise ScreeningError(f"sort must be one of: {', '.join(SORT_KEYS)}")
+    if order not in ("asc", "desc"):
+        raise ScreeningError("order must be asc or desc")
+    if page_number < 1 or not 1 <= per_page <= 100:
+        raise ScreeningError("page must be at least 1 and per_page between 1 and 100")
+    if sort == "match":
+        # Evaluated candidates by match, then the rest by local score
+        def key(result):
+            match = result.get("match_percentage")
+            return (match is not None, match if match is not None else -1, result["score"])
+    else:
+        def key(result):
+            return result["score"]
+    ranked = sorted(screening["results"], key=key, reverse=order == "desc")
+    start = (page_number - 1) * per_page
+    return {
+        "page": page_number,
+        "per_page": per_page,
+        "pages": max(1, math.ceil(len(ranked) / per_page)),
+        "total": len(ranked),
+        "results": ranked[start:start + per_page]
+    }
+
+
+class MemoryScreeningStore:
+    """Bounded in-process store of job descriptions and screenings"""
+
+    backend = "memory"
+
+    def __init__(self, max_items=1000):
+        self.max_items = max_items
+        self._items = {"jd": OrderedDict(), "screening": OrderedDict()}
+        self._lock = threading.Lock()
+
+    def put(self, kind, item):
+        with self._lock:
+            items = self._items[kind]
+            items[item["id"]] = item
+            items.move_to_end(item["id"])
+            while len(items) > self.max_items:
+                items.popitem(last=False)
+
+    def get(self, kind, item_id):
+        with self._lock:
+            return self._items[kind].get(item_id)
+
+    def info(self):
+        return {
+            "backend": self.backend,
+            "job_descriptions": len(self._items["jd"]),
+            "screenings": len(self._items["screening"])
+        }
+
+
+class RedisScreeningStore:
+    """Job descriptions and screenings as JSON values with a TTL"""
+
+    backend = "redis"
+
+    def __init__(self, url, ttl=7 * 24 * 3600, prefix="autotasker:screening:"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for SCREENING_BACKEND=redis")
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=2.0, socket_connect_timeout=2.0)
+
+    def put(self, kind, item):
+        try:
+            self._client.set(f"{self.prefix}{kind}:{item['id']}", json.dumps(item), ex=self.ttl)
+        except redis.RedisError as e:
+            raise StoreUnavailable(f"Screening store unavailable: {e}")
+
+    def get(self, kind, item_id):
+        try:
+            value = self._client.get(f"{self.prefix}{kind}:{item_id}")
+        except redis.RedisError as e:
+            raise StoreUnavailable(f"Screening store unavailable: {e}")
+        return json.loads(value) if value is not None else None
+
+    def info(self):
+        return {"backend": self.backend, "ttl": self.ttl}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide screening store configured by SCREENING_BACKEND"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if os.getenv("SCREENING_BACKEND", "memory").lower() == "redis":
+                    _store = RedisScreeningStore(
+                        os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+                        ttl=int(os.getenv("SCREENING_TTL", str(7 * 24 * 3600)))
+                    )
+                else:
+                    _store = MemoryScreeningStore(int(os.getenv("SCREENING_MAX_ITEMS", "1000")))
+    return _store
+
+
+def reset_store():
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,234 @@
+"""Similarity cache for near-duplicate prompts to /ai/summary and /ai/post_social
+
+The exact response cache misses texts that differ only in a signature, a
+timestamp or whitespace. This cache normalizes the prompt text, embeds it
+with a hashing vectorizer (word unigrams and bigrams, no model download,
+CPU only) and answers from the closest earlier prompt whose cosine
+similarity reaches SEMANTIC_CACHE_THRESHOLD. Prompts are only compared
+with others built from the same model, system prompt and token limit, so
+a LinkedIn post is never served for a Twitter request.
+
+The index is a fixed-size matrix searched with one matrix-vector product;
+when it is full the least recently used entry is replaced. It is saved to
+SEMANTIC_CACHE_PATH in the background and loaded again on startup.
+"""
+import atexit
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SEMANTIC_TASKS = ("summary", "post_social")
+
+_SIGNATURE = re.compile(r"(?i)^\s*(--\s*$|sent from my\b|best regards\b|kind regards\b|regards,)")
+# A signature starts this close to the end and holds only short, unquoted lines;
+# other markers are content (quoted replies, documents)
+SIGNATURE_LINES = 6
+SIGNATURE_WIDTH = 40
+_TIMESTAMP = re.compile(
+    r"\b\d{4}-\d{2}-\d{2}(?:[t ]\d{1,2}:\d{2}(?::\d{2})?(?:\.\d+)?(?:z|[+-]\d{2}:?\d{2})?)?\b"
+    r"|\b\d{1,2}[/.]\d{1,2}[/.]\d{2,4}\b"
+    r"|\b\d{1,2}:\d{2}(?::\d{2})?\s*(?:am|pm)?\b",
+    re.IGNORECASE
+)
+_WORD = re.compile(r"\w+")
+
+
+def _signature_line(line):
+    line = line.strip()
+    return len(line) <= SIGNATURE_WIDTH and not line.startswith(">")
+
+
+def strip_signature(text):
+    """Drop a trailing signature block, if the text ends with one"""
+    lines = text.rstrip().split("\n")
+    for index in range(max(0, len(lines) - SIGNATURE_LINES), len(lines)):
+        if _SIGNATURE.match(lines[index]) and all(_signature_line(line) for line in lines[index + 1:]):
+            return "\n".join(lines[:index])
+    return text
+
+
+def normalize(text):
+    """Lowercase the text and drop a trailing signature, timestamps and extra whitespace"""
+    text = strip_signature(text)
+    text = _TIMESTAMP.sub(" ", text.lower())
+    return " ".join(text.split())
+
+
+def _features(text):
+    words = _WORD.findall(text)
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def embed(text, dimensions=1024):
+    """Signed feature-hashing embedding of normalized text, scaled to unit length"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature in _features(normalize(text)):
+        digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        vector[value % dimensions] += 1.0 if value >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def split_prompt(payload):
+    """(scope, text): what must match exactly, and the user text compared by similarity"""
+    messages = payload.get("messages", [])
+    fixed = [message for message in messages if message.get("role") != "user"]
+    user = [str(message.get("content", "")) for message in messages if message.get("role") == "user"]
+    scope = json.dumps([payload.get("model"), fixed, payload.get("max_tokens")], sort_keys=True)
+    return hashlib.sha256(scope.encode()).hexdigest()[:16], "\n".join(user)
+
+
+class SemanticCache:
+    """Bounded nearest-neighbour index of prompt embeddings and their completions"""
+
+    def __init__(self, threshold=0.92, max_entries=10000, dimensions=1024, path=None, save_interval=30.0):
+        if np is None:
+            raise RuntimeError("The numpy package is required for SEMANTIC_CACHE_ENABLED=true")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+        self.path = path
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self._scopes = np.full(max_entries, "", dtype="<U16")
+        self._last_used = np.zeros(max_entries, dtype=np.float64)
+        self._answers = [None] * max_entries
+        self._size = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._saver = None
+        if path and os.path.exists(path):
+            self.load()
+
+    def get(self, payload):
+        """Return the cached completion for the closest similar prompt, or None"""
+        scope, text = split_prompt(payload)
+        vector = embed(text, self.dimensions)
+        with self._lock:
+            if self._size:
+                scores = self._vectors[:self._size] @ vector
+                scores[self._scopes[:self._size] != scope] = -1.0
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    self._last_used[best] = time.time()
+                    return self._answers[best]
+            self.misses += 1
+        return None
+
+    def set(self, payload, response_data):
+        scope, text = split_prompt(payload)
+        vector = embed(text, self.dimensions)
+        with self._lock:
+            if self._size < self.max_entries:
+                row = self._size
+                self._size += 1
+            else:
+                row = int(np.argmin(self._last_used))
+            self._vectors[row] = vector
+            self._scopes[row] = scope
+            self._last_used[row] = time.time()
+            self._answers[row] = response_data
+            self._dirty = True
+        self._schedule_save()
+
+    def _schedule_save(self):
+        if not self.path or self._saver is not None:
+            return
+        with self._lock:
+            if self._saver is None:
+                self._saver = threading.Timer(self.save_interval, self._save_later)
+                self._saver.daemon = True
+                self._saver.start()
+
+    def _save_later(self):
+        with self._lock:
+            self._saver = None
+        self.save()
+
+    def save(self):
+        """Write the index to path atomically"""
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            size = self._size
+            arrays = {
+                "vectors": self._vectors[:size].copy(),
+                "scopes": self._scopes[:size].copy(),
+                "last_used": self._last_used[:size].copy(),
+                "answers": np.array([json.dumps(answer) for answer in self._answers[:size]], dtype=str)
+            }
+            self._dirty = False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix=".npz")
+        with os.fdopen(handle, "wb") as index_file:
+            np.savez(index_file, **arrays)
+        os.replace(temporary, self.path)
+
+    def load(self):
+        with np.load(self.path, allow_pickle=False) as saved:
+            if saved["vectors"].shape[1:] != (self.dimensions,):
+                return
+            # Keep the most recently used entries if the saved index is larger
+            order = np.argsort(saved["last_used"])[::-1][:self.max_entries]
+            size = len(order)
+            with self._lock:
+                self._vectors[:size] = saved["vectors"][order]
+                self._scopes[:size] = saved["scopes"][order]
+                self._last_used[:size] = saved["last_used"][order]
+                self._answers[:size] = [json.loads(answer) for answer in saved["answers"][order]]
+                self._size = size
+
+    def info(self):
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+_semantic_cache = None
+_semantic_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """Return the process-wide semantic cache, or None when SEMANTIC_CACHE_ENABLED is off"""
+    global _semantic_cache
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() != "true":
+        return None
+    if _semantic_cache is None:
+        with _semantic_lock:
+            if _semantic_cache is None:
+                _semantic_cache = SemanticCache(
+                    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+                    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000")),
+                    path=os.getenv("SEMANTIC_CACHE_PATH") or None,
+                    save_interval=float(os.getenv("SEMANTIC_CACHE_SAVE_INTERVAL", "30"))
+                )
+                atexit.register(_semantic_cache.save)
+    return _semantic_cache
+
+
+def reset_semantic_cache():
+    global _semantic_cache
+    with _semantic_lock:
+        _semantic_cache = None
@@ -0,0 +1,168 @@
+"""Production launcher: serves the ASGI app with a pool of workers
+
+By default the app runs under gunicorn with uvicorn workers. The app is
+imported once in the master (PRELOAD) and then forked, so every worker
+shares its memory copy-on-write. Each worker is recycled after about
+MAX_REQUESTS requests (with jitter so they do not restart together),
+SIGHUP replaces the workers one by one without dropping connections, and
+SIGTERM lets in-flight requests finish for up to GRACEFUL_TIMEOUT.
+
+WORKERS and WSGI_THREADS default to "auto". There is one event loop per
+CPU the container may use, and each worker's thread pool for the Flask
+routes is sized by IO_WAIT_RATIO, the time those routes spend waiting on
+the network for each unit of CPU time. SERVER=uvicorn keeps the plain
+uvicorn process pool, which has no preloading or recycling.
+"""
+import gc
+import math
+import os
+import shutil
+
+import uvicorn
+from dotenv import load_dotenv
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+
+def reset_metrics_dir():
+    """Start multi-process metrics from an empty directory, dropping earlier runs' files"""
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def available_cpus():
+    """CPUs this process may run on, honouring affinity and a cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    for path, parse in (("/sys/fs/cgroup/cpu.max", _cgroup2_quota), ("/sys/fs/cgroup/cpu/cpu.cfs_quota_us", _cgroup1_quota)):
+        try:
+            with open(path) as quota_file:
+                quota = parse(quota_file.read())
+        except (OSError, ValueError):
+            continue
+        if quota:
+            return max(1, min(cpus, math.ceil(quota)))
+    return cpus
+
+
+def _cgroup2_quota(text):
+    quota, period = text.split()[:2]
+    return None if quota == "max" else int(quota) / int(period)
+
+
+def _cgroup1_quota(text):
+    quota = int(text)
+    if quota <= 0:
+        return None
+    with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as period_file:
+        return quota / int(period_file.read())
+
+
+def _auto(name, default):
+    value = os.getenv(name, "auto")
+    return default if value.lower() == "auto" else int(value)
+
+
+def settings(cpus=None):
+    """Launch settings from the environment, with the auto-sized counts filled in"""
+    cpus = cpus or available_cpus()
+    io_wait_ratio = float(os.getenv("IO_WAIT_RATIO", "15"))
+    max_requests = int(os.getenv("MAX_REQUESTS", "10000"))
+    return {
+        "server": os.getenv("SERVER", "gunicorn" if BaseApplication is not None else "uvicorn").lower(),
+        "host": os.getenv("HOST", "0.0.0.0"),
+        "port": int(os.getenv("PORT", "5000")),
+        "workers": max(1, _auto("WORKERS", cpus)),
+        # A blocking route needs 1 + wait/compute threads to keep one core busy
+        "wsgi_threads": max(1, _auto("WSGI_THREADS", math.ceil(1 + io_wait_ratio))),
+        "preload": os.getenv("PRELOAD", "true").lower() == "true",
+        "max_requests": max_requests,
+        "max_requests_jitter": int(os.getenv("MAX_REQUESTS_JITTER", str(max_requests // 10))),
+        "graceful_timeout": int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+        "timeout": int(os.getenv("WORKER_TIMEOUT", "60")),
+        "keepalive": int(os.getenv("KEEPALIVE", "5")),
+        "log_level": os.getenv("LOG_LEVEL", "info").lower()
+    }
+
+
+def when_ready(server):
+    # Move the preloaded app out of the collector's reach so collections in
+    # the workers do not write to (and so copy) the pages they share
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+if BaseApplication is not None:
+    class GunicornServer(BaseApplication):
+        """gunicorn configured from a dict instead of the command line"""
+
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from asgi import app
+            return app
+
+
+def gunicorn_options(config):
+    return {
+        "bind": f"{config['host']}:{config['port']}",
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "workers": config["workers"],
+        "preload_app": config["preload"],
+        "max_requests": config["max_requests"],
+        "max_requests_jitter": config["max_requests_jitter"],
+        "graceful_timeout": config["graceful_timeout"],
+        "timeout": config["timeout"],
+        "keepalive": config["keepalive"],
+        "loglevel": config["log_level"],
+        "accesslog": "-" if config["log_level"] == "debug" else None,
+        "forwarded_allow_ips": os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        "when_ready": when_ready,
+        "child_exit": child_exit
+    }
+
+
+def main():
+    load_dotenv()
+    reset_metrics_dir()
+    config = settings()
+    # Read by asgi.py when the app is imported, in the master or in each worker
+    os.environ["WSGI_THREADS"] = str(config["wsgi_threads"])
+
+    if config["server"] == "gunicorn":
+        if BaseApplication is None:
+            raise RuntimeError("The gunicorn package is required for SERVER=gunicorn")
+        GunicornServer(gunicorn_options(config)).run()
+        return
+
+    uvicorn.run(
+        "asgi:app",
+        host=config["host"],
+        port=config["port"],
+        workers=config["workers"],
+        timeout_keep_alive=config["keepalive"],
+        log_level=config["log_level"],
+        proxy_headers=True
+    )
+
+
+if __name__ == "__main__":
+    main()
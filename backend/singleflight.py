@@ -0,0 +1,211 @@
+"""Single-flight coalescing of identical in-flight completion requests"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+# redis is optional and only needed to coalesce across worker processes
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Deletes the lock only if this worker still owns it
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs one call per key at a time and hands its result to every waiter"""
+
+    backend = "local"
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def info(self):
+        return {
+            "backend": self.backend,
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "in_flight": len(self._calls)
+        }
+
+
+class RedisSingleFlight(SingleFlight):
+    """Coalesces within the worker first, then across workers with a Redis lock
+
+    The worker holding the lock publishes its result under a key named
+    after the lock token; other workers poll for it until the lock goes
+    away, and fall back to calling upstream themselves if it never shows.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url, lock_ttl=60, poll_interval=0.05, prefix="autotasker:flight:"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for SINGLEFLIGHT_BACKEND=redis")
+        super().__init__()
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._release = self._redis.register_script(RELEASE_SCRIPT)
+
+    def do(self, key, fn):
+        return super().do(key, lambda: self._do_shared(key, fn))
+
+    def _do_shared(self, key, fn):
+        lock_key = f"{self.prefix}lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = self._redis.set(lock_key, token, nx=True, ex=self.lock_ttl)
+        except redis.RedisError as e:
+            logger.warning("Single-flight lock failed, calling upstream directly: %s", e)
+            return fn()
+
+        if acquired:
+            try:
+                result = fn()
+                try:
+                    self._redis.set(f"{self.prefix}result:{token}", json.dumps(result), ex=self.lock_ttl)
+                except redis.RedisError as e:
+                    # Waiting workers call upstream themselves once the lock goes
+                    logger.warning("Single-flight publish failed: %s", e)
+                return result
+            finally:
+                try:
+                    self._release(keys=[lock_key], args=[token])
+                except redis.RedisError as e:
+                    logger.warning("Single-flight unlock failed: %s", e)
+
+        try:
+            result = self._wait_for_leader(lock_key)
+        except redis.RedisError as e:
+            logger.warning("Single-flight wait failed, calling upstream directly: %s", e)
+            result = None
+        return result if result is not None else fn()
+
+    def _wait_for_leader(self, lock_key):
+        deadline = time.monotonic() + self.lock_ttl
+        owner = None
+        while time.monotonic() < deadline:
+            owner = self._redis.get(lock_key) or owner
+            if owner is not None:
+                data = self._redis.get(f"{self.prefix}result:{owner.decode()}")
+                if data is not None:
+                    return json.loads(data)
+            if not self._redis.exists(lock_key):
+                return None
+            time.sleep(self.poll_interval)
+        return None
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight for the ASGI app
+
+    The shared call runs as its own task, so a waiter that disconnects
+    does not cancel the upstream request for everyone else.
+    """
+
+    backend = "local"
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._calls = {}
+
+    async def do(self, key, fn):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    info = SingleFlight.info
+
+
+_flight = None
+_async_flight = None
+_flight_lock = threading.Lock()
+
+
+def get_flight():
+    """Return the configured process-wide single-flight group, or None when off"""
+    global _flight
+    if os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() != "true":
+        return None
+    if _flight is None:
+        with _flight_lock:
+            if _flight is None:
+                if os.getenv("SINGLEFLIGHT_BACKEND", "local") == "redis":
+                    _flight = RedisSingleFlight(
+                        os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+                        lock_ttl=int(os.getenv("SINGLEFLIGHT_LOCK_TTL", "60"))
+                    )
+                else:
+                    _flight = SingleFlight()
+    return _flight
+
+
+def get_async_flight():
+    """Return the in-process asyncio single-flight group, or None when off
+
+    Cross-worker coalescing through Redis is only available to the WSGI app.
+    """
+    global _async_flight
+    if os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() != "true":
+        return None
+    if _async_flight is None:
+        _async_flight = AsyncSingleFlight()
+    return _async_flight
@@ -0,0 +1,254 @@
+"""Cached status of the services the backend depends on, for /status
+
+A background thread probes the OpenAI upstream, n8n, MongoDB and Redis
+every STATUS_REFRESH_INTERVAL seconds, all at once, each bounded by
+STATUS_PROBE_TIMEOUT. /status returns the last snapshot as it is, so a
+dashboard or healthcheck polling it costs a dictionary lookup and never
+reaches a dependency itself. A snapshot older than STATUS_TTL (the
+refresher died, or the process has not started it yet) is refreshed by
+the first request to see it, while concurrent requests keep getting the
+stale one.
+
+Only configured dependencies are probed: n8n when N8N_URL is set,
+MongoDB when MONGODB_URI is set and Redis when REDIS_URL is set. The
+last STATUS_HISTORY probes of each are kept for latency percentiles and
+availability.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urljoin
+
+import requests
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import pymongo
+except ImportError:
+    pymongo = None
+
+logger = logging.getLogger(__name__)
+
+
+class ProbeError(Exception):
+    """A dependency answered, but not in a way that counts as up"""
+
+
+def models_url(api_url):
+    """The model listing endpoint next to a chat completions URL; cheap and does not bill tokens"""
+    base = api_url.split("/chat/completions")[0].rstrip("/")
+    return base + "/models"
+
+
+def http_probe(url, headers=None):
+    def probe(timeout):
+        response = requests.get(url, headers=headers, timeout=timeout)
+        if response.status_code >= 400:
+            raise ProbeError(f"HTTP {response.status_code}")
+    return probe
+
+
+def openai_probe(api_url, api_key):
+    return http_probe(models_url(api_url), {"Authorization": f"Bearer {api_key}"} if api_key else None)
+
+
+def n8n_probe(url):
+    return http_probe(urljoin(url.rstrip("/") + "/", "healthz"))
+
+
+def mongodb_probe(uri):
+    clients = {}
+
+    def probe(timeout):
+        if pymongo is None:
+            raise ProbeError("pymongo is not installed")
+        # One client per process, kept across probes; its pool reconnects on its own
+        if "client" not in clients:
+            clients["client"] = pymongo.MongoClient(
+                uri, serverSelectionTimeoutMS=int(timeout * 1000), connectTimeoutMS=int(timeout * 1000)
+            )
+        clients["client"].admin.command("ping")
+    return probe
+
+
+def redis_probe(url):
+    clients = {}
+
+    def probe(timeout):
+        if redis is None:
+            raise ProbeError("redis is not installed")
+        if "client" not in clients:
+            clients["client"] = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        clients["client"].ping()
+    return probe
+
+
+class History:
+    """The last few probes of one dependency"""
+
+    def __init__(self, size):
+        self._samples = deque(maxlen=size)
+
+    def add(self, checked_at, latency_ms, up):
+        self._samples.append((checked_at, latency_ms, up))
+
+    def summary(self):
+        samples = list(self._samples)
+        if not samples:
+            return {"samples": 0}
+        latencies = sorted(latency for _, latency, up in samples if up)
+
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+
+        return {
+            "samples": len(samples),
+            "availability": round(sum(up for _, _, up in samples) / len(samples), 4),
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "max": latencies[-1] if latencies else None},
+            "recent": [{"checked_at": checked_at, "latency_ms": latency, "up": up}
+                       for checked_at, latency, up in samples[-10:]]
+        }
+
+
+class StatusMonitor:
+    """Probes dependencies concurrently and serves the latest results"""
+
+    def __init__(self, probes, interval=15.0, ttl=30.0, timeout=2.0, history=60):
+        self.probes = dict(probes)
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+        self._history = {name: History(history) for name in self.probes}
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self.probes)), thread_name_prefix="status-probe")
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot = None
+        self._refreshed = 0.0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="status-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with self._refresh_lock:
+                    self.refresh()
+            except Exception:
+                logger.exception("Status refresh failed")
+            self._stop.wait(self.interval)
+
+    def _probe(self, probe):
+        started = time.perf_counter()
+        try:
+            probe(self.timeout)
+            error = None
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        return round((time.perf_counter() - started) * 1000, 1), error
+
+    def refresh(self):
+        """Probe every dependency at once and publish a new snapshot"""
+        checked_at = time.time()
+        futures = {name: self._executor.submit(self._probe, probe) for name, probe in self.probes.items()}
+        wait(futures.values(), timeout=self.timeout + 0.5)
+
+        dependencies = {}
+        for name, future in futures.items():
+            if future.done():
+                latency_ms, error = future.result()
+            else:
+                # The probe is stuck past its own timeout; it finishes in the background
+                latency_ms, error = None, "Probe timed out"
+            up = error is None
+            self._history[name].add(checked_at, latency_ms, up)
+            dependencies[name] = dict(
+                {"status": "up" if up else "down", "latency_ms": latency_ms, "checked_at": checked_at},
+                **({"error": error} if error else {}),
+                history=self._history[name].summary()
+            )
+
+        down = sorted(name for name, result in dependencies.items() if result["status"] == "down")
+        self._snapshot = {
+            "status": "degraded" if down else "ok",
+            "down": down,
+            "checked_at": checked_at,
+            "dependencies": dependencies
+        }
+        self._refreshed = time.monotonic()
+        return self._snapshot
+
+    def snapshot(self):
+        """The latest results; refreshed inline only when missing or older than the TTL"""
+        if self._snapshot is None or time.monotonic() - self._refreshed > self.ttl:
+            if self._refresh_lock.acquire(blocking=self._snapshot is None):
+                try:
+                    if self._snapshot is None or time.monotonic() - self._refreshed > self.ttl:
+                        self.refresh()
+                finally:
+                    self._refresh_lock.release()
+        snapshot = self._snapshot
+        return dict(snapshot, age=round(time.time() - snapshot["checked_at"], 3))
+
+
+def default_probes():
+    """Probes for the dependencies configured in the environment"""
+    # The router's first target is the upstream requests go to when nothing has failed over
+    from router import get_router
+    target = get_router().routes[0].targets[0]
+    probes = {"openai": openai_probe(os.getenv("STATUS_OPENAI_URL") or target.api_url, target.api_key)}
+    if os.getenv("N8N_URL"):
+        probes["n8n"] = n8n_probe(os.getenv("N8N_URL"))
+    if os.getenv("MONGODB_URI"):
+        probes["mongodb"] = mongodb_probe(os.getenv("MONGODB_URI"))
+    if os.getenv("REDIS_URL"):
+        probes["redis"] = redis_probe(os.getenv("REDIS_URL"))
+    return probes
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor():
+    """Return the process-wide monitor, starting its refresher on first use"""
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = StatusMonitor(
+                    default_probes(),
+                    interval=float(os.getenv("STATUS_REFRESH_INTERVAL", "15")),
+                    ttl=float(os.getenv("STATUS_TTL", "30")),
+                    timeout=float(os.getenv("STATUS_PROBE_TIMEOUT", "2")),
+                    history=int(os.getenv("STATUS_HISTORY", "60"))
+                )
+                if os.getenv("STATUS_REFRESHER", "true").lower() == "true":
+                    _monitor.start()
+                atexit.register(_monitor.stop, 1.0)
+    return _monitor
+
+
+def reset_monitor():
+    global _monitor
+    with _monitor_lock:
+        if _monitor is not None:
+            _monitor.stop(timeout=1.0)
+        _monitor = None
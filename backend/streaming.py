@@ -0,0 +1,193 @@
+"""Server-Sent Events relay for streaming completions from the /ai/* endpoints
+
+Clients opt in with ?stream=1 or an Accept: text/event-stream header. Each
+upstream token is forwarded as a "token" event as soon as it arrives, and a
+final "done" event carries the full text, usage and cache status. Cached
+answers are replayed as a single token event; finished streams are stored
+in the response cache like any other completion.
+"""
+import time
+
+import accounting
+import metrics
+import validation
+
+from completion_service import agoverned, cache_io, governed
+from resilience import CircuitOpen, get_resilience
+from response_cache import cache_key, get_cache
+from router import get_router
+from semantic_cache import get_semantic_cache
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+
+def wants_stream(stream_arg, accept_header):
+    """True when the caller asked for an event stream instead of JSON"""
+    return (stream_arg or "").lower() in ("1", "true") or "text/event-stream" in (accept_header or "")
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {validation.dumps(data).decode()}\n\n"
+
+
+class StreamRelay:
+    """Turns upstream completion chunks into SSE events and reassembles the answer"""
+
+    def __init__(self, field, extra=None):
+        self.field = field
+        self.extra = extra or {}
+        self.parts = []
+        self.usage = None
+        self.model = None
+        self.finish_reason = None
+
+    def feed(self, chunk):
+        """Record one upstream chunk and return the SSE event to forward, if any"""
+        self.model = chunk.get("model", self.model)
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            self.finish_reason = choice.get("finish_reason") or self.finish_reason
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                self.parts.append(content)
+                return sse("token", {"content": content})
+        return None
+
+    def replay(self, response_data):
+        """Load a cached completion and return it as a single token event"""
+        content = response_data["choices"][0]["message"]["content"]
+        self.parts = [content]
+        self.usage = response_data.get("usage")
+        self.model = response_data.get("model")
+        return sse("token", {"content": content})
+
+    def done(self, cache_status):
+        return sse("done", dict({
+            "status": "success",
+            self.field: "".join(self.parts).strip(),
+            "model": self.model,
+            "usage": self.usage,
+            "cache": cache_status
+        }, **self.extra))
+
+    def response_data(self):
+        """Completion-shaped body for the response cache"""
+        return {
+            "model": self.model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(self.parts)},
+                "finish_reason": self.finish_reason
+            }],
+            "usage": self.usage
+        }
+
+
+def stream_completion(payload, field, error_prefix, extra=None, semantic=False):
+    """Yield SSE events for a completion request"""
+    cache = get_cache()
+    key = cache_key(payload)
+    relay = StreamRelay(field, extra)
+
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        yield relay.replay(cached)
+        yield relay.done("HIT")
+        return
+
+    similar = get_semantic_cache() if semantic else None
+    cached = similar.get(payload) if similar is not None else None
+    if cached is not None:
+        yield relay.replay(cached)
+        yield relay.done("SEMANTIC")
+        return
+
+    breaker = get_resilience().breaker
+    try:
+        probe = breaker.allow()
+    except CircuitOpen as e:
+        metrics.record_error(e)
+        yield sse("error", {"status": "error", "message": f"{error_prefix}: {str(e)}"})
+        return
+    try:
+        started = time.monotonic()
+        accounting.check_quota()
+        with governed(payload) as permit:
+            for chunk in get_router().stream(payload):
+                event = relay.feed(chunk)
+                if event:
+                    yield event
+            permit.observe(200, usage=relay.usage)
+        breaker.record()
+        metrics.record_usage(relay.usage, relay.model)
+        accounting.record_call(relay.model, relay.usage, time.monotonic() - started)
+    except Exception as e:
+        breaker.record(e)
+        metrics.record_error(e)
+        yield sse("error", {"status": "error", "message": f"{error_prefix}: {str(e)}"})
+        return
+    finally:
+        breaker.release(probe)
+
+    if cache is not None:
+        cache.set(key, relay.response_data())
+    if similar is not None:
+        similar.set(payload, relay.response_data())
+    yield relay.done("MISS" if cache is not None else "BYPASS")
+
+
+async def astream_completion(payload, field, error_prefix, extra=None, semantic=False):
+    """Async variant of stream_completion for the ASGI app"""
+    cache = get_cache()
+    key = cache_key(payload)
+    relay = StreamRelay(field, extra)
+
+    cached = await cache_io(cache, cache.get, key) if cache is not None else None
+    if cached is not None:
+        yield relay.replay(cached)
+        yield relay.done("HIT")
+        return
+
+    similar = get_semantic_cache() if semantic else None
+    cached = similar.get(payload) if similar is not None else None
+    if cached is not None:
+        yield relay.replay(cached)
+        yield relay.done("SEMANTIC")
+        return
+
+    breaker = get_resilience().breaker
+    try:
+        probe = breaker.allow()
+    except CircuitOpen as e:
+        metrics.record_error(e)
+        yield sse("error", {"status": "error", "message": f"{error_prefix}: {str(e)}"})
+        return
+    try:
+        started = time.monotonic()
+        accounting.check_quota()
+        async with agoverned(payload) as permit:
+            async for chunk in get_router().astream(payload):
+                event = relay.feed(chunk)
+                if event:
+                    yield event
+            permit.observe(200, usage=relay.usage)
+        breaker.record()
+        metrics.record_usage(relay.usage, relay.model)
+        accounting.record_call(relay.model, relay.usage, time.monotonic() - started)
+    except Exception as e:
+        breaker.record(e)
+        metrics.record_error(e)
+        yield sse("error", {"status": "error", "message": f"{error_prefix}: {str(e)}"})
+        return
+    finally:
+        breaker.release(probe)
+
+    if cache is not None:
+        await cache_io(cache, cache.set, key, relay.response_data())
+    if similar is not None:
+        similar.set(payload, relay.response_data())
+    yield relay.done("MISS" if cache is not None else "BYPASS")
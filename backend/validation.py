@@ -0,0 +1,168 @@
+"""Schema-driven request validation and the fast JSON codec
+
+Every route that takes a body names a schema: the type of each field,
+whether it is required and how long it may be. The body is refused when
+its size is over the schema's limit, before it is read; it is then
+decoded (with orjson when installed) and checked before any prompt is
+built, so an oversized or malformed request from a misbehaving workflow
+is rejected for microseconds of CPU instead of being sent upstream as
+tokens. Unknown fields are ignored.
+
+Failures raise ValidationError, which both apps turn into a 4xx response
+with a machine-readable code next to the usual status and message.
+"""
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", str(1024 * 1024)))
+MAX_BULK_BODY_BYTES = int(os.getenv("MAX_BULK_BODY_BYTES", str(16 * 1024 * 1024)))
+# Long documents to summarize, and every other free-text field
+MAX_TEXT_LENGTH = int(os.getenv("MAX_TEXT_LENGTH", "400000"))
+MAX_FIELD_LENGTH = int(os.getenv("MAX_FIELD_LENGTH", "20000"))
+
+TYPE_NAMES = {str: "a string", int: "an integer", list: "a list", dict: "an object"}
+
+
+def loads(data):
+    """Decode JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Encode obj as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str, separators=(",", ":")).encode()
+
+
+class ValidationError(ValueError):
+    """Raised when a request body does not match its schema"""
+
+    def __init__(self, code, message, field=None, status_code=400):
+        super().__init__(message)
+        self.code = code
+        self.field = field
+        self.status_code = status_code
+
+    def body(self):
+        body = {"status": "error", "code": self.code, "message": str(self)}
+        if self.field is not None:
+            body["field"] = self.field
+        return body
+
+
+class Field:
+    """Type, presence and length rule for one body field
+
+    max_length counts characters for strings and items for lists;
+    single_line refuses strings containing CR or LF.
+    """
+
+    def __init__(self, kind=str, required=True, max_length=None, single_line=False):
+        self.kind = kind if isinstance(kind, tuple) else (kind,)
+        self.required = required
+        self.max_length = max_length
+        self.single_line = single_line
+
+    def check(self, name, value):
+        # bool is an int subclass but never a valid count or limit
+        if not isinstance(value, self.kind) or (isinstance(value, bool) and bool not in self.kind):
+            expected = " or ".join(TYPE_NAMES.get(kind, kind.__name__) for kind in self.kind)
+            raise ValidationError("invalid_type", f"{name} must be {expected}", name)
+        if self.max_length is not None and isinstance(value, (str, list)) and len(value) > self.max_length:
+            unit = "characters" if isinstance(value, str) else "items"
+            raise ValidationError("field_too_long", f"{name} is longer than {self.max_length} {unit}", name, 413)
+        if self.single_line and isinstance(value, str) and ("\r" in value or "\n" in value):
+            raise ValidationError("invalid_value", f"{name} must be a single line", name)
+
+
+class Schema:
+    """The fields of one JSON object body and its size limit"""
+
+    def __init__(self, fields, max_bytes=None):
+        self.fields = fields
+        self.max_bytes = max_bytes or MAX_BODY_BYTES
+
+    def check_size(self, content_length):
+        """Refuse a body from its declared length, before reading it"""
+        try:
+            length = int(content_length) if content_length is not None else None
+        except ValueError:
+            raise ValidationError("invalid_content_length", "Content-Length must be an integer")
+        if length is not None and length > self.max_bytes:
+            raise self.too_large()
+
+    def too_large(self):
+        return ValidationError("body_too_large", f"Request body is larger than {self.max_bytes} bytes", status_code=413)
+
+    def parse(self, body):
+        """Decode a raw body and validate it; returns the decoded object"""
+        if len(body) > self.max_bytes:
+            raise self.too_large()
+        try:
+            data = loads(body)
+        except ValueError:
+            raise ValidationError("invalid_json", "Request body is not valid JSON")
+        return self.validate(data)
+
+    def validate(self, data):
+        if not isinstance(data, dict):
+            raise ValidationError("invalid_json", "Request body must be a JSON object")
+        missing = [name for name, field in self.fields.items() if field.required and data.get(name) is None]
+        if missing:
+            raise ValidationError("missing_field", f"Missing required fields: {' and '.join(missing)}", missing[0])
+        for name, field in self.fields.items():
+            if data.get(name) is not None:
+                field.check(name, data[name])
+        return data
+
+
+SCHEMAS = {
+    "summary": Schema({
+        "text": Field(str, max_length=MAX_TEXT_LENGTH)
+    }),
+    "post_social": Schema({
+        "content": Field(str, max_length=MAX_FIELD_LENGTH),
+        "platform": Field(str, max_length=50)
+    }),
+    "screen_resume": Schema({
+        "resume": Field(str, max_length=MAX_FIELD_LENGTH),
+        "job_description": Field(str, max_length=MAX_FIELD_LENGTH)
+    }),
+    "batch": Schema({
+        "items": Field(list),
+        "concurrency": Field(int, required=False)
+    }, max_bytes=MAX_BULK_BODY_BYTES),
+    "job": Schema({
+        "priority": Field(str, required=False, max_length=20),
+        "callback_url": Field(str, required=False, max_length=2048)
+    }),
+    "notification": Schema({
+        "subject": Field(str, max_length=998, single_line=True),
+        "message": Field(str, max_length=MAX_FIELD_LENGTH),
+        "channel": Field(str, required=False, max_length=50),
+        "to": Field((str, list), required=False, max_length=100),
+        "data": Field(dict, required=False)
+    }),
+    "job_description": Schema({
+        "job_description": Field(str, max_length=MAX_FIELD_LENGTH),
+        "title": Field(str, required=False, max_length=200)
+    }),
+    "screening": Schema({
+        "resumes": Field(list),
+        "top_k": Field(int, required=False)
+    }, max_bytes=MAX_BULK_BODY_BYTES),
+    # Workflow triggers take any JSON object; their nodes check the fields they use
+    "webhook": Schema({}),
+    "profiler": Schema({
+        "interval": Field((int, float), required=False),
+        "duration": Field((int, float), required=False)
+    })
+}
@@ -0,0 +1,538 @@
+"""In-process executor for the workflows/*.json definitions
+
+Each definition is compiled once into a DAG: nodes, the edges between
+their outputs, and their parameters with every "={{ ... }}" expression
+parsed. A POST to /webhook/<path> then runs the workflow whose trigger
+has that path inside the backend. HTTP Request nodes aimed at the backend
+call the route's code directly instead of going out over the network,
+and a node starts as soon as all of its inputs have finished, so
+independent branches run concurrently.
+
+Both definition formats in workflows/ are read: the compact one (nodes
+with ids, connections as {"source", "target"} pairs) and n8n's export
+format (typed nodes, connections keyed by node name and output).
+
+Only what can run without n8n compiles: Webhook triggers, Function nodes
+that return an object of expressions, HTTP requests, If and Respond to
+Webhook nodes, with expressions that read fields of $json, $input or
+$node["Name"].json and fall back with ||. Anything else is reported as a
+compile error from /workflows, and that workflow stays on n8n.
+"""
+import glob
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from urllib.parse import urlsplit
+
+import requests
+
+import batch
+import notifications
+import validation
+
+NODE_TYPES = {
+    "webhook": "webhook",
+    "n8n-nodes-base.webhook": "webhook",
+    "function": "function",
+    "n8n-nodes-base.function": "function",
+    "http request": "http",
+    "n8n-nodes-base.httprequest": "http",
+    "if": "if",
+    "n8n-nodes-base.if": "if",
+    "respond to webhook": "respond",
+    "n8n-nodes-base.respondtowebhook": "respond"
+}
+
+
+class WorkflowError(ValueError):
+    """Raised when a workflow definition cannot be compiled to run in-process"""
+
+
+class NodeFailed(Exception):
+    """Raised when a node fails while a workflow runs; cause is the original error"""
+
+    def __init__(self, node, cause):
+        super().__init__(f"Node {node!r} failed: {cause}")
+        self.node = node
+        self.cause = cause
+
+
+# Expressions: a path into $json, $input or $node["Name"].json, or a
+# literal, with || choosing the first truthy alternative as in JavaScript
+
+ROOT_PATTERN = re.compile(r"""\$(json|input)|\$node\[\s*(["'])(.+?)\2\s*\]\.json|\$node\.(\w+)\.json""")
+ACCESSOR_PATTERN = re.compile(r"""\s*(?:\.(\w+)|\[\s*(["'])(.*?)\2\s*\]|\[\s*(\d+)\s*\])""")
+LITERALS = {"true": True, "false": False, "null": None, "undefined": None}
+
+
+def _literal(text):
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    if text in LITERALS:
+        return LITERALS[text]
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        raise WorkflowError(f"Unsupported expression: {text}")
+
+
+def _path(text):
+    """Compile one $-path or literal into a function of the node context"""
+    root = ROOT_PATTERN.match(text)
+    if root is None:
+        value = _literal(text)
+        return lambda context: value
+    node_name = root.group(3) or root.group(4)
+    steps = []
+    position = root.end()
+    while position < len(text):
+        step = ACCESSOR_PATTERN.match(text, position)
+        if step is None:
+            raise WorkflowError(f"Unsupported expression: {text}")
+        name = step.group(1) or step.group(3)
+        steps.append(int(step.group(4)) if step.group(4) is not None else name)
+        position = step.end()
+
+    def evaluate(context):
+        value = context["nodes"].get(node_name) if node_name else context["json"]
+        for step in steps:
+            if isinstance(value, dict):
+                value = value.get(step) if isinstance(step, str) else value.get(str(step))
+            elif isinstance(value, list) and isinstance(step, int) and step < len(value):
+                value = value[step]
+            else:
+                return None
+        return value
+    return evaluate
+
+
+def compile_expression(text):
+    """Compile a JavaScript-style expression of paths and literals joined by ||"""
+    alternatives = [_path(part.strip()) for part in text.split("||")]
+
+    def evaluate(context):
+        value = None
+        for alternative in alternatives:
+            value = alternative(context)
+            if value:
+                return value
+        return value
+    return evaluate
+
+
+TEMPLATE_PATTERN = re.compile(r"\{\{(.*?)\}\}", re.S)
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def compile_value(value):
+    """Compile a parameter: strings starting with "=" are templates, containers are compiled throughout"""
+    if isinstance(value, dict):
+        fields = {key: compile_value(item) for key, item in value.items()}
+        return lambda context: {key: field(context) for key, field in fields.items()}
+    if isinstance(value, list):
+        items = [compile_value(item) for item in value]
+        return lambda context: [item(context) for item in items]
+    if not isinstance(value, str) or not value.startswith("="):
+        return lambda context: value
+
+    template = value[1:]
+    whole = TEMPLATE_PATTERN.fullmatch(template.strip())
+    if whole:
+        # A lone expression keeps its type instead of becoming text
+        return compile_expression(whole.group(1).strip())
+    parts = []
+    position = 0
+    for match in TEMPLATE_PATTERN.finditer(template):
+        literal = template[position:match.start()]
+        parts.append(lambda context, literal=literal: literal)
+        expression = compile_expression(match.group(1).strip())
+        parts.append(lambda context, expression=expression: _text(expression(context)))
+        position = match.end()
+    tail = template[position:]
+    parts.append(lambda context: tail)
+    return lambda context: "".join(part(context) for part in parts)
+
+
+def _split_fields(text):
+    """Split an object literal's body on its top-level commas"""
+    fields, depth, quote, start = [], 0, None, 0
+    for index, char in enumerate(text):
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == "," and depth == 0:
+            fields.append(text[start:index])
+            start = index + 1
+    fields.append(text[start:])
+    return [field for field in fields if field.strip()]
+
+
+FUNCTION_PATTERN = re.compile(r"^\s*return\s*\{(.*)\}\s*;?\s*$", re.S)
+
+
+def compile_function(code):
+    """Compile a Function node whose code is `return { field: expression, ... };`"""
+    match = FUNCTION_PATTERN.match(code or "")
+    if match is None:
+        raise WorkflowError("only `return { field: expression }` Function code runs in-process")
+    fields = {}
+    for field in _split_fields(match.group(1)):
+        key, separator, expression = field.partition(":")
+        if not separator:
+            raise WorkflowError(f"Unsupported Function field: {field.strip()}")
+        fields[key.strip().strip("'\"")] = compile_expression(expression.strip())
+    return lambda context: {key: expression(context) for key, expression in fields.items()}
+
+
+# Backend routes an HTTP Request node calls in-process
+
+def _notify(body):
+    validation.SCHEMAS["notification"].validate(body)
+    notification = notifications.new_notification(body, notifications.default_channel())
+    notifications.get_dispatcher().submit(notification)
+    return {
+        "status": "success",
+        "message": "Notification queued for delivery",
+        "notification": {key: notification[key] for key in ("id", "channel", "subject", "message")}
+    }
+
+
+BACKEND_ROUTES = {
+    "/ai/summary": lambda body: batch.run_task("summary", body),
+    "/ai/post_social": lambda body: batch.run_task("post_social", body),
+    "/ai/screen_resume": lambda body: batch.run_task("screen_resume", body),
+    "/notification/send": _notify
+}
+
+
+def backend_hosts():
+    return {host.strip() for host in os.getenv(
+        "WORKFLOW_BACKEND_HOSTS", "backend:5000,localhost:5000,127.0.0.1:5000"
+    ).split(",") if host.strip()}
+
+
+def _parameter_list(parameters, name):
+    """n8n's {"parameters": [{"name", "value"}]} lists as a dict"""
+    return {item["name"]: item.get("value") for item in (parameters.get(name) or {}).get("parameters", [])}
+
+
+def compile_http(parameters):
+    url = parameters.get("url")
+    if not isinstance(url, str) or url.startswith("="):
+        raise WorkflowError("HTTP Request nodes need a fixed url")
+    if "bodyParameters" in parameters:
+        body = compile_value(_parameter_list(parameters, "bodyParameters"))
+    else:
+        body = compile_value(parameters.get("body")) if parameters.get("body") is not None else None
+    headers = compile_value(_parameter_list(parameters, "headerParameters"))
+    method = (parameters.get("method") or parameters.get("requestMethod") or ("POST" if body else "GET")).upper()
+
+    parts = urlsplit(url)
+    if parts.netloc in backend_hosts():
+        handler = BACKEND_ROUTES.get(parts.path)
+        if handler is None:
+            raise WorkflowError(f"The backend has no in-process route for {parts.path}")
+        # Backend nodes skip HTTP entirely: the body goes straight to the route's code
+        return lambda context: handler(body(context) if body else {})
+
+    timeout = float(os.getenv("WORKFLOW_HTTP_TIMEOUT", "30"))
+
+    def call(context):
+        response = requests.request(method, url, json=body(context) if body else None,
+                                    headers={key: _text(value) for key, value in headers(context).items()},
+                                    timeout=timeout)
+        response.raise_for_status()
+        try:
+            return response.json()
+        except ValueError:
+            return {"data": response.text}
+    return call
+
+
+CONDITION_OPERATIONS = {
+    "equal": lambda a, b: a == b,
+    "notEqual": lambda a, b: a != b,
+    "contains": lambda a, b: str(b) in str(a),
+    "notContains": lambda a, b: str(b) not in str(a),
+    "startsWith": lambda a, b: str(a).startswith(str(b)),
+    "endsWith": lambda a, b: str(a).endswith(str(b)),
+    "isEmpty": lambda a, b: a in (None, "", [], {}),
+    "isNotEmpty": lambda a, b: a not in (None, "", [], {}),
+    "larger": lambda a, b: a is not None and b is not None and a > b,
+    "largerEqual": lambda a, b: a is not None and b is not None and a >= b,
+    "smaller": lambda a, b: a is not None and b is not None and a < b,
+    "smallerEqual": lambda a, b: a is not None and b is not None and a <= b
+}
+
+
+def compile_if(parameters):
+    checks = []
+    for kind, conditions in (parameters.get("conditions") or {}).items():
+        for condition in conditions:
+            operation = condition.get("operation", "equal")
+            if operation not in CONDITION_OPERATIONS:
+                raise WorkflowError(f"Unsupported If operation: {operation}")
+            checks.append((CONDITION_OPERATIONS[operation], compile_value(condition.get("value1")),
+                           compile_value(condition.get("value2"))))
+    combine = any if parameters.get("combineOperation") == "any" else all
+    return lambda context: combine(check(left(context), right(context)) for check, left, right in checks)
+
+
+def compile_respond(parameters):
+    body = compile_value(parameters.get("responseBody", "={{ $json }}"))
+    if parameters.get("respondWith", "json") != "json":
+        return lambda context: {"data": _text(body(context))}
+
+    def respond(context):
+        value = body(context)
+        return json.loads(value) if isinstance(value, str) else value
+    return respond
+
+
+class Node:
+    """One compiled node: run(context) returns (output json, chosen output index or None for all)"""
+
+    def __init__(self, node_id, name, kind, parameters):
+        self.id = node_id
+        self.name = name
+        self.kind = kind
+        self.parameters = parameters
+        try:
+            self._run = self._compile()
+        except WorkflowError as e:
+            raise WorkflowError(f"Node {name!r}: {e}")
+
+    def _compile(self):
+        if self.kind == "webhook":
+            return lambda context: context["json"]
+        if self.kind == "function":
+            return compile_function(self.parameters.get("functionCode"))
+        if self.kind == "http":
+            return compile_http(self.parameters)
+        if self.kind == "respond":
+            return compile_respond(self.parameters)
+        return compile_if(self.parameters)
+
+    def run(self, context):
+        if self.kind == "if":
+            return context["json"], 0 if self._run(context) else 1
+        return self._run(context), None
+
+
+def normalize(definition):
+    """(nodes, edges) from either definition format; edges are (source id, output index, target id)"""
+    nodes = definition.get("nodes") or []
+    by_name = {node.get("name"): node for node in nodes}
+    connections = definition.get("connections") or []
+    edges = []
+    if isinstance(connections, list):
+        for connection in connections:
+            edges.append((str(connection["source"]), int(connection.get("output", 0)), str(connection["target"])))
+    else:
+        for source_name, outputs in connections.items():
+            if source_name not in by_name:
+                raise WorkflowError(f"Connection from unknown node {source_name!r}")
+            for index, targets in enumerate(outputs.get("main", [])):
+                for target in targets or []:
+                    if target["node"] not in by_name:
+                        raise WorkflowError(f"Connection to unknown node {target['node']!r}")
+                    edges.append((str(by_name[source_name]["id"]), index, str(by_name[target["node"]]["id"])))
+    return nodes, edges
+
+
+class Workflow:
+    """A definition compiled into a DAG, ready to run once per trigger"""
+
+    def __init__(self, definition, slug=None):
+        self.name = definition.get("name") or slug
+        self.slug = slug
+        raw_nodes, edges = normalize(definition)
+        self.nodes = {}
+        for raw in raw_nodes:
+            kind = NODE_TYPES.get(str(raw.get("type", "")).lower())
+            if kind is None:
+                raise WorkflowError(f"Node {raw.get('name')!r}: {raw.get('type')} nodes only run on n8n")
+            node = Node(str(raw["id"]), raw.get("name") or str(raw["id"]), kind, raw.get("parameters") or {})
+            self.nodes[node.id] = node
+
+        triggers = [node for node in self.nodes.values() if node.kind == "webhook"]
+        if len(triggers) != 1:
+            raise WorkflowError("A workflow needs exactly one Webhook trigger")
+        self.trigger = triggers[0]
+        self.path = str(self.trigger.parameters.get("path") or slug).strip("/")
+        self.response_mode = self.trigger.parameters.get("responseMode", "lastNode")
+
+        self.outgoing = {node_id: [] for node_id in self.nodes}
+        self.incoming = {node_id: [] for node_id in self.nodes}
+        for source, output, target in edges:
+            if source not in self.nodes or target not in self.nodes:
+                raise WorkflowError(f"Connection between unknown nodes {source!r} and {target!r}")
+            self.outgoing[source].append((output, target))
+            self.incoming[target].append(source)
+        self.order = self._topological_order()
+
+    def _topological_order(self):
+        waiting = {node_id: len(sources) for node_id, sources in self.incoming.items()}
+        if waiting[self.trigger.id]:
+            raise WorkflowError("The Webhook trigger cannot have inputs")
+        order, ready = [], [self.trigger.id]
+        while ready:
+            node_id = ready.pop()
+            order.append(node_id)
+            for _, target in self.outgoing[node_id]:
+                waiting[target] -= 1
+                if waiting[target] == 0:
+                    ready.append(target)
+        stuck = [self.nodes[node_id].name for node_id in self.nodes if node_id not in order]
+        if stuck:
+            raise WorkflowError(f"Nodes in a cycle or not reachable from the trigger: {', '.join(stuck)}")
+        return order
+
+    def run(self, trigger_data, executor):
+        """Run every reachable node and return (response, per-node report)
+
+        A node waits for all of its inputs; its $json is the output of the
+        first input (in connection order) that delivered, and it is skipped
+        when none did, as behind the branch an If node did not take.
+        """
+        outputs, report, deliveries = {}, {}, {node_id: [] for node_id in self.nodes}
+        waiting = {node_id: len(sources) for node_id, sources in self.incoming.items()}
+        running = {}
+
+        def start(node_id, data):
+            context = {"json": data, "nodes": {self.nodes[done].name: value for done, value in outputs.items()}}
+            running[executor.submit(copy_context().run, self._run_node, self.nodes[node_id], context)] = node_id
+
+        def finish(node_id, output, chosen):
+            for index, target in self.outgoing[node_id]:
+                if output is not None and (chosen is None or index == chosen):
+                    deliveries[target].append(output)
+                waiting[target] -= 1
+                if waiting[target] == 0:
+                    if deliveries[target]:
+                        start(target, deliveries[target][0])
+                    else:
+                        report[self.nodes[target].name] = {"status": "skipped"}
+                        finish(target, None, None)
+
+        start(self.trigger.id, trigger_data)
+        try:
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node_id = running.pop(future)
+                    output, chosen, seconds = future.result()
+                    outputs[node_id] = output
+                    report[self.nodes[node_id].name] = {"status": "succeeded", "ms": round(seconds * 1000, 1)}
+                    finish(node_id, output, chosen)
+        finally:
+            for future in running:
+                future.cancel()
+        return self._response(outputs), report
+
+    @staticmethod
+    def _run_node(node, context):
+        started = time.perf_counter()
+        try:
+            output, chosen = node.run(context)
+        except Exception as e:
+            raise NodeFailed(node.name, e)
+        return output, chosen, time.perf_counter() - started
+
+    def _response(self, outputs):
+        if self.response_mode == "responseNode":
+            for node_id in reversed(self.order):
+                if node_id in outputs and self.nodes[node_id].kind == "respond":
+                    return outputs[node_id]
+            return None
+        for node_id in reversed(self.order):
+            if node_id in outputs:
+                return outputs[node_id]
+        return None
+
+    def info(self):
+        return {"name": self.name, "path": self.path, "nodes": len(self.nodes), "compiled": True}
+
+
+class Registry:
+    """Every workflow in a directory, compiled, keyed by its webhook path"""
+
+    def __init__(self, directory, concurrency=8):
+        self.directory = directory
+        self.workflows = {}
+        self.errors = {}
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="workflow")
+        for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            slug = os.path.splitext(os.path.basename(path))[0]
+            try:
+                with open(path) as definition_file:
+                    workflow = Workflow(json.load(definition_file), slug)
+                if workflow.path in self.workflows:
+                    raise WorkflowError(f"Webhook path {workflow.path!r} is already used by "
+                                        f"{self.workflows[workflow.path].slug}")
+            except (WorkflowError, ValueError, KeyError, TypeError) as e:
+                self.errors[slug] = str(e)
+                continue
+            self.workflows[workflow.path] = workflow
+
+    def get(self, path):
+        return self.workflows.get(path.strip("/"))
+
+    def run(self, workflow, trigger_data):
+        return workflow.run(trigger_data, self.executor)
+
+    def info(self):
+        listed = {workflow.slug: workflow.info() for workflow in self.workflows.values()}
+        for slug, error in self.errors.items():
+            listed[slug] = {"compiled": False, "error": error}
+        return listed
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide registry compiled from WORKFLOWS_DIR"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = Registry(
+                    os.getenv("WORKFLOWS_DIR", os.path.join(os.path.dirname(__file__), "..", "workflows")),
+                    concurrency=int(os.getenv("WORKFLOW_CONCURRENCY", "8"))
+                )
+    return _registry
+
+
+def reset_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry.close()
+        _registry = None
@@ -32,134 +32,58 @@ const ClockIcon = ({ className }: { className?: string }) => (
   </svg>
 );
 
-// Mock service status data
-const mockServices: ServiceStatusType[] = [
-  {
-    id: '1',
-    name: 'API Gateway',
-    status: 'online',
-    lastCheck: new Date(),
-    responseTime: 45,
-    uptime: 99.9,
-    description: 'Main API gateway handling all requests',
-    healthChecks: [
-      {
-        id: '1',
-        name: 'HTTP Response',
-        status: 'passing',
-        message: 'OK',
-        timestamp: new Date(),
-      },
-      {
-        id: '2',
-        name: 'Database Connection',
-        status: 'passing',
-        message: 'Connected',
-        timestamp: new Date(),
-      },
-    ],
-  },
-  {
-    id: '2',
-    name: 'Workflow Engine',
-    status: 'online',
-    lastCheck: new Date(Date.now() - 30000),
-    responseTime: 125,
-    uptime: 98.7,
-    description: 'Core workflow execution engine',
-    healthChecks: [
-      {
-        id: '3',
-        name: 'Queue Processing',
-        status: 'passing',
-        message: 'Processing 23 jobs',
-        timestamp: new Date(),
-      },
-      {
-        id: '4',
-        name: 'Memory Usage',
-        status: 'warning',
-        message: '78% memory usage',
-        timestamp: new Date(),
-      },
-    ],
-  },
-  {
-    id: '3',
-    name: 'Email Service',
-    status: 'degraded',
-    lastCheck: new Date(Date.now() - 120000),
-    responseTime: 850,
-    uptime: 95.2,
-    description: 'Email sending and delivery service',
-    healthChecks: [
-      {
-        id: '5',
-        name: 'SMTP Connection',
-        status: 'failing',
-        message: 'Connection timeout',
-        timestamp: new Date(),
-      },
-      {
-        id: '6',
-        name: 'Queue Size',
-        status: 'warning',
-        message: '1,245 pending emails',
-        timestamp: new Date(),
-      },
-    ],
-  },
-  {
-    id: '4',
-    name: 'File Storage',
-    status: 'maintenance',
-    lastCheck: new Date(Date.now() - 300000),
-    responseTime: undefined,
-    uptime: 99.5,
-    description: 'File upload and storage service',
-    healthChecks: [
-      {
-        id: '7',
-        name: 'Storage Capacity',
-        status: 'passing',
-        message: '45% used',
-        timestamp: new Date(Date.now() - 300000),
-      },
-      {
-        id: '8',
-        name: 'Upload Endpoint',
-        status: 'failing',
-        message: 'Service unavailable',
-        timestamp: new Date(Date.now() - 300000),
-      },
-    ],
-  },
-  {
-    id: '5',
-    name: 'Authentication Service',
-    status: 'online',
-    lastCheck: new Date(Date.now() - 15000),
-    responseTime: 67,
-    uptime: 99.99,
-    description: 'User authentication and authorization',
-    healthChecks: [
-      {
-        id: '9',
-        name: 'Login Endpoint',
-        status: 'passing',
-        message: 'OK',
-        timestamp: new Date(),
-      },
-      {
-        id: '10',
-        name: 'Token Validation',
-        status: 'passing',
-        message: 'All tokens valid',
-        timestamp: new Date(),
-      },
-    ],
-  },
-];
+const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:5000';
+
+const DEPENDENCY_NAMES: Record<string, string> = {
+  openai: 'OpenAI API',
+  n8n: 'n8n Workflow Engine',
+  mongodb: 'MongoDB',
+  redis: 'Redis',
+};
+
+interface DependencyStatus {
+  status: 'up' | 'down';
+  latency_ms: number | null;
+  checked_at: number;
+  error?: string;
+  history: {
+    samples: number;
+    availability?: number;
+    latency_ms?: { p50: number | null; p95: number | null; max: number | null };
+  };
+}
+
+// One call to the backend's cached /status instead of probing each service from the browser
+const toServices = (dependencies: Record<string, DependencyStatus>): ServiceStatusType[] =>
+  Object.entries(dependencies).map(([name, dependency]) => {
+    const checkedAt = new Date(dependency.checked_at * 1000);
+    const { availability, latency_ms: latency } = dependency.history;
+    return {
+      id: name,
+      name: DEPENDENCY_NAMES[name] || name,
+      status: dependency.status === 'up' ? 'online' : 'offline',
+      lastCheck: checkedAt,
+      responseTime: dependency.latency_ms ?? undefined,
+      uptime: availability !== undefined ? Math.round(availability * 1000) / 10 : undefined,
+      description: 'Probed in the background by the backend',
+      healthChecks: [
+        {
+          id: `${name}-probe`,
+          name: 'Reachability',
+          status: dependency.status === 'up' ? 'passing' : 'failing',
+          message: dependency.error || 'OK',
+          timestamp: checkedAt,
+        },
+        {
+          id: `${name}-latency`,
+          name: 'Latency (p50 / p95)',
+          status: 'passing',
+          message: latency?.p50 != null ? `${latency.p50} ms / ${latency.p95} ms` : 'No successful probes yet',
+          timestamp: checkedAt,
+        },
+      ],
+    };
+  });
 
 const StatusIndicator: React.FC<{ status: string }> = ({ status }) => {
   const getIcon = () => {
@@ -213,9 +137,12 @@ export const ServiceStatus: React.FC = () => {
   const loadServices = async () => {
     setIsLoading(true);
     try {
-      // Simulate API call
-      await new Promise(resolve => setTimeout(resolve, 1000));
-      setServices(mockServices);
+      const response = await fetch(`${API_BASE_URL}/status`);
+      if (!response.ok) {
+        throw new Error(`Status request failed with HTTP ${response.status}`);
+      }
+      const body = await response.json();
+      setServices(toServices(body.dependencies));
       setLastRefresh(new Date());
     } catch (error) {
       console.error('Error loading services:', error);
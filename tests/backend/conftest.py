@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+# Backend modules are imported flat, the same way app.py imports them
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+
+def reset_backend_state():
+    """Drop the process-wide singletons so each test starts from the environment"""
+    import accounting
+    import completion_client
+    import governor
+    import history
+    import jobs
+    import notifications
+    import profiler
+    import replay
+    import resilience
+    import response_cache
+    import router
+    import screening
+    import semantic_cache
+    import status
+    import workflow_engine
+
+    accounting.reset_accounting()
+    response_cache.reset_cache()
+    semantic_cache.reset_semantic_cache()
+    governor.reset_governor()
+    resilience.reset_resilience()
+    completion_client.reset_client()
+    router.reset_router()
+    jobs.reset_queue()
+    notifications.reset_dispatcher()
+    screening.reset_store()
+    workflow_engine.reset_registry()
+    status.reset_monitor()
+    history.reset_history()
+    replay.reset_recording()
+    profiler.reset_profiler()
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Local fake OpenAI upstream with the backend configured to call it"""
+    import app as wsgi
+    from fake_upstream import FakeUpstream
+
+    server = FakeUpstream().start()
+    monkeypatch.setattr(wsgi, "OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_API_URL", server.url)
+    reset_backend_state()
+    yield server
+    reset_backend_state()
+    server.stop()
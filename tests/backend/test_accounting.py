@@ -0,0 +1,173 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+import accounting
+import app as wsgi
+import asgi
+import auth
+
+
+def jwt(claims, secret):
+    def b64(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+    signing_input = f"{b64({'alg': 'HS256', 'typ': 'JWT'})}.{b64(claims)}"
+    signature = hmac.new(secret.encode(), signing_input.encode(), hashlib.sha256).digest()
+    return f"{signing_input}.{base64.urlsafe_b64encode(signature).rstrip(b'=').decode()}"
+
+
+@pytest.fixture
+def secured(upstream, monkeypatch):
+    monkeypatch.setenv("API_KEY_SECRET", "key-secret")
+    monkeypatch.setenv("JWT_SECRET", "jwt-secret")
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "false")
+    return upstream
+
+
+def post(client, key, index=0):
+    return client.post("/ai/post_social", json={"content": f"Launch {index}", "platform": "x"},
+                       headers={"X-API-Key": key} if key else {})
+
+
+def test_open_when_no_secret_is_set_and_usage_is_still_ledgered(upstream):
+    client = wsgi.app.test_client()
+    assert post(client, None).status_code == 200
+
+    report = client.get("/usage?key=anonymous&bucket=minute").json
+    assert report["totals"]["calls"] == 1
+    assert report["totals"]["total_tokens"] == 13
+    assert report["usage"][0]["key"] == "anonymous"
+
+
+def test_keys_and_tokens_are_verified(secured):
+    client = wsgi.app.test_client()
+    key = auth.issue_key("email-flow")
+
+    assert post(client, None).json["code"] == "unauthorized"
+    assert post(client, key[:-2] + "xx").status_code == 401
+    assert post(client, key).status_code == 200
+
+    token = jwt({"sub": "social-flow", "exp": time.time() + 60}, "jwt-secret")
+    assert client.post("/ai/post_social", json={"content": "Launch", "platform": "x"},
+                       headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert auth.verify_jwt(jwt({"sub": "social-flow", "exp": time.time() - 1}, "jwt-secret"), "jwt-secret") is None
+    assert auth.verify_jwt(token, "other-secret") is None
+    # Routes outside /ai/ stay open
+    assert client.get("/").status_code == 200
+
+
+def test_native_routes_are_authenticated(secured):
+    async def run(headers):
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as http:
+            return await http.post("/ai/summary", json={"text": "An email"}, headers=headers)
+
+    assert asyncio.run(run({})).status_code == 401
+    response = asyncio.run(run({"Authorization": f"Bearer {auth.issue_key('email-flow')}"}))
+    assert response.status_code == 200
+
+
+def test_request_quota_is_per_key(secured, monkeypatch):
+    monkeypatch.setenv("QUOTA_REQUESTS_PER_MINUTE", "2")
+    client = wsgi.app.test_client()
+    noisy, quiet = auth.issue_key("noisy"), auth.issue_key("quiet")
+
+    assert [post(client, noisy, index).status_code for index in range(3)] == [200, 200, 429]
+    response = post(client, noisy, 3)
+    assert response.json["code"] == "quota_exceeded"
+    assert response.json["limit"] == "requests_per_minute"
+    assert 1 <= int(response.headers["Retry-After"]) <= 60
+    assert secured.requests == 2
+
+    assert post(client, quiet).status_code == 200
+    # Polling is authenticated but not counted
+    assert client.get("/ai/jobs/missing", headers={"X-API-Key": noisy}).status_code == 404
+
+
+def test_token_quota_stops_a_batch_midway(secured, monkeypatch):
+    monkeypatch.setenv("QUOTA_TOKENS_PER_MINUTE", "30")
+    client = wsgi.app.test_client()
+    key = auth.issue_key("batch-flow")
+
+    response = client.post("/ai/batch/post_social", headers={"X-API-Key": key}, json={
+        "platform": "x", "concurrency": 1, "items": [{"content": f"Launch {index}"} for index in range(5)]
+    })
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    # 13 tokens per call: the third call starts at 26 of 30, so the fourth is refused
+    assert [line["status"] for line in lines] == ["success"] * 3 + ["error"] * 2
+    assert {line["code"] for line in lines[3:]} == {"quota_exceeded"}
+    assert secured.requests == 3
+
+    quota = client.get("/usage", headers={"X-API-Key": key}).json["quota"]
+    assert quota["tokens_per_minute"] == {"limit": 30, "used": 39, "resets_in": quota["tokens_per_minute"]["resets_in"]}
+    assert post(client, key).json["limit"] == "tokens_per_minute"
+
+
+def test_usage_is_scoped_to_the_caller(secured, monkeypatch):
+    monkeypatch.setenv("ADMIN_API_KEYS", "ops")
+    client = wsgi.app.test_client()
+    alice, bob, ops = auth.issue_key("alice"), auth.issue_key("bob"), auth.issue_key("ops")
+    post(client, alice)
+    post(client, alice, 1)
+    post(client, bob)
+
+    report = client.get("/usage", headers={"X-API-Key": alice}).json
+    assert report["key"] == "alice" and report["totals"]["calls"] == 2
+    assert report["quota"]["requests_per_minute"]["used"] == 2
+    assert client.get("/usage?key=bob", headers={"X-API-Key": alice}).status_code == 403
+    assert client.get("/usage").status_code == 401
+
+    everyone = client.get("/usage?bucket=day", headers={"X-API-Key": ops}).json
+    assert {row["key"]: row["calls"] for row in everyone["usage"]} == {"alice": 2, "bob": 1}
+    assert client.get("/usage?bucket=week", headers={"X-API-Key": ops}).status_code == 400
+    for since in ("1e20", "inf", "nan", "soon"):
+        assert client.get(f"/usage?since={since}", headers={"X-API-Key": ops}).status_code == 400
+
+
+def test_memory_store_checks_every_window_before_charging():
+    store = accounting.MemoryQuotaStore()
+    counters = [("requests", 2, 60, 1), ("tokens", 10, 60, 0)]
+    assert store.consume(counters, now=100.0) is None
+    store.charge([("tokens", 10, 60, 10)], now=100.0)
+    assert store.consume(counters, now=101.0) == 1
+    # The refused request was not counted
+    assert store.values(["requests", "tokens"], now=101.0) == [1, 10]
+    assert store.values(["requests", "tokens"], now=161.0) == [0, 0]
+
+
+def test_coalesced_callers_keep_their_own_deadline_and_are_each_charged(secured, monkeypatch):
+    monkeypatch.setenv("ADMIN_API_KEYS", "ops")
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "1")
+    secured.latency = 0.4
+    client = wsgi.app.test_client()
+    alice, bob, ops = auth.issue_key("alice"), auth.issue_key("bob"), auth.issue_key("ops")
+    statuses = {}
+
+    def call(key_id, key, delay, headers):
+        time.sleep(delay)
+        statuses[key_id] = client.post("/ai/summary", json={"text": "Shared email"},
+                                       headers=dict(headers, **{"X-API-Key": key})).status_code
+
+    def race(alice_headers):
+        callers = [threading.Thread(target=call, args=("alice", alice, 0, alice_headers)),
+                   threading.Thread(target=call, args=("bob", bob, 0.05, {}))]
+        for caller in callers:
+            caller.start()
+        for caller in callers:
+            caller.join()
+
+    race({"X-Request-Timeout": "0.2"})
+    assert statuses == {"alice": 504, "bob": 200}
+    requests_before = secured.requests
+    race({})
+    assert statuses == {"alice": 200, "bob": 200} and secured.requests == requests_before + 1
+
+    report = client.get("/usage?bucket=day", headers={"X-API-Key": ops}).json
+    assert {row["key"]: row["calls"] for row in report["usage"]} == {"alice": 1, "bob": 2}
@@ -0,0 +1,64 @@
+import pytest
+
+import app as backend
+
+
+@pytest.fixture
+def client():
+    return backend.app.test_client()
+
+
+def test_summary(upstream, client):
+    response = client.post("/ai/summary", json={"text": "A long email"})
+    assert response.status_code == 200
+    assert response.json == {"status": "success", "summary": "Fake completion."}
+
+
+def test_post_social(upstream, client):
+    response = client.post("/ai/post_social", json={"content": "Launch", "platform": "twitter"})
+    assert response.status_code == 200
+    assert response.json["post"] == "Fake completion."
+    assert response.json["platform"] == "twitter"
+
+
+def test_screen_resume(upstream, client):
+    response = client.post("/ai/screen_resume", json={"resume": "Jane", "job_description": "Engineer"})
+    assert response.status_code == 200
+    assert response.json["evaluation"] == "Fake completion."
+
+
+def test_upstream_error_is_reported(upstream, client):
+    upstream.status = 500
+    response = client.post("/ai/summary", json={"text": "A long email"})
+    assert response.status_code == 500
+    assert response.json["message"].startswith("Error generating summary: Upstream returned 500")
+
+
+def test_upstream_rate_limit_is_passed_through(upstream, client, monkeypatch):
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "1")
+    upstream.status = 429
+    response = client.post("/ai/summary", json={"text": "A long email"})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+    governor = client.get("/governor/stats").json["governor"]
+    assert governor["throttled"] == 1
+    assert governor["queue_depth"] == 0
+
+
+def test_repeated_prompt_is_served_from_cache(upstream, client):
+    first = client.post("/ai/summary", json={"text": "Same email"})
+    second = client.post("/ai/summary", json={"text": "Same email"})
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json == first.json
+
+    stats = client.get("/cache/stats").json["cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+
+
+def test_missing_fields(upstream, client):
+    response = client.post("/ai/summary", json={})
+    assert response.status_code == 400
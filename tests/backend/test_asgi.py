@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import httpx
+
+import asgi
+
+
+async def post_many(requests_body):
+    transport = httpx.ASGITransport(app=asgi.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+        return await asyncio.gather(*(client.post(path, json=body) for path, body in requests_body))
+
+
+def test_routes_keep_json_contracts(upstream):
+    summary, post, evaluation, notification, home = asyncio.run(post_many([
+        ("/ai/summary", {"text": "An email"}),
+        ("/ai/post_social", {"content": "Launch", "platform": "twitter"}),
+        ("/ai/screen_resume", {"resume": "Jane", "job_description": "Engineer"}),
+        ("/notification/send", {"subject": "Hi", "message": "There"}),
+        ("/", None)
+    ]))
+    assert summary.json() == {"status": "success", "summary": "Fake completion."}
+    assert summary.headers["X-Cache"] == "MISS"
+    assert post.json() == {"status": "success", "post": "Fake completion.", "platform": "twitter"}
+    assert evaluation.json() == {"status": "success", "evaluation": "Fake completion."}
+    assert notification.json()["status"] == "success"
+    assert home.status_code == 405
+
+
+def test_missing_fields_and_bad_json(upstream):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return (await client.post("/ai/summary", json={}),
+                    await client.post("/ai/summary", content=b"{not json"))
+
+    missing, malformed = asyncio.run(run())
+    assert missing.status_code == 400
+    assert missing.json() == {"status": "error", "code": "missing_field",
+                              "message": "Missing required fields: text", "field": "text"}
+    assert malformed.status_code == 400
+    assert malformed.json()["code"] == "invalid_json"
+
+
+def test_slow_upstream_calls_run_concurrently(upstream):
+    upstream.latency = 0.3
+    start = time.perf_counter()
+    responses = asyncio.run(post_many([("/ai/summary", {"text": f"email {i}"}) for i in range(40)]))
+    elapsed = time.perf_counter() - start
+
+    assert all(response.status_code == 200 for response in responses)
+    assert elapsed < 40 * 0.3 / 4
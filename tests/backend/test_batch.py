@@ -0,0 +1,47 @@
+import asyncio
+import json
+
+import httpx
+
+import app as wsgi
+import asgi
+
+BODY = {
+    "job_description": "Senior Python engineer",
+    "items": [{"resume": f"Candidate {i}"} for i in range(5)] + [{"job_description": "Override"}],
+    "concurrency": 3
+}
+
+
+def parse(text):
+    return sorted((json.loads(line) for line in text.splitlines()), key=lambda line: line["index"])
+
+
+def check_lines(lines):
+    assert [line["index"] for line in lines] == list(range(6))
+    assert all(line["evaluation"] == "Fake completion." for line in lines[:5])
+    assert lines[5] == {"index": 5, "status": "error", "code": "missing_field",
+                        "message": "Missing required fields: resume"}
+
+
+def test_wsgi_batch_streams_ndjson(upstream):
+    response = wsgi.app.test_client().post("/ai/batch/screen_resume", json=BODY)
+    assert response.mimetype == "application/x-ndjson"
+    check_lines(parse(response.get_data(as_text=True)))
+
+
+def test_asgi_batch_streams_ndjson(upstream):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return await client.post("/ai/batch/screen_resume", json=BODY)
+
+    response = asyncio.run(run())
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    check_lines(parse(response.text))
+
+
+def test_batch_request_errors(upstream):
+    client = wsgi.app.test_client()
+    assert client.post("/ai/batch/unknown", json=BODY).status_code == 404
+    assert client.post("/ai/batch/summary", json={"items": []}).status_code == 400
@@ -0,0 +1,48 @@
+import asyncio
+import statistics
+
+import httpx
+
+import asgi
+import bench_load
+from fake_upstream import latency_model
+
+
+def test_latency_distributions():
+    assert latency_model(0.2)() == 0.2
+    assert latency_model("fixed:0.1")() == 0.1
+    assert 0.1 <= latency_model("uniform:0.1,0.3")() <= 0.3
+    samples = [latency_model("lognormal:0.5,0.4")() for _ in range(2000)]
+    assert 0.45 < statistics.median(samples) < 0.55
+
+
+def test_percentiles_use_nearest_rank():
+    ordered = list(range(1, 101))
+    assert bench_load.percentile(ordered, 50) == 50
+    assert bench_load.percentile(ordered, 99) == 99
+    assert bench_load.percentile([7], 95) == 7
+
+
+def test_upstream_error_rate(upstream):
+    upstream.error_rate = 1.0
+    upstream.error_status = 429
+    response = httpx.post(upstream.url, json={})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_closed_loop_reports_every_route(upstream):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            results = {}
+            for name, (path, build) in bench_load.SCENARIOS.items():
+                samples = await bench_load.closed_loop(client, path, build, 4, 8, None)
+                results[name] = bench_load.summarize(samples, 1.0)
+            return results
+
+    results = asyncio.run(run())
+    for name, result in results.items():
+        assert result["requests"] == 8, name
+        assert result["error_rate"] == 0.0, name
+        assert set(result["latency_ms"]) == {"p50", "p95", "p99", "mean", "max"}
@@ -0,0 +1,54 @@
+import pytest
+
+import app as backend
+import chunking
+
+
+def document(paragraphs, edited=None):
+    return "\n\n".join(
+        f"Paragraph {index} {'revised' if index == edited else 'original'}: " + "quarterly figures and decisions " * 8
+        for index in range(paragraphs)
+    )
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("SUMMARY_CHUNK_THRESHOLD", "300")
+    monkeypatch.setenv("SUMMARY_CHUNK_TOKENS", "200")
+    return backend.app.test_client()
+
+
+def test_short_text_is_one_call(upstream, client):
+    response = client.post("/ai/summary", json={"text": "A short email"})
+    assert response.json == {"status": "success", "summary": "Fake completion."}
+    assert upstream.requests == 1
+
+
+def test_long_text_is_mapped_then_reduced(upstream, client):
+    response = client.post("/ai/summary", json={"text": document(40)})
+    chunks = response.json["chunks"]
+    assert response.json["summary"] == "Fake completion."
+    assert chunks > 5 and response.json["truncated"] is False
+    assert upstream.requests == chunks + 1
+
+
+def test_edit_only_reprocesses_changed_chunks(upstream, client):
+    client.post("/ai/summary", json={"text": document(40)})
+    first = upstream.requests
+    client.post("/ai/summary", json={"text": document(40, edited=20)})
+    # Only the edited chunk goes upstream; the fake answers every chunk the
+    # same way, so even the reduce call is a cache hit here
+    assert upstream.requests - first == 1
+
+
+def test_chunk_boundaries_survive_an_insert():
+    original, _ = chunking.chunk_text(document(60), 200)
+    edited, _ = chunking.chunk_text("New opening paragraph.\n\n" + document(60), 200)
+    assert len(set(original) & set(edited)) >= len(original) - 2
+
+
+def test_input_past_the_cap_is_truncated(upstream, client, monkeypatch):
+    monkeypatch.setenv("SUMMARY_MAX_INPUT_TOKENS", "1000")
+    response = client.post("/ai/summary", json={"text": document(200)})
+    assert response.json["truncated"] is True
+    assert upstream.requests <= 1000 // 100 + 2
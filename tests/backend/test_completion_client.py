@@ -0,0 +1,37 @@
+import pytest
+
+from completion_client import CompletionClient, UpstreamError
+from fake_upstream import FakeUpstream
+
+PAYLOAD = {
+    "model": "gpt-4",
+    "messages": [{"role": "user", "content": "hello"}],
+    "max_tokens": 10
+}
+
+
+@pytest.fixture
+def upstream():
+    server = FakeUpstream().start()
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize("http2", [False, True])
+def test_connections_are_reused(upstream, http2):
+    client = CompletionClient(api_key="test", api_url=upstream.url, pool_size=2, http2=http2)
+    for _ in range(5):
+        data = client.complete(PAYLOAD)
+        assert data["choices"][0]["message"]["content"] == "Fake completion."
+    client.close()
+    assert upstream.connections == 1
+
+
+def test_error_status_raises_upstream_error(upstream):
+    upstream.status = 429
+    client = CompletionClient(api_key="test", api_url=upstream.url, http2=False)
+    with pytest.raises(UpstreamError) as error:
+        client.complete(PAYLOAD)
+    client.close()
+    assert error.value.status_code == 429
+    assert "Fake upstream error" in str(error.value)
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from governor import Governor, Overloaded, estimate_tokens, parse_duration
+
+
+def test_parse_duration():
+    assert parse_duration("1s") == 1
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("2") == 2
+    assert parse_duration(None) is None
+
+
+def test_estimate_tokens_counts_prompt_and_completion_budget():
+    payload = {"messages": [{"content": "x" * 400}], "max_tokens": 150}
+    assert estimate_tokens(payload) == 250
+
+
+def test_aimd_grows_on_success_and_halves_on_429():
+    governor = Governor(initial_limit=4, max_limit=8)
+    for _ in range(4):
+        with governor.slot(10) as permit:
+            permit.observe(200)
+    assert governor.limit == pytest.approx(4.93, abs=0.01)
+
+    with governor.slot(10) as permit:
+        permit.observe(429, {"retry-after": "0.1"})
+    assert governor.limit == pytest.approx(2.47, abs=0.01)
+    assert governor.info()["paused_for"] > 0
+
+
+def test_waiters_past_their_deadline_are_shed():
+    governor = Governor(initial_limit=1, queue_timeout=0.05)
+    permit = governor.acquire(10)
+    with pytest.raises(Overloaded):
+        governor.acquire(10)
+    assert governor.info()["shed"] == 1
+    governor.release(permit)
+    governor.release(governor.acquire(10))
+
+
+def test_full_queue_rejects_immediately():
+    governor = Governor(initial_limit=1, max_queue=1, queue_timeout=1)
+    permit = governor.acquire(10)
+    waiter = threading.Thread(target=lambda: governor.release(governor.acquire(10)))
+    waiter.start()
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    with pytest.raises(Overloaded):
+        governor.acquire(10)
+    assert time.monotonic() - start < 0.5
+
+    governor.release(permit)
+    waiter.join()
+    assert governor.info()["in_flight"] == 0
+
+
+def test_rate_limit_headers_drain_the_buckets():
+    governor = Governor(requests_per_minute=600, queue_timeout=0.05)
+    with governor.slot(10) as permit:
+        permit.observe(200, {"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "30s"})
+    with pytest.raises(Overloaded) as error:
+        governor.acquire(10)
+    assert error.value.retry_after >= 29
+
+
+def test_async_acquire_waits_for_a_released_slot():
+    governor = Governor(initial_limit=1)
+
+    async def run():
+        async def hold():
+            async with governor.aslot(10) as permit:
+                await asyncio.sleep(0.05)
+                permit.observe(200)
+
+        await asyncio.gather(hold(), hold(), hold())
+
+    asyncio.run(run())
+    assert governor.info()["admitted"] == 3
+    assert governor.info()["in_flight"] == 0
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import app as wsgi
+import asgi
+import auth
+import history
+
+
+@pytest.fixture
+def client():
+    return wsgi.app.test_client()
+
+
+@pytest.fixture
+def use_store(monkeypatch):
+    stores = []
+
+    def use(store):
+        stores.append(store)
+        monkeypatch.setattr(history, "_history", store)
+        return store
+    yield use
+    for store in stores:
+        store._stopped = True
+        store._buffer.clear()
+
+
+def asgi_post(path, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as http:
+            return await http.post(path, **kwargs)
+    return asyncio.run(run())
+
+
+def test_requests_are_recorded_with_tokens_and_output(upstream, client, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "false")
+    assert client.post("/ai/post_social", json={"content": "Launch", "platform": "x"}).status_code == 200
+    assert asgi_post("/ai/summary", content=b'{ "text":  "An email" }').status_code == 200
+
+    page = client.get("/history").json
+    assert [execution["endpoint"] for execution in page["executions"]] == ["/ai/summary", "/ai/post_social"]
+    summary, social = page["executions"]
+    assert summary["tokens"] == 13 and summary["caller"] == auth.ANONYMOUS
+    assert summary["output"]["summary"] == "Fake completion."
+    assert summary["input_hash"] == history.input_hash(b'{"text":"An email"}')
+    assert social["status"] == 200 and social["cache"] == "BYPASS" and social["latency_ms"] > 0
+    assert page["next_cursor"] is None
+
+    same_input = client.get(f"/history?input_hash={summary['input_hash']}").json["executions"]
+    assert [execution["id"] for execution in same_input] == [summary["id"]]
+    assert client.get(f"/history/{social['id']}").json["execution"]["output"]["post"] == "Fake completion."
+    assert client.get("/history/404").status_code == 404
+
+
+def test_cursor_pagination_and_time_ranges(use_store):
+    store = use_store(history.MemoryHistory(flush_interval=60))
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for minute in range(7):
+        store.append({"input": b"{}", "output": None, "tokens": 0, "ts": start + timedelta(minutes=minute),
+                      "endpoint": "/ai/summary" if minute % 2 else "/webhook/hook", "caller": "flow",
+                      "status": 200, "latency_ms": 1.0})
+
+    seen, cursor = [], None
+    while True:
+        page = history.query({}, limit=3, cursor=cursor)
+        seen += [execution["ts"] for execution in page["executions"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [(start + timedelta(minutes=minute)).isoformat() for minute in range(6, -1, -1)]
+
+    page = history.query({"endpoint": "/ai/summary"}, since=(start + timedelta(minutes=2)).isoformat(),
+                         until=(start + timedelta(minutes=5)).isoformat())
+    assert [execution["ts"][14:16] for execution in page["executions"]] == ["03"]
+    with pytest.raises(history.HistoryQueryError):
+        history.query({}, limit=0)
+    with pytest.raises(history.HistoryQueryError):
+        history.query({}, cursor="not-an-id")
+
+
+def test_recording_never_waits_on_the_store(use_store):
+    class Unreachable(history.MemoryHistory):
+        def write(self, records):
+            time.sleep(0.05)
+            raise ConnectionError("store down")
+
+    store = use_store(Unreachable(flush_interval=0.01, batch_size=10, max_buffer=100))
+    started = time.perf_counter()
+    for _ in range(1000):
+        history.start("POST", "/ai/summary")
+        history.finish("/ai/summary", "/ai/summary", 200, "flow", b"{}")
+    assert time.perf_counter() - started < 0.5
+    assert store.info()["buffered"] <= 100
+    # At most one batch is held by the failing write
+    assert store.info()["dropped"] >= 800
+
+
+def test_callers_only_see_their_own_history(upstream, client, monkeypatch):
+    monkeypatch.setenv("API_KEY_SECRET", "key-secret")
+    monkeypatch.setenv("ADMIN_API_KEYS", "ops")
+    flow, other, ops = (auth.issue_key(key_id) for key_id in ("flow", "other", "ops"))
+    client.post("/ai/summary", json={"text": "An email"}, headers={"X-API-Key": flow})
+
+    assert client.get("/history").status_code == 401
+    mine = client.get("/history", headers={"X-API-Key": flow}).json["executions"]
+    assert [execution["caller"] for execution in mine] == ["flow"]
+    assert client.get("/history", headers={"X-API-Key": other}).json["executions"] == []
+    assert client.get("/history?caller=flow", headers={"X-API-Key": other}).status_code == 403
+    assert client.get(f"/history/{mine[0]['id']}", headers={"X-API-Key": other}).status_code == 404
+    assert len(client.get("/history?caller=flow", headers={"X-API-Key": ops}).json["executions"]) == 1
@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import app as backend
+import auth
+import jobs
+
+
+@pytest.fixture
+def client():
+    return backend.app.test_client()
+
+
+@pytest.fixture
+def callbacks(monkeypatch):
+    """Local receiver that records the job callbacks POSTed to it"""
+    monkeypatch.setenv("JOB_CALLBACK_HOSTS", "127.0.0.1")
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/hook", received
+    server.shutdown()
+    server.server_close()
+
+
+def wait_for(client, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/ai/jobs/{job_id}").json["job"]
+        if job["status"] in jobs.FINISHED:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_submit_returns_immediately_and_result_can_be_polled(upstream, client, callbacks):
+    hook, received = callbacks
+    response = client.post("/ai/jobs/post_social",
+                           json={"content": "Launch", "platform": "twitter", "callback_url": hook})
+    assert response.status_code == 202
+    assert response.headers["Location"] == f"/ai/jobs/{response.json['job_id']}"
+    assert response.json["job"]["status"] == "queued"
+
+    job = wait_for(client, response.json["job_id"])
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"status": "success", "post": "Fake completion.", "platform": "twitter"}
+
+    deadline = time.monotonic() + 2
+    while not received and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert received[0]["id"] == job["id"]
+    assert received[0]["result"]["post"] == "Fake completion."
+
+
+def test_submit_validation(upstream, client):
+    assert client.post("/ai/jobs/translate", json={"text": "hi"}).status_code == 404
+    assert client.post("/ai/jobs/summary", json={}).json["message"] == "Missing required fields: text"
+    assert client.post("/ai/jobs/summary", json={"text": "hi", "priority": "urgent"}).status_code == 400
+    assert client.get("/ai/jobs/unknown").status_code == 404
+    for internal in ("http://127.0.0.1:6379/", "http://redis:6379/", "http://169.254.169.254/latest", "ftp://x.com/"):
+        response = client.post("/ai/jobs/summary", json={"text": "hi", "callback_url": internal})
+        assert response.status_code == 400 and "public host" in response.json["message"]
+
+
+def test_jobs_are_only_visible_to_their_caller(upstream, client, monkeypatch):
+    monkeypatch.setenv("API_KEY_SECRET", "key-secret")
+    monkeypatch.setenv("ADMIN_API_KEYS", "ops")
+    flow, other, ops = ({"X-API-Key": auth.issue_key(key_id)} for key_id in ("flow", "other", "ops"))
+    job_id = client.post("/ai/jobs/summary", json={"text": "An email"}, headers=flow).json["job_id"]
+
+    assert client.get(f"/ai/jobs/{job_id}", headers=flow).status_code == 200
+    assert client.get(f"/ai/jobs/{job_id}", headers=other).status_code == 404
+    assert client.get(f"/ai/jobs/{job_id}", headers=ops).status_code == 200
+
+
+def test_worker_survives_a_failing_store(upstream):
+    class FlakyQueue(jobs.MemoryJobQueue):
+        failures = 1
+
+        def finish(self, job):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("store down")
+            super().finish(job)
+
+    queue = FlakyQueue()
+    worker = jobs.JobWorker(queue, threads=1, visibility_timeout=0.2, poll_interval=0.01).start()
+    try:
+        job = queue.submit(jobs.new_job("summary", {"text": "An email"}))
+        deadline = time.monotonic() + 5
+        while queue.get(job["id"])["status"] != "succeeded" and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        worker.stop(2)
+    assert queue.get(job["id"])["status"] == "succeeded" and queue.get(job["id"])["attempts"] == 2
+
+
+def test_claims_follow_priority_then_submit_order():
+    queue = jobs.MemoryJobQueue()
+    for priority in ("low", "normal", "high", "normal"):
+        queue.submit(jobs.new_job("summary", {"text": priority, "priority": priority}))
+    claimed = [queue.claim(60)["input"]["text"] for _ in range(4)]
+    assert claimed == ["high", "normal", "normal", "low"]
+    assert queue.claim(60) is None
+
+
+def test_unfinished_job_becomes_visible_again():
+    queue = jobs.MemoryJobQueue(max_attempts=2)
+    job = queue.submit(jobs.new_job("summary", {"text": "hi"}))
+    assert queue.claim(0.05)["attempts"] == 1
+    assert queue.claim(0.05) is None
+    time.sleep(0.06)
+    redelivered = queue.claim(0.05)
+    assert redelivered["id"] == job["id"] and redelivered["attempts"] == 2
+
+    time.sleep(0.06)
+    final = jobs.run_job(queue, queue.claim(0.05))
+    assert final["status"] == "failed"
+    assert queue.get(job["id"])["status"] == "failed"
+
+
+def test_retryable_failures_are_requeued_until_attempts_run_out(upstream, monkeypatch):
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "1")
+    upstream.status = 500
+    queue = jobs.MemoryJobQueue(max_attempts=2)
+    job = queue.submit(jobs.new_job("summary", {"text": "hi"}))
+
+    assert jobs.run_job(queue, queue.claim(60), retry_delay=0, max_retry_delay=0) is None
+    assert queue.get(job["id"])["status"] == "queued"
+    final = jobs.run_job(queue, queue.claim(60), retry_delay=0, max_retry_delay=0)
+    assert final["status"] == "failed"
+    assert final["error"].startswith("Error generating summary: Upstream returned 500")
@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+
+import app as backend
+import asgi
+import metrics
+from completion_client import UpstreamError
+from governor import Overloaded
+from resilience import CircuitOpen, DeadlineExceeded
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.fixture
+def client():
+    return backend.app.test_client()
+
+
+def test_flask_route_metrics_and_server_timing(upstream, client):
+    before = sample("autotasker_http_requests_total", route="/ai/summary", method="POST", status="200")
+    tokens_before = sample("autotasker_upstream_tokens_total", model="gpt-4", kind="completion")
+
+    response = client.post("/ai/summary", json={"text": "A long email"})
+    timing = response.headers["Server-Timing"]
+    assert 'cache;desc="miss"' in timing
+    assert "upstream-ttfb;dur=" in timing
+    assert "app;dur=" in timing
+
+    assert sample("autotasker_http_requests_total", route="/ai/summary", method="POST", status="200") == before + 1
+    assert sample("autotasker_upstream_tokens_total", model="gpt-4", kind="completion") == tokens_before + 3
+    assert sample("autotasker_http_requests_in_flight", route="/ai/summary") == 0
+
+    cached = client.post("/ai/summary", json={"text": "A long email"})
+    assert 'cache;desc="hit"' in cached.headers["Server-Timing"]
+    assert "upstream" not in cached.headers["Server-Timing"]
+
+
+def test_metrics_endpoint_exposes_components(upstream, client):
+    client.post("/ai/summary", json={"text": "A long email"})
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "autotasker_upstream_duration_seconds_bucket" in body
+    assert "autotasker_cache_misses 1.0" in body
+    assert "autotasker_circuit_open 0.0" in body
+
+
+def test_errors_are_classified(upstream, client, monkeypatch):
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "1")
+    upstream.status = 429
+    before = sample("autotasker_errors_total", error_class="rate_limited")
+    client.post("/ai/summary", json={"text": "A long email"})
+    assert sample("autotasker_errors_total", error_class="rate_limited") == before + 1
+
+
+def test_error_class():
+    assert metrics.error_class(CircuitOpen("open")) == "circuit_open"
+    assert metrics.error_class(Overloaded("full")) == "shed"
+    assert metrics.error_class(DeadlineExceeded("late")) == "deadline"
+    assert metrics.error_class(UpstreamError(502, "bad gateway")) == "upstream_5xx"
+    assert metrics.error_class(httpx.ConnectError("refused")) == "connection"
+    assert metrics.error_class(ValueError("bug")) == "internal"
+
+
+def test_asgi_routes_are_measured_once(upstream):
+    before = sample("autotasker_http_requests_total", route="/ai/batch/{task}", method="POST", status="200")
+    mounted_before = sample("autotasker_http_requests_total", route="/cache/stats", method="GET", status="200")
+
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as http:
+            batch = await http.post("/ai/batch/summary", json={"items": [{"text": "a"}]})
+            stats = await http.get("/cache/stats")
+            return batch, stats
+
+    batch, stats = asyncio.run(run())
+    assert "app;dur=" in batch.headers["server-timing"]
+    assert stats.headers["server-timing"].startswith("app;dur=")
+    assert sample("autotasker_http_requests_total", route="/ai/batch/{task}", method="POST", status="200") == before + 1
+    assert sample("autotasker_http_requests_total", route="/cache/stats", method="GET", status="200") == mounted_before + 1
@@ -0,0 +1,144 @@
+import pytest
+
+import app as backend
+import notifications
+from fake_smtp import FakeSmtp
+
+
+@pytest.fixture
+def client():
+    yield backend.app.test_client()
+    notifications.reset_dispatcher()
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    server = FakeSmtp().start()
+    monkeypatch.setenv("SMTP_HOST", "127.0.0.1")
+    monkeypatch.setenv("SMTP_PORT", str(server.port))
+    monkeypatch.setenv("SMTP_USE_TLS", "false")
+    monkeypatch.setenv("SMTP_USERNAME", "")
+    monkeypatch.setenv("SMTP_FROM_ADDRESS", "autotasker@example.com")
+    yield server
+    server.stop()
+
+
+def notification(**fields):
+    return notifications.new_notification(dict({"subject": "Hi", "message": "There"}, **fields))
+
+
+def test_send_is_queued_and_delivered(client):
+    response = client.post("/notification/send", json={"subject": "Email Summary", "message": "Done"})
+    assert response.status_code == 200
+    assert response.json["status"] == "success"
+    assert response.json["notification"]["channel"] == "log"
+    assert response.json["notification"]["subject"] == "Email Summary"
+
+    assert notifications.get_dispatcher().flush(timeout=2)
+    stats = client.get("/notification/stats").json["notifications"]
+    assert stats["accepted"] == 1 and stats["sent"] == 1
+
+
+def test_send_validation(client):
+    assert client.post("/notification/send", json={"subject": "Hi"}).status_code == 400
+    response = client.post("/notification/send", json={"subject": "Hi", "message": "x", "channel": "fax"})
+    assert response.json["message"] == "Unknown notification channel: fax"
+
+
+def test_email_burst_shares_smtp_sessions(smtp):
+    dispatcher = notifications.Dispatcher(workers_per_channel=2, batch_window=0.2)
+    for index in range(20):
+        dispatcher.submit(notification(channel="email", to=f"user{index}@example.com", subject=f"n{index}"))
+    assert dispatcher.flush(timeout=5)
+    dispatcher.stop()
+
+    assert len(smtp.messages) == 20
+    assert smtp.sessions <= 2
+    recipients, message = smtp.messages[0]
+    assert message["From"] == "autotasker@example.com"
+    assert recipients[0].startswith("user")
+
+
+def test_refused_recipient_is_dead_lettered_without_retry(smtp):
+    dispatcher = notifications.Dispatcher(batch_window=0.01)
+    dispatcher.submit(notification(channel="email", to="reject@example.com"))
+    dispatcher.submit(notification(channel="email", to="ok@example.com"))
+    assert dispatcher.flush(timeout=5)
+
+    dead = dispatcher.dead_letters.list()
+    assert [record["to"] for record in dead] == [["reject@example.com"]]
+    assert dead[0]["attempts"] == 1
+    assert dispatcher.counts["sent"] == 1
+    dispatcher.stop()
+
+
+def test_malformed_email_fails_alone_without_retry(smtp):
+    dispatcher = notifications.Dispatcher(batch_window=0.05)
+    dispatcher.submit(notification(channel="email", to="bad@example.com", subject="Hi\nBcc: x@example.com"))
+    dispatcher.submit(notification(channel="email", to="ok@example.com"))
+    assert dispatcher.flush(timeout=5)
+    dispatcher.stop()
+
+    assert [recipients for recipients, _ in smtp.messages] == [["ok@example.com"]]
+    dead = dispatcher.dead_letters.list()
+    assert [record["to"] for record in dead] == [["bad@example.com"]] and dead[0]["attempts"] == 1
+
+
+def test_subject_must_be_a_single_line(client):
+    response = client.post("/notification/send", json={"subject": "Hi\r\nBcc: x@example.com", "message": "x"})
+    assert response.status_code == 400 and response.json["code"] == "invalid_value"
+
+
+def test_failed_batches_are_retried_then_dead_lettered():
+    calls = []
+
+    class FlakyChannel:
+        max_batch = 10
+
+        def send_batch(self, batch):
+            calls.append(len(batch))
+            if len(calls) < 3:
+                raise notifications.DeliveryError("gateway busy")
+            return {}
+
+    class DownChannel:
+        def send_batch(self, batch):
+            raise notifications.DeliveryError("gateway down")
+
+    notifications.register_channel("flaky", FlakyChannel)
+    notifications.register_channel("down", DownChannel)
+    try:
+        dispatcher = notifications.Dispatcher(batch_window=0.01, max_attempts=3, retry_delay=0.01,
+                                              max_retry_delay=0.01)
+        dispatcher.submit(notification(channel="flaky"))
+        dispatcher.submit(notification(channel="down"))
+        assert dispatcher.flush(timeout=5)
+        dispatcher.stop()
+    finally:
+        del notifications.CHANNELS["flaky"], notifications.CHANNELS["down"]
+
+    assert len(calls) == 3 and dispatcher.counts["sent"] == 1
+    dead = dispatcher.dead_letters.list()
+    assert len(dead) == 1 and dead[0]["channel"] == "down" and dead[0]["attempts"] == 3
+    assert dead[0]["error"] == "gateway down"
+
+
+def test_failing_dead_letter_store_keeps_the_channel_running():
+    class DownChannel:
+        def send_batch(self, batch):
+            raise notifications.DeliveryError("gateway down", permanent=True)
+
+    class UnreachableDeadLetters(notifications.MemoryDeadLetters):
+        def add(self, record):
+            raise ConnectionError("redis went away")
+
+    notifications.register_channel("down", DownChannel)
+    try:
+        dispatcher = notifications.Dispatcher(batch_window=0.01, dead_letters=UnreachableDeadLetters())
+        for _ in range(2):
+            dispatcher.submit(notification(channel="down"))
+            assert dispatcher.flush(timeout=2)
+        dispatcher.stop()
+    finally:
+        del notifications.CHANNELS["down"]
+    assert dispatcher.counts["dead_lettered"] == 2
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import re
+import threading
+import time
+
+import httpx
+import pytest
+
+import app as wsgi
+import asgi
+import auth
+import profiler
+
+
+@pytest.fixture
+def client():
+    return wsgi.app.test_client()
+
+
+def server_timing(header):
+    return {name: float(duration) for name, duration in re.findall(r"([\w-]+);dur=([\d.]+)", header)}
+
+
+def test_samples_are_aggregated_per_route_and_exported():
+    sampler = profiler.Profiler(interval=0.002)
+
+    def encode_reports():
+        sampler.begin("/ai/summary")
+        deadline = time.perf_counter() + 0.3
+        while time.perf_counter() < deadline:
+            json.dumps({"report": list(range(200))})
+        sampler.end()
+
+    worker = threading.Thread(target=encode_reports)
+    sampler.start()
+    worker.start()
+    worker.join()
+    sampler.stop()
+
+    info = sampler.info()
+    assert not info["running"] and info["samples"] > 20
+    assert list(info["routes"]) == ["/ai/summary"]
+    assert info["sampler_lag_ms"]["p50"] is not None
+    collapsed = sampler.collapsed()
+    assert all(line.startswith("/ai/summary;") and line.rsplit(" ", 1)[1].isdigit()
+               for line in collapsed.splitlines())
+    assert "test_profiler.py:encode_reports" in collapsed
+    svg = profiler.flamegraph(sampler.stacks("/ai/summary"))
+    assert svg.startswith("<svg") and "encode_reports" in svg
+
+    sampler.reset()
+    assert sampler.collapsed() == ""
+
+
+def test_admin_endpoint_controls_the_profiler(upstream, client, monkeypatch):
+    monkeypatch.setenv("API_KEY_SECRET", "key-secret")
+    monkeypatch.setenv("ADMIN_API_KEYS", "ops")
+    admin = {"X-API-Key": auth.issue_key("ops")}
+    flow = {"X-API-Key": auth.issue_key("flow")}
+    upstream.latency = 0.1
+
+    assert client.post("/profiler/start", headers=flow).status_code == 403
+    assert client.post("/profiler/start", json={"interval": 5}, headers=admin).json["code"] == "invalid_value"
+    started = client.post("/profiler/start", json={"interval": 0.005, "duration": 30}, headers=admin).json
+    assert started["profiler"]["running"] and started["profiler"]["interval"] == 0.005
+
+    client.post("/ai/summary", json={"text": "An email"}, headers=flow)
+    assert not client.post("/profiler/stop", headers=admin).json["profiler"]["running"]
+
+    collapsed = client.get("/profiler/stacks?route=/ai/summary", headers=admin).data.decode()
+    assert "completion_client.py:post" in collapsed
+    assert client.get("/profiler/stacks?format=svg", headers=admin).mimetype == "image/svg+xml"
+    assert client.get("/profiler", headers=admin).json["profiler"]["routes"]["/ai/summary"] > 5
+
+
+def test_profiler_is_closed_to_remote_callers_without_authentication(upstream, client, monkeypatch):
+    remote = {"REMOTE_ADDR": "10.0.0.5"}
+    assert client.post("/profiler/start", environ_base=remote).status_code == 403
+    traced = client.post("/ai/summary", json={"text": "An email"}, headers={"X-Profile": "1"}, environ_base=remote)
+    assert "prof-" not in traced.headers["Server-Timing"]
+
+    monkeypatch.setenv("PROFILER_OPEN", "true")
+    assert client.get("/profiler", environ_base=remote).status_code == 200
+
+
+def test_header_traces_one_request(upstream, client, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "false")
+    upstream.latency = 0.1
+
+    traced = client.post("/ai/summary", json={"text": "An email"}, headers={"X-Profile": "1"})
+    timings = server_timing(traced.headers["Server-Timing"])
+    assert timings["prof-upstream"] >= 50
+
+    assert "prof-" not in client.post("/ai/summary", json={"text": "An email"}).headers["Server-Timing"]
+
+    async def native():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as http:
+            return await http.post("/ai/post_social", json={"content": "Launch", "platform": "x"},
+                                   headers={"X-Profile": "1"})
+    assert "prof-" in asyncio.run(native()).headers["server-timing"]
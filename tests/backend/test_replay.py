@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+
+import app as wsgi
+import asgi
+import completion_client
+import replay
+
+
+@pytest.fixture
+def recording(upstream, monkeypatch, tmp_path):
+    path = str(tmp_path / "completions.rec")
+    monkeypatch.setenv("UPSTREAM_RECORDING", path)
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "false")
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "1")
+    yield path
+    replay.reset_recording()
+
+
+def switch_mode(monkeypatch, mode):
+    monkeypatch.setenv("UPSTREAM_MODE", mode)
+    replay.reset_recording()
+    completion_client.reset_client()
+
+
+def asgi_post(path, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as http:
+            return await http.post(path, **kwargs)
+    return asyncio.run(run())
+
+
+def test_recorded_completions_are_replayed_offline(upstream, recording, monkeypatch):
+    client = wsgi.app.test_client()
+    switch_mode(monkeypatch, "record")
+    upstream.reply = "Recorded summary."
+    assert client.post("/ai/summary", json={"text": "An email"}).json["summary"] == "Recorded summary."
+    upstream.reply = "Recorded post."
+    assert asgi_post("/ai/post_social", json={"content": "Launch", "platform": "x"}).json()["post"] == "Recorded post."
+    assert replay.get_recording().recorded == 2
+
+    switch_mode(monkeypatch, "replay")
+    upstream.status = 500
+    requests_before = upstream.requests
+    assert asgi_post("/ai/summary", json={"text": "An email"}).json()["summary"] == "Recorded summary."
+    assert client.post("/ai/post_social", json={"content": "Launch", "platform": "x"}).json["post"] == "Recorded post."
+
+    assert b"Recorded summary." in client.post("/ai/summary?stream=true", json={"text": "An email"}).data
+
+    missing = client.post("/ai/summary", json={"text": "Never recorded"})
+    assert missing.status_code == 500 and missing.json["code"] == "upstream_4xx"
+    assert upstream.requests == requests_before
+    assert replay.get_recording().info()["requests"] == 2
+
+
+def test_recorded_latency_is_simulated(upstream, recording, monkeypatch):
+    client = wsgi.app.test_client()
+    switch_mode(monkeypatch, "record")
+    upstream.latency = 0.2
+    client.post("/ai/summary", json={"text": "An email"})
+
+    switch_mode(monkeypatch, "replay")
+    started = time.perf_counter()
+    client.post("/ai/summary", json={"text": "An email"})
+    assert time.perf_counter() - started < 0.1
+
+    monkeypatch.setenv("UPSTREAM_REPLAY_LATENCY", "1")
+    switch_mode(monkeypatch, "replay")
+    started = time.perf_counter()
+    client.post("/ai/summary", json={"text": "An email"})
+    assert time.perf_counter() - started >= 0.2
+
+
+def test_index_lookup_variants_and_rebuild(tmp_path):
+    path = str(tmp_path / "store.rec")
+    store = replay.Recording(path, max_variants=2)
+    payloads = [{"model": "gpt-4", "messages": [{"role": "user", "content": f"Prompt {n}"}]} for n in range(50)]
+    for n, payload in enumerate(payloads):
+        assert store.record(payload, 200, 0.1, 0.2, f'{{"n": {n}}}'.encode())
+    assert store.record(dict(payloads[7], stream=True), 200, 0.1, 0.2, b'{"n": "again"}')
+    assert not store.record(payloads[7], 200, 0.1, 0.2, b'{"n": "third"}')
+    store.close()
+
+    assert os.path.getsize(path) < 50 * 80
+    os.remove(path + ".idx")
+    store = replay.Recording(path)
+    assert store.info()["requests"] == 51
+    assert store.lookup(payloads[3])[3] == b'{"n": 3}'
+    assert [store.lookup(payloads[7])[3] for _ in range(3)] == [b'{"n": 7}', b'{"n": "again"}', b'{"n": 7}']
+    assert store.lookup({"model": "gpt-4", "messages": []}) is None
+
+
+def test_workers_share_one_recording(tmp_path):
+    path = str(tmp_path / "shared.rec")
+    workers = [replay.Recording(path) for _ in range(2)]
+    payloads = [{"model": "gpt-4", "messages": [{"role": "user", "content": f"Prompt {n}"}]} for n in range(20)]
+    for n, payload in enumerate(payloads):
+        assert workers[n % 2].record(payload, 200, 0.1, 0.2, f'{{"n": {n}}}'.encode())
+    for worker in workers:
+        worker.close()
+
+    store = replay.Recording(path)
+    assert store.info()["requests"] == 20
+    assert all(store.lookup(payload)[3] == f'{{"n": {n}}}'.encode() for n, payload in enumerate(payloads))
+    assert sorted(os.listdir(tmp_path)) == ["shared.rec", "shared.rec.idx"]
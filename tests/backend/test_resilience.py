@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+
+import resilience
+from completion_client import UpstreamError
+from governor import Overloaded
+from resilience import CircuitBreaker, CircuitOpen, Resilience
+
+
+def flaky(failures, status_code=500):
+    calls = []
+
+    def call(payload, timeout):
+        calls.append(timeout)
+        if len(calls) <= failures:
+            raise UpstreamError(status_code, "boom")
+        return {"ok": True}
+
+    return call, calls
+
+
+def test_retries_transient_errors_with_backoff():
+    call, calls = flaky(2)
+    layer = Resilience(attempts=3, base_delay=0.01)
+    assert layer.call(call, {}) == {"ok": True}
+    assert len(calls) == 3
+    assert layer.info()["retries"] == 2
+
+
+def test_client_errors_are_not_retried():
+    call, calls = flaky(1, status_code=400)
+    with pytest.raises(UpstreamError):
+        Resilience(attempts=3, base_delay=0.01).call(call, {})
+    assert len(calls) == 1
+
+
+def test_retries_stop_at_the_request_deadline():
+    call, calls = flaky(5)
+    resilience.start_deadline("0.05")
+    try:
+        start = time.monotonic()
+        with pytest.raises((UpstreamError, resilience.DeadlineExceeded)):
+            Resilience(attempts=10, base_delay=1).call(call, {})
+        assert time.monotonic() - start < 0.5
+        assert calls[0] <= 0.05
+    finally:
+        resilience.start_deadline(None)
+
+
+def test_circuit_opens_fails_fast_and_recovers_after_probe():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    for _ in range(2):
+        breaker.allow()
+        breaker.record(UpstreamError(503, "down"))
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    time.sleep(0.06)
+    breaker.allow()
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record()
+    assert breaker.info()["state"] == "closed"
+
+
+def test_local_rejections_and_abandoned_probes_keep_the_circuit_open():
+    layer = Resilience(attempts=1, breaker=CircuitBreaker(failure_threshold=1, cooldown=0.05))
+    layer.breaker.record(UpstreamError(503, "down"))
+    for local in (CircuitOpen("open", retry_after=1), resilience.DeadlineExceeded("late")):
+        layer.breaker.record(local)
+    assert layer.breaker.info()["state"] == "open"
+
+    time.sleep(0.06)
+
+    async def cancelled(payload, timeout):
+        raise asyncio.CancelledError()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(layer.acall(cancelled, {}))
+    assert layer.breaker.info()["state"] == "half_open"
+
+    def shed(payload, timeout):
+        raise Overloaded("queue full", retry_after=1)
+    with pytest.raises(Overloaded):
+        layer.call(shed, {})
+    assert layer.breaker.info() == {"state": "half_open", "failures": 1, "rejected": 0}
+    assert layer.call(lambda payload, timeout: "ok", {}) == "ok"
+    assert layer.breaker.info()["state"] == "closed"
+
+
+def test_slow_call_is_hedged():
+    layer = Resilience(attempts=1, hedge=True, hedge_min_delay=0.01)
+    for _ in range(20):
+        layer.latency.record(0.01)
+    calls = []
+
+    def call(payload, timeout):
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    start = time.monotonic()
+    assert layer.call(call, {}) == "fast"
+    assert time.monotonic() - start < 0.3
+    assert layer.info()["hedges"] == 1
+
+
+def test_async_hedge_cancels_the_loser():
+    layer = Resilience(attempts=1, hedge=True, hedge_min_delay=0.01)
+    for _ in range(20):
+        layer.latency.record(0.01)
+    cancelled = []
+
+    async def call(payload, timeout):
+        if not cancelled:
+            cancelled.append(False)
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled[0] = True
+                raise
+        return "fast"
+
+    assert asyncio.run(layer.acall(call, {})) == "fast"
+    assert cancelled == [True]
+
+
+def test_request_timeout_header_returns_504(upstream):
+    import app as wsgi
+
+    upstream.latency = 0.5
+    response = wsgi.app.test_client().post("/ai/summary", json={"text": "An email"},
+                                           headers={"X-Request-Timeout": "0.2"})
+    assert response.status_code == 504
@@ -0,0 +1,30 @@
+from response_cache import MemoryCache, cache_key
+
+RESPONSE = {"choices": [{"message": {"content": "x" * 100}}]}
+
+
+def test_cache_key_ignores_unrelated_fields():
+    payload = {"model": "gpt-4", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 10}
+    assert cache_key(payload) == cache_key(dict(payload, user="n8n"))
+    assert cache_key(payload) != cache_key(dict(payload, max_tokens=11))
+
+
+def test_lru_evicts_oldest_entry_over_byte_budget():
+    cache = MemoryCache(max_bytes=300, ttl=60)
+    for key in ("a", "b"):
+        cache.set(key, RESPONSE)
+    cache.get("a")
+    cache.set("c", RESPONSE)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == RESPONSE
+    assert cache.get("c") == RESPONSE
+    assert cache.size <= 300
+
+
+def test_expired_entries_are_misses():
+    cache = MemoryCache(ttl=-1)
+    cache.set("a", RESPONSE)
+    assert cache.get("a") is None
+    assert cache.info()["entries"] == 0
+    assert cache.stats.as_dict() == {"hits": 0, "misses": 1, "hit_ratio": 0.0}
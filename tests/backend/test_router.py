@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import app as wsgi
+import asgi
+import router
+from fake_upstream import FakeUpstream
+
+
+def recorder(server, bodies):
+    def reply(body):
+        bodies.append((server, body))
+        return None
+    return reply
+
+
+@pytest.fixture
+def providers(upstream, monkeypatch, tmp_path):
+    """Two fake providers behind a routing config: "fast" for short summaries, "primary" otherwise"""
+    backup = FakeUpstream().start()
+    bodies = []
+    upstream.reply = recorder("primary", bodies)
+    backup.reply = recorder("backup", bodies)
+    config = {
+        "providers": {
+            "primary": {"url": upstream.url, "api_key": "primary-key"},
+            "backup": {"url": backup.url, "api_key": ""}
+        },
+        "models": {
+            "fast": {"provider": "backup", "model": "small-model", "cost_per_1k_tokens": 0.1},
+            "primary": {"provider": "primary", "model": "big-model", "cost_per_1k_tokens": 1.0},
+            "fallback": {"provider": "backup", "model": "local-model"}
+        },
+        "health": {"eject_after": 2, "cooldown": 60},
+        "routes": [
+            {"tasks": ["summary"], "max_input_tokens": 50, "targets": ["fast", "primary"]},
+            {"targets": ["primary", "fallback"]}
+        ]
+    }
+    path = tmp_path / "routes.json"
+    path.write_text(json.dumps(config))
+    monkeypatch.setenv("MODEL_ROUTER_CONFIG", str(path))
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "1")
+    router.reset_router()
+    yield upstream, backup, bodies
+    backup.stop()
+
+
+def test_default_route_sends_configured_model_without_task_tag(upstream, monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL", "gpt-4o")
+    bodies = []
+    upstream.reply = recorder("openai", bodies)
+    response = wsgi.app.test_client().post("/ai/summary", json={"text": "An email"})
+    assert response.status_code == 200
+    body = bodies[0][1]
+    assert body["model"] == "gpt-4o" and "task" not in body
+
+
+def test_routes_by_task_and_input_size(providers):
+    _, _, bodies = providers
+    client = wsgi.app.test_client()
+    client.post("/ai/summary", json={"text": "A short email"})
+    client.post("/ai/summary", json={"text": "A much longer email. " * 40})
+    client.post("/ai/post_social", json={"content": "Launch", "platform": "twitter"})
+    assert [(server, body["model"]) for server, body in bodies] == [
+        ("backup", "small-model"), ("primary", "big-model"), ("primary", "big-model")
+    ]
+
+
+def test_falls_back_and_ejects_failing_provider(providers):
+    primary, backup, bodies = providers
+    primary.status = 500
+    client = wsgi.app.test_client()
+    for index in range(3):
+        response = client.post("/ai/post_social", json={"content": f"Launch {index}", "platform": "x"})
+        assert response.status_code == 200
+    assert [body["model"] for _, body in bodies] == ["local-model"] * 3
+    # After two failures in a row the primary is skipped instead of tried first
+    assert primary.requests == 2
+
+    stats = client.get("/router/stats").json["router"]
+    assert stats["fallbacks"] == 2
+    assert stats["targets"]["primary"]["degraded"] is True
+    assert stats["targets"]["fallback"]["degraded"] is False
+
+
+def test_client_errors_do_not_fall_back(providers):
+    primary, backup, _ = providers
+    primary.status = 400
+    response = wsgi.app.test_client().post("/ai/post_social", json={"content": "Launch", "platform": "x"})
+    assert response.status_code == 500
+    assert backup.requests == 0
+
+
+def test_stream_falls_back_before_first_token(providers):
+    primary, backup, _ = providers
+    primary.status = 503
+
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return await client.post("/ai/post_social?stream=1", json={"content": "Launch", "platform": "x"})
+
+    text = asyncio.run(run()).text
+    assert "event: done" in text and backup.requests == 1
+
+
+def test_cost_strategy_and_config_errors():
+    config = {
+        "providers": {"p": {"url": "http://localhost:1/v1/chat/completions"}},
+        "models": {"dear": {"provider": "p", "cost_per_1k_tokens": 2}, "cheap": {"provider": "p", "cost_per_1k_tokens": 1}},
+        "routes": [{"targets": ["dear", "cheap"], "strategy": "cost"}]
+    }
+    plan = router.build_router(config).plan({"messages": []})
+    assert [target.name for target in plan] == ["cheap", "dear"]
+
+    with pytest.raises(router.RouterConfigError):
+        router.build_router(dict(config, routes=[{"targets": ["missing"]}]))
@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+import app as backend
+import auth
+import screening
+
+JOB = """Senior Backend Engineer
+
+Requirements:
+- 5+ years of Python and Flask
+- Experience with Redis and PostgreSQL
+- Kubernetes in production
+We value clear writing."""
+
+RESUMES = [
+    {"id": "strong", "resume": "Backend engineer, 7 years of Python and Flask. Ran Redis and PostgreSQL on Kubernetes."},
+    {"id": "partial", "resume": "Python developer who has used Flask and some PostgreSQL."},
+    {"id": "designer", "resume": "Graphic designer skilled in Figma, branding and illustration."},
+    {"id": "frontend", "resume": "Frontend engineer working with React, TypeScript and CSS."}
+]
+
+
+def match_reply(body):
+    """Fake model verdict: 90% for the strong resume, 40% for anything else"""
+    prompt = body["messages"][-1]["content"]
+    match = 90 if "Kubernetes." in prompt else 40
+    return "```json\n" + json.dumps({"match_percentage": match, "summary": "ok",
+                                     "strengths": ["Python"], "gaps": []}) + "\n```"
+
+
+@pytest.fixture
+def client():
+    return backend.app.test_client()
+
+
+def test_local_scores_rank_relevant_resumes_first():
+    job = screening.index_job_description(JOB)
+    scores = screening.local_scores(job, [item["resume"] for item in RESUMES])
+    assert scores[0] > scores[1] > scores[2]
+    assert scores[2] == 0.0
+    assert all(0 <= score <= 100 for score in scores)
+
+
+def test_requirement_lines_weigh_more():
+    job = screening.index_job_description(JOB)
+    assert job["terms"]["kubernetes"] > job["terms"]["writing"]
+
+
+def test_parse_evaluation_tolerates_prose():
+    verdict = screening.parse_evaluation('Here you go: {"match_percentage": "85.4", "gaps": ["Go"]} Thanks')
+    assert verdict["match_percentage"] == 85 and verdict["gaps"] == ["Go"]
+    assert screening.parse_evaluation("Looks good")["match_percentage"] is None
+
+
+def test_screen_sends_only_top_k_to_model(upstream, client):
+    upstream.reply = match_reply
+    created = client.post("/ai/job_descriptions", json={"job_description": JOB, "title": "Backend"})
+    assert created.status_code == 201
+    jd_id = created.json["job_description_id"]
+    assert "python" in created.json["terms"]
+
+    response = client.post(f"/ai/job_descriptions/{jd_id}/screen", json={"resumes": RESUMES, "top_k": 2})
+    assert response.status_code == 201
+    assert upstream.requests == 2
+    assert response.json["evaluated"] == 2 and response.json["total"] == 4
+
+    results = response.json["results"]
+    assert [result["id"] for result in results[:2]] == ["strong", "partial"]
+    assert results[0]["match_percentage"] == 90 and results[1]["match_percentage"] == 40
+    assert results[2]["evaluated"] is False and "match_percentage" not in results[2]
+
+
+def test_screening_results_are_sorted_and_paginated(upstream, client):
+    upstream.reply = match_reply
+    jd_id = client.post("/ai/job_descriptions", json={"job_description": JOB}).json["job_description_id"]
+    screening_id = client.post(f"/ai/job_descriptions/{jd_id}/screen",
+                               json={"resumes": RESUMES, "top_k": 2}).json["screening_id"]
+
+    page = client.get(f"/ai/screenings/{screening_id}?sort=score&order=asc&page=2&per_page=3").json
+    assert page["pages"] == 2 and [result["id"] for result in page["results"]] == ["strong"]
+
+    assert client.get(f"/ai/screenings/{screening_id}?sort=name").status_code == 400
+    assert client.get("/ai/screenings/missing").status_code == 404
+
+
+def test_screen_validation(upstream, client):
+    assert client.post("/ai/job_descriptions", json={}).status_code == 400
+    assert client.post("/ai/job_descriptions/missing/screen", json={"resumes": RESUMES}).status_code == 404
+
+    jd_id = client.post("/ai/job_descriptions", json={"job_description": JOB}).json["job_description_id"]
+    response = client.post(f"/ai/job_descriptions/{jd_id}/screen", json={"resumes": [{"id": "x"}]})
+    assert response.status_code == 400
+    assert response.json["message"] == "Resume 0 is missing its resume text"
+
+
+def test_screenings_are_only_visible_to_their_caller(upstream, client, monkeypatch):
+    monkeypatch.setenv("API_KEY_SECRET", "key-secret")
+    monkeypatch.setenv("ADMIN_API_KEYS", "ops")
+    flow, other, ops = ({"X-API-Key": auth.issue_key(key_id)} for key_id in ("flow", "other", "ops"))
+    upstream.reply = match_reply
+    jd_id = client.post("/ai/job_descriptions", json={"job_description": JOB}, headers=flow).json["job_description_id"]
+    screening_id = client.post(f"/ai/job_descriptions/{jd_id}/screen", json={"resumes": RESUMES, "top_k": 1},
+                               headers=flow).json["screening_id"]
+
+    for path in (f"/ai/job_descriptions/{jd_id}", f"/ai/screenings/{screening_id}"):
+        assert client.get(path, headers=flow).status_code == 200
+        assert client.get(path, headers=other).status_code == 404
+        assert client.get(path, headers=ops).status_code == 200
+    assert client.post(f"/ai/job_descriptions/{jd_id}/screen", json={"resumes": RESUMES},
+                       headers=other).status_code == 404
+
+
+def test_unreachable_store_is_a_503(upstream, client, monkeypatch):
+    monkeypatch.setattr(screening, "_store", screening.RedisScreeningStore("redis://127.0.0.1:1"))
+    response = client.post("/ai/job_descriptions", json={"job_description": JOB})
+    assert response.status_code == 503 and response.json["code"] == "store_unavailable"
+    assert client.get("/ai/screenings/any").status_code == 503
@@ -0,0 +1,89 @@
+import pytest
+
+import app as backend
+import prompts
+import semantic_cache
+
+EMAIL = """Hi team,
+
+The quarterly report is attached. Revenue grew 12% while costs held steady,
+and the launch moves to the first week of next month.
+
+Sent at 2024-03-04 09:15
+Best regards,
+Dana"""
+
+NEAR_DUPLICATE = """Hi team,
+
+The quarterly report is attached.  Revenue grew 12% while costs held steady,
+and the launch moves to the first week of next month.
+
+Sent at 2024-03-11 17:40
+Kind regards,
+Sam Lee, Finance"""
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("SEMANTIC_CACHE_ENABLED", "true")
+    return backend.app.test_client()
+
+
+def test_normalize_drops_signatures_timestamps_and_spacing():
+    assert semantic_cache.normalize(EMAIL) == semantic_cache.normalize(NEAR_DUPLICATE)
+
+
+def test_content_after_an_earlier_signature_still_counts():
+    def thread(reply):
+        return f"Thanks, see below.\n\nRegards,\nDana\n\n> On Monday Sam wrote:\n> {reply}\n> Sam"
+
+    layoffs = thread("Revenue fell 40% this quarter and we are laying off a third of the team.")
+    hiring = thread("Revenue rose 40% this quarter and we are hiring for every open role.")
+    assert semantic_cache.normalize(layoffs) != semantic_cache.normalize(hiring)
+    assert float(semantic_cache.embed(layoffs) @ semantic_cache.embed(hiring)) < 0.9
+
+    layoffs, hiring = (f"Quarterly update\n--\nRevenue {change} 40% and we are {plan} across the company."
+                       for change, plan in (("fell", "laying off staff"), ("rose", "hiring")))
+    assert semantic_cache.normalize(layoffs) != semantic_cache.normalize(hiring)
+
+
+def test_near_duplicate_summary_is_served_from_cache(upstream, client):
+    first = client.post("/ai/summary", json={"text": EMAIL})
+    second = client.post("/ai/summary", json={"text": NEAR_DUPLICATE})
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "SEMANTIC"
+    assert second.json["summary"] == "Fake completion."
+    assert upstream.requests == 1
+
+    unrelated = client.post("/ai/summary", json={"text": "Server maintenance is scheduled for Friday night."})
+    assert unrelated.headers["X-Cache"] == "MISS"
+
+
+def test_posts_for_other_platforms_never_match(upstream, client):
+    client.post("/ai/post_social", json={"content": EMAIL, "platform": "twitter"})
+    response = client.post("/ai/post_social", json={"content": NEAR_DUPLICATE, "platform": "linkedin"})
+    assert response.headers["X-Cache"] == "MISS"
+    assert upstream.requests == 2
+
+
+def test_index_is_bounded_and_evicts_least_recently_used():
+    cache = semantic_cache.SemanticCache(threshold=0.99, max_entries=2)
+    texts = ["alpha beta gamma", "delta epsilon zeta", "eta theta iota"]
+    for text in texts[:2]:
+        cache.set(prompts.summary_payload({"text": text}), {"answer": text})
+    assert cache.get(prompts.summary_payload({"text": texts[0]})) == {"answer": texts[0]}
+
+    cache.set(prompts.summary_payload({"text": texts[2]}), {"answer": texts[2]})
+    assert cache.info()["entries"] == 2
+    assert cache.get(prompts.summary_payload({"text": texts[1]})) is None
+    assert cache.get(prompts.summary_payload({"text": texts[0]})) is not None
+
+
+def test_index_survives_a_restart(tmp_path):
+    path = str(tmp_path / "semantic.npz")
+    cache = semantic_cache.SemanticCache(path=path, save_interval=3600)
+    cache.set(prompts.summary_payload({"text": EMAIL}), {"answer": "cached"})
+    cache.save()
+
+    restarted = semantic_cache.SemanticCache(path=path)
+    assert restarted.get(prompts.summary_payload({"text": NEAR_DUPLICATE})) == {"answer": "cached"}
@@ -0,0 +1,44 @@
+import asyncio
+
+import httpx
+
+import asgi
+import serve
+
+
+def test_auto_sizing(monkeypatch):
+    monkeypatch.delenv("WORKERS", raising=False)
+    monkeypatch.delenv("WSGI_THREADS", raising=False)
+    monkeypatch.setenv("IO_WAIT_RATIO", "7")
+    config = serve.settings(cpus=3)
+    assert config["workers"] == 3
+    assert config["wsgi_threads"] == 8
+    assert config["max_requests_jitter"] == config["max_requests"] // 10
+
+    monkeypatch.setenv("WORKERS", "5")
+    monkeypatch.setenv("WSGI_THREADS", "auto")
+    assert serve.settings(cpus=3)["workers"] == 5
+
+
+def test_cgroup_quota_parsing():
+    assert serve._cgroup2_quota("max 100000\n") is None
+    assert serve._cgroup2_quota("150000 100000\n") == 1.5
+
+
+def test_gunicorn_options_preload_and_recycle(monkeypatch):
+    monkeypatch.setenv("PRELOAD", "true")
+    monkeypatch.setenv("MAX_REQUESTS", "500")
+    options = serve.gunicorn_options(serve.settings(cpus=2))
+    assert options["preload_app"] is True
+    assert options["worker_class"] == "uvicorn.workers.UvicornWorker"
+    assert (options["max_requests"], options["max_requests_jitter"]) == (500, 50)
+
+
+def test_health_check_is_answered_natively():
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return await client.get("/")
+
+    response = asyncio.run(run())
+    assert response.json() == {"status": "success", "message": "AutoTasker AI Backend is running"}
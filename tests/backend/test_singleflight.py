@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import redis
+
+from singleflight import AsyncSingleFlight, RedisSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"answer": 42}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"answer": 42}] * 8
+    assert flight.info()["followers"] == 7
+    assert flight.info()["in_flight"] == 0
+
+
+def test_errors_propagate_to_waiters_and_are_not_remembered():
+    flight = SingleFlight()
+
+    def fail():
+        raise ValueError("upstream down")
+
+    with pytest.raises(ValueError):
+        flight.do("k", fail)
+    assert flight.do("k", lambda: "ok") == "ok"
+
+
+def test_async_waiters_share_one_task():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("k", slow) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["done"] * 5
+    assert len(calls) == 1
+    assert flight.info()["in_flight"] == 0
+
+
+def test_failed_result_publish_still_returns_the_result():
+    class PublishFails:
+        def set(self, key, value, nx=False, ex=None):
+            if not nx:
+                raise redis.ConnectionError("redis went away")
+            return True
+
+    flight = RedisSingleFlight("redis://127.0.0.1:1")
+    flight._redis = PublishFails()
+    flight._release = lambda keys, args: None
+    assert flight.do("k", lambda: {"answer": 42}) == {"answer": 42}
@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+import app as wsgi
+import status
+
+
+@pytest.fixture
+def client():
+    return wsgi.app.test_client()
+
+
+def counting_probe(delay=0.0, error=None):
+    calls = []
+
+    def probe(timeout):
+        calls.append(threading.current_thread().name)
+        time.sleep(delay)
+        if error:
+            raise status.ProbeError(error)
+    probe.calls = calls
+    return probe
+
+
+def test_dependencies_are_probed_together_and_served_from_cache():
+    probes = {name: counting_probe(delay=0.2) for name in ("openai", "n8n", "mongodb", "redis")}
+    monitor = status.StatusMonitor(probes, ttl=60)
+    try:
+        started = time.perf_counter()
+        first = monitor.snapshot()
+        assert time.perf_counter() - started < 0.45
+
+        started = time.perf_counter()
+        for _ in range(100):
+            monitor.snapshot()
+        assert time.perf_counter() - started < 0.05
+    finally:
+        monitor.stop()
+
+    assert first["status"] == "ok"
+    assert all(len(probe.calls) == 1 for probe in probes.values())
+    assert first["dependencies"]["redis"]["latency_ms"] >= 200
+
+
+def test_failures_timeouts_and_history():
+    probes = {"n8n": counting_probe(error="HTTP 503"), "redis": counting_probe(delay=1.0),
+              "mongodb": counting_probe()}
+    monitor = status.StatusMonitor(probes, ttl=0, timeout=0.1, history=3)
+    try:
+        for _ in range(4):
+            snapshot = monitor.snapshot()
+    finally:
+        monitor.stop()
+
+    assert snapshot["status"] == "degraded"
+    assert snapshot["down"] == ["n8n", "redis"]
+    assert snapshot["dependencies"]["n8n"]["error"] == "HTTP 503"
+    assert snapshot["dependencies"]["redis"]["error"] == "Probe timed out"
+    history = snapshot["dependencies"]["mongodb"]["history"]
+    assert history["samples"] == 3 and history["availability"] == 1.0
+    assert len(probes["mongodb"].calls) == 4
+
+
+def test_status_route_probes_the_configured_upstream(upstream, client, monkeypatch):
+    monkeypatch.setenv("STATUS_REFRESHER", "false")
+    monkeypatch.setenv("N8N_URL", "http://127.0.0.1:9")
+    monkeypatch.delenv("MONGODB_URI", raising=False)
+    monkeypatch.delenv("REDIS_URL", raising=False)
+
+    response = client.get("/status")
+    assert response.status_code == 200
+    body = response.json
+    assert sorted(body["dependencies"]) == ["n8n", "openai"]
+    assert body["dependencies"]["openai"]["status"] == "up"
+    assert body["down"] == ["n8n"]
+    assert upstream.requests == 0
+
+
+def test_models_url():
+    assert status.models_url("https://api.openai.com/v1/chat/completions") == "https://api.openai.com/v1/models"
+    assert status.models_url("http://127.0.0.1:8089/v1/") == "http://127.0.0.1:8089/v1/models"
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import app as wsgi
+import asgi
+import resilience
+
+
+def events(text):
+    parsed = []
+    for block in text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+
+@pytest.mark.parametrize("http2", ["true", "false"])
+def test_tokens_are_relayed_then_done_event(upstream, monkeypatch, http2):
+    monkeypatch.setenv("OPENAI_HTTP2", http2)
+    client = wsgi.app.test_client()
+    response = client.post("/ai/summary?stream=1", json={"text": "An email"})
+    assert response.mimetype == "text/event-stream"
+
+    parsed = events(response.get_data(as_text=True))
+    assert [data["content"] for event, data in parsed if event == "token"] == ["Fake", " completion", "."]
+    event, done = parsed[-1]
+    assert event == "done"
+    assert done["summary"] == "Fake completion."
+    assert done["usage"]["completion_tokens"] == 3
+    assert done["cache"] == "MISS"
+
+    # The finished stream is cached and serves the plain JSON endpoint too
+    assert client.post("/ai/summary", json={"text": "An email"}).headers["X-Cache"] == "HIT"
+
+
+def test_asgi_stream_with_accept_header(upstream):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as client:
+            return await client.post("/ai/post_social", json={"content": "Launch", "platform": "twitter"},
+                                     headers={"Accept": "text/event-stream"})
+
+    parsed = events(asyncio.run(run()).text)
+    event, done = parsed[-1]
+    assert event == "done"
+    assert done["post"] == "Fake completion."
+    assert done["platform"] == "twitter"
+
+
+def test_upstream_error_becomes_error_event(upstream):
+    upstream.status = 503
+    response = wsgi.app.test_client().post("/ai/screen_resume?stream=1",
+                                           json={"resume": "Jane", "job_description": "Engineer"})
+    event, data = events(response.get_data(as_text=True))[-1]
+    assert event == "error"
+    assert data["message"].startswith("Error screening resume: Upstream returned 503")
+
+
+def test_open_circuit_is_not_closed_by_a_stream(upstream, monkeypatch):
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "1")
+    monkeypatch.setenv("CIRCUIT_FAILURE_THRESHOLD", "2")
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "false")
+    upstream.status = 500
+    client = wsgi.app.test_client()
+    for _ in range(2):
+        client.post("/ai/summary", json={"text": "An email"})
+
+    event, data = events(client.post("/ai/summary?stream=1", json={"text": "An email"}).get_data(as_text=True))[-1]
+    assert event == "error" and "circuit is open" in data["message"]
+    assert resilience.get_resilience().breaker.info()["state"] == "open"
@@ -0,0 +1,80 @@
+import asyncio
+
+import httpx
+import pytest
+
+import app as wsgi
+import asgi
+import validation
+
+
+@pytest.fixture
+def client():
+    return wsgi.app.test_client()
+
+
+def asgi_post(path, **kwargs):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://backend") as http:
+            return await http.post(path, **kwargs)
+    return asyncio.run(run())
+
+
+def test_oversized_body_is_refused_before_upstream(upstream, client, monkeypatch):
+    monkeypatch.setattr(validation.SCHEMAS["summary"], "max_bytes", 100)
+    response = client.post("/ai/summary", json={"text": "x" * 200})
+    assert response.status_code == 413
+    assert response.json["code"] == "body_too_large"
+    assert upstream.requests == 0
+
+
+def test_chunked_body_is_cut_off_at_the_limit(upstream, monkeypatch):
+    monkeypatch.setattr(validation.SCHEMAS["summary"], "max_bytes", 100)
+
+    async def chunks():
+        yield b'{"text": "'
+        for _ in range(10):
+            yield b"x" * 50
+        yield b'"}'
+
+    response = asgi_post("/ai/summary", content=chunks())
+    assert response.status_code == 413
+    assert response.json()["code"] == "body_too_large"
+    assert upstream.requests == 0
+
+
+def test_field_rules(upstream, client):
+    response = client.post("/ai/post_social", json={"content": "Launch", "platform": "x" * 51})
+    assert response.status_code == 413
+    assert response.json == {"status": "error", "code": "field_too_long",
+                             "message": "platform is longer than 50 characters", "field": "platform"}
+
+    response = client.post("/ai/post_social", json={"content": ["Launch"], "platform": "x"})
+    assert response.json["code"] == "invalid_type" and response.json["field"] == "content"
+
+    response = client.post("/ai/batch/summary", json={"items": [{"text": "a"}], "concurrency": True})
+    assert response.json["message"] == "concurrency must be an integer"
+
+    assert client.post("/ai/summary", data="[1, 2]").json["code"] == "invalid_json"
+    assert upstream.requests == 0
+
+
+def test_job_items_use_the_task_schema(upstream, client):
+    response = client.post("/ai/jobs/post_social", json={"content": "Launch", "platform": 7})
+    assert response.status_code == 400
+    assert response.json["code"] == "invalid_type"
+
+
+def test_upstream_failures_carry_an_error_code(upstream, client, monkeypatch):
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "1")
+    upstream.status = 429
+    response = client.post("/ai/summary", json={"text": "An email"})
+    assert response.status_code == 429
+    assert response.json["code"] == "rate_limited"
+
+
+def test_codec_round_trip():
+    encoded = validation.dumps({"name": "Zoë", 1: [1.5, None]})
+    assert isinstance(encoded, bytes)
+    assert validation.loads(encoded) == {"name": "Zoë", "1": [1.5, None]}
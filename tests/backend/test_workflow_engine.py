@@ -0,0 +1,154 @@
+import json
+import time
+
+import pytest
+
+import app as wsgi
+import notifications
+import workflow_engine
+
+
+@pytest.fixture
+def workflows_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("WORKFLOWS_DIR", str(tmp_path))
+    workflow_engine.reset_registry()
+
+    def add(slug, definition):
+        (tmp_path / f"{slug}.json").write_text(json.dumps(definition))
+        workflow_engine.reset_registry()
+    return add
+
+
+def webhook(path, mode="responseNode"):
+    return {"parameters": {"path": path, "responseMode": mode}, "id": "hook", "name": "Webhook",
+            "type": "n8n-nodes-base.webhook"}
+
+
+def post_node(node_id, name, platform):
+    return {"id": node_id, "name": name, "type": "n8n-nodes-base.httpRequest", "parameters": {
+        "url": "http://backend:5000/ai/post_social", "method": "POST",
+        "bodyParameters": {"parameters": [
+            {"name": "content", "value": "={{ $json.body.content }}"},
+            {"name": "platform", "value": platform}
+        ]}
+    }}
+
+
+def fan_out(extra_nodes=(), extra_connections=None):
+    """Webhook -> two independent post_social calls -> one response"""
+    connections = {
+        "Webhook": {"main": [[{"node": "Twitter", "type": "main", "index": 0},
+                              {"node": "LinkedIn", "type": "main", "index": 0}]]},
+        "Twitter": {"main": [[{"node": "Respond", "type": "main", "index": 0}]]},
+        "LinkedIn": {"main": [[{"node": "Respond", "type": "main", "index": 0}]]}
+    }
+    connections.update(extra_connections or {})
+    return {"name": "Fan out", "nodes": [
+        webhook("launch"),
+        post_node("t", "Twitter", "twitter"),
+        post_node("l", "LinkedIn", "linkedin"),
+        {"id": "r", "name": "Respond", "type": "n8n-nodes-base.respondToWebhook", "parameters": {
+            "respondWith": "json",
+            "responseBody": '={"twitter": "{{ $node["Twitter"].json.post }}", "linkedin": "{{ $node["LinkedIn"].json["post"] }}"}'
+        }},
+        *extra_nodes
+    ], "connections": connections}
+
+
+def test_email_summarizer_runs_in_process(upstream):
+    client = wsgi.app.test_client()
+    workflows = client.get("/workflows").json["workflows"]
+    assert workflows["email_summarizer"]["compiled"] is True
+    # Its content node calls a route the backend does not have
+    assert "no in-process route" in workflows["social_media_poster"]["error"]
+
+    response = client.post("/webhook/incoming_email", json={"emailContent": "The launch moved to Friday."})
+    assert response.status_code == 200
+    body = response.json
+    assert body["result"]["status"] == "success"
+    assert body["result"]["notification"]["subject"] == "Email Summary"
+    assert body["result"]["notification"]["message"] == "Fake completion."
+    assert set(body["nodes"]) == {"Trigger", "Extract Email Content", "Summarize Email", "Send Notification"}
+    # One upstream call and no HTTP hop back into the backend
+    assert upstream.requests == 1
+    assert notifications.get_dispatcher().counts["accepted"] == 1
+
+
+def test_independent_branches_run_concurrently(upstream, workflows_dir, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_ENABLED", "false")
+    upstream.latency = 0.3
+    workflows_dir("fan_out", fan_out())
+
+    started = time.monotonic()
+    response = wsgi.app.test_client().post("/webhook/launch", json={"content": "Launch"})
+    elapsed = time.monotonic() - started
+    assert response.status_code == 200
+    assert response.json["result"] == {"twitter": "Fake completion.", "linkedin": "Fake completion."}
+    assert upstream.requests == 2
+    assert elapsed < 0.55
+
+
+def test_if_node_skips_the_branch_not_taken(upstream, workflows_dir):
+    definition = {"name": "Route", "nodes": [
+        webhook("route", mode="lastNode"),
+        {"id": "if", "name": "Is Twitter", "type": "n8n-nodes-base.if", "parameters": {"conditions": {
+            "string": [{"value1": "={{ $json.body.platform }}", "operation": "equal", "value2": "twitter"}]
+        }}},
+        {"id": "fn", "name": "Shape", "type": "Function",
+         "parameters": {"functionCode": "return { content: $json.body.content, tone: $json.body.tone || 'formal' };"}},
+        post_node("t", "Twitter", "twitter"),
+        post_node("o", "Other", "linkedin")
+    ], "connections": {
+        "Webhook": {"main": [[{"node": "Is Twitter"}]]},
+        "Is Twitter": {"main": [[{"node": "Shape"}], [{"node": "Other"}]]},
+        "Shape": {"main": [[{"node": "Twitter"}]]}
+    }}
+    # Shape's output is Twitter's $json, so read its content without .body
+    definition["nodes"][3]["parameters"]["bodyParameters"]["parameters"][0]["value"] = "={{ $json.content }}"
+    workflows_dir("route", definition)
+
+    response = wsgi.app.test_client().post("/webhook/route", json={"content": "Launch", "platform": "twitter"})
+    assert response.json["result"]["platform"] == "twitter"
+    assert response.json["nodes"]["Other"] == {"status": "skipped"}
+    assert upstream.requests == 1
+
+
+def test_node_failures_keep_the_route_error_shape(upstream, monkeypatch):
+    monkeypatch.setenv("AI_RETRY_ATTEMPTS", "1")
+    client = wsgi.app.test_client()
+
+    response = client.post("/webhook/incoming_email", json={"subject": "no content"})
+    assert response.status_code == 400
+    assert response.json["code"] == "missing_field" and response.json["node"] == "Summarize Email"
+
+    upstream.status = 500
+    response = client.post("/webhook/incoming_email", json={"emailContent": "An email"})
+    assert response.status_code == 500
+    assert response.json["code"] == "upstream_5xx"
+    assert client.post("/webhook/unknown", json={}).status_code == 404
+
+
+def test_compile_errors(workflows_dir):
+    cyclic = fan_out(extra_connections={"Respond": {"main": [[{"node": "Twitter"}]]}})
+    with pytest.raises(workflow_engine.WorkflowError, match="cycle"):
+        workflow_engine.Workflow(cyclic)
+
+    scripted = {"nodes": [webhook("x"), {"id": "f", "name": "Script", "type": "Function",
+                                         "parameters": {"functionCode": "const a = 1; return a;"}}],
+                "connections": [{"source": "hook", "target": "f"}]}
+    with pytest.raises(workflow_engine.WorkflowError, match="Script"):
+        workflow_engine.Workflow(scripted)
+
+    workflows_dir("duplicate", dict(fan_out(), name="Again"))
+    workflows_dir("fan_out", fan_out())
+    errors = {slug: info for slug, info in workflow_engine.get_registry().info().items() if not info["compiled"]}
+    assert list(errors) == ["fan_out"] and "already used" in errors["fan_out"]["error"]
+
+
+def test_templates_keep_types_and_fall_back():
+    context = {"json": {"body": {"n": 3, "tags": ["a", "b"]}}, "nodes": {"Prev": {"text": "hi"}}}
+    assert workflow_engine.compile_value("={{ $json.body.n }}")(context) == 3
+    assert workflow_engine.compile_value("={{ $json.body.tags[1] }}")(context) == "b"
+    assert workflow_engine.compile_value('=Say {{ $node["Prev"].json.text }} {{ $json.missing }}!')(context) == "Say hi !"
+    assert workflow_engine.compile_value("={{ $json.missing || 'default' }}")(context) == "default"
+    assert workflow_engine.compile_value({"literal": "plain"})(context) == {"literal": "plain"}
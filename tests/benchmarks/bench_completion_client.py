@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Handshake benchmark for the shared completion client
+Compares a fresh connection per call (the old module-level requests.post)
+with the pooled keep-alive CompletionClient against a local fake upstream
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+sys.path.append(os.path.dirname(__file__))
+
+from completion_client import CompletionClient
+from fake_upstream import FakeUpstream
+
+urllib3.disable_warnings()
+
+PAYLOAD = {
+    "model": "gpt-4",
+    "messages": [{"role": "user", "content": "Summarize the following text concisely: hello"}],
+    "max_tokens": 150
+}
+
+
+def run(call, requests_count, concurrency):
+    """Time each call and return the per-request latencies in milliseconds"""
+    def timed(_):
+        start = time.perf_counter()
+        call()
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, range(requests_count)))
+
+
+def report(name, latencies, connections, elapsed):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<22} rps={len(latencies) / elapsed:8.1f}  "
+          f"p50={statistics.median(latencies):6.2f}ms  p95={p95:6.2f}ms  "
+          f"connections={connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake upstream latency in seconds")
+    parser.add_argument("--tls", action="store_true", help="serve the fake upstream over TLS")
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(latency=args.latency, tls=args.tls).start()
+    try:
+        def fresh():
+            requests.post(upstream.url, json=PAYLOAD, verify=False, timeout=(5, 60)).json()
+
+        start = time.perf_counter()
+        latencies = run(fresh, args.requests, args.concurrency)
+        report("per-call connection", latencies, upstream.connections, time.perf_counter() - start)
+
+        upstream.connections = 0
+        client = CompletionClient(api_key="bench", api_url=upstream.url,
+                                  pool_size=args.concurrency, http2=False, verify=False)
+        start = time.perf_counter()
+        latencies = run(lambda: client.complete(PAYLOAD), args.requests, args.concurrency)
+        report("pooled keep-alive", latencies, upstream.connections, time.perf_counter() - start)
+        client.close()
+    finally:
+        upstream.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Load and latency benchmark for the backend routes
+Runs the backend in-process (ASGI or WSGI) or targets a running instance,
+with a local fake OpenAI upstream behind it, and drives each /ai/* route
+and /notification/send at a fixed concurrency (closed loop) or at a fixed
+arrival rate (open loop). Reports throughput, error rates and p50/p95/p99
+per route and saves the results as JSON for comparing commits.
+
+Examples:
+    python bench_load.py --target asgi --concurrency 64 --requests 2000
+    python bench_load.py --target wsgi --rate 50 --duration 30 --latency lognormal:0.8,0.5
+    python bench_load.py --compare results/load-abc1234-asgi-closed.json
+    python bench_load.py --replay ../../recordings/completions.rec --replay-latency 1
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'backend')
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(__file__))
+
+from fake_upstream import FakeUpstream, latency_model
+
+# Per scenario: path and request body builder; the index keeps prompts
+# distinct so the response cache does not answer the benchmark
+SCENARIOS = {
+    "summary": ("/ai/summary", lambda i: {"text": f"Quarterly report {i}: revenue grew while costs held steady."}),
+    "post_social": ("/ai/post_social", lambda i: {"content": f"Launching feature {i} today", "platform": "twitter"}),
+    "screen_resume": ("/ai/screen_resume", lambda i: {
+        "resume": f"Candidate {i}: five years of Python and Flask",
+        "job_description": "Backend engineer familiar with Python web services"
+    }),
+    "summary_stream": ("/ai/summary?stream=1", lambda i: {"text": f"Streaming report {i}: all systems nominal."}),
+    "notification": ("/notification/send", lambda i: {"subject": f"Alert {i}", "message": "Benchmark notification"})
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def configure_backend(upstream_url, cache):
+    """Point the in-process backend at the fake upstream before it is imported"""
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ["OPENAI_API_URL"] = upstream_url
+    os.environ["RESPONSE_CACHE_ENABLED"] = "true" if cache else "false"
+    # Keep the governor from throttling the benchmark unless asked to
+    os.environ.setdefault("OPENAI_RPM_LIMIT", "1000000")
+    os.environ.setdefault("OPENAI_TPM_LIMIT", "100000000")
+    os.environ.setdefault("GOVERNOR_MAX_CONCURRENCY", "1024")
+    os.environ.setdefault("GOVERNOR_INITIAL_CONCURRENCY", "1024")
+
+
+def configure_replay(path, latency_scale):
+    """Serve completions from a recording made with UPSTREAM_MODE=record instead of an upstream"""
+    os.environ["UPSTREAM_MODE"] = "replay"
+    os.environ["UPSTREAM_RECORDING"] = os.path.abspath(path)
+    os.environ["UPSTREAM_REPLAY_LATENCY"] = str(latency_scale)
+
+
+def start_backend(target, port):
+    """Serve the backend in a background thread and return a stop function"""
+    if target == "asgi":
+        import uvicorn
+
+        server = uvicorn.Server(uvicorn.Config("asgi:app", host="127.0.0.1", port=port,
+                                               log_level="warning", backlog=4096))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+
+        def stop():
+            server.should_exit = True
+            thread.join()
+        return stop
+
+    from werkzeug.serving import make_server
+    import app as wsgi
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    server = make_server("127.0.0.1", port, wsgi.app, threaded=True)
+    server.request_queue_size = 4096
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+    return stop
+
+
+async def send(client, path, body):
+    """Send one request and return (status, total seconds, first-byte seconds)"""
+    start = time.perf_counter()
+    first_byte = None
+    chunks = []
+    try:
+        async with client.stream("POST", path, json=body) as response:
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                chunks.append(chunk)
+            status = response.status_code
+    except httpx.HTTPError as e:
+        return type(e).__name__, time.perf_counter() - start, None
+    if status == 200 and b"event: error" in b"".join(chunks):
+        status = "stream_error"
+    return status, time.perf_counter() - start, first_byte
+
+
+async def closed_loop(client, path, build, concurrency, total, duration):
+    """concurrency workers each send their next request as soon as the last one returns"""
+    samples = []
+    counter = iter(range(total or 10 ** 9))
+    stop_at = time.perf_counter() + duration if duration else None
+
+    async def worker():
+        for index in counter:
+            if stop_at and time.perf_counter() >= stop_at:
+                return
+            samples.append(await send(client, path, build(index)))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+async def open_loop(client, path, build, rate, duration):
+    """Poisson arrivals at rate per second, timed from the scheduled send time
+
+    Measuring from the schedule rather than the actual send keeps a slow
+    backend from hiding its queueing delay (coordinated omission).
+    """
+    samples = []
+    tasks = []
+    start = time.perf_counter()
+    scheduled = 0.0
+    index = 0
+
+    async def timed(index, lag):
+        status, elapsed, first_byte = await send(client, path, build(index))
+        samples.append((status, elapsed + lag, None if first_byte is None else first_byte + lag))
+
+    while scheduled < duration:
+        delay = start + scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lag = max(0.0, time.perf_counter() - (start + scheduled))
+        tasks.append(asyncio.ensure_future(timed(index, lag)))
+        index += 1
+        scheduled += random.expovariate(rate)
+
+    await asyncio.gather(*tasks)
+    return samples
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def distribution(seconds):
+    ordered = sorted(value * 1000 for value in seconds)
+    if not ordered:
+        return None
+    summary = {f"p{pct}": round(percentile(ordered, pct), 2) for pct in PERCENTILES}
+    summary["mean"] = round(sum(ordered) / len(ordered), 2)
+    summary["max"] = round(ordered[-1], 2)
+    return summary
+
+
+def summarize(samples, elapsed):
+    statuses = Counter(str(status) for status, _, _ in samples)
+    ok = [sample for sample in samples if sample[0] == 200]
+    return {
+        "requests": len(samples),
+        "ok": len(ok),
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "statuses": dict(statuses),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "latency_ms": distribution([total for _, total, _ in ok]),
+        "ttfb_ms": distribution([first for _, _, first in ok if first is not None])
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def report(name, result):
+    latency = result["latency_ms"] or {}
+    print(f"{name:<16} n={result['requests']:<6} rps={result['throughput_rps'] or 0:8.1f}  "
+          f"p50={latency.get('p50', 0):8.2f}ms  p95={latency.get('p95', 0):8.2f}ms  "
+          f"p99={latency.get('p99', 0):8.2f}ms  errors={result['error_rate']:.2%}")
+
+
+def compare(results, baseline_path):
+    """Print each route's change against a saved result file"""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nvs {baseline_path} (commit {baseline['meta']['commit']})")
+    for name, result in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before or not before["latency_ms"] or not result["latency_ms"]:
+            continue
+        changes = []
+        for key in ("p50", "p95", "p99"):
+            old, new = before["latency_ms"][key], result["latency_ms"][key]
+            changes.append(f"{key} {(new - old) / old:+.1%}" if old else f"{key} n/a")
+        old_rps, new_rps = before["throughput_rps"], result["throughput_rps"]
+        changes.append(f"rps {(new_rps - old_rps) / old_rps:+.1%}" if old_rps else "rps n/a")
+        print(f"{name:<16} " + "  ".join(changes))
+
+
+async def run_scenarios(args, base_url):
+    limits = httpx.Limits(max_connections=None if args.rate else args.concurrency, max_keepalive_connections=256)
+    timeout = httpx.Timeout(args.timeout)
+    scenarios = {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        for name in args.routes:
+            path, build = SCENARIOS[name]
+            if args.warmup:
+                await closed_loop(client, path, build, min(args.concurrency, args.warmup), args.warmup, None)
+            start = time.perf_counter()
+            if args.rate:
+                samples = await open_loop(client, path, build, args.rate, args.duration)
+            else:
+                samples = await closed_loop(client, path, build, args.concurrency, args.requests, args.duration)
+            scenarios[name] = summarize(samples, time.perf_counter() - start)
+            report(name, scenarios[name])
+    return scenarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="asgi",
+                        help="asgi or wsgi to serve the backend in-process, or the URL of a running backend")
+    parser.add_argument("--routes", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=32, help="closed loop: requests in flight")
+    parser.add_argument("--requests", type=int, default=1000, help="closed loop: requests per route")
+    parser.add_argument("--rate", type=float, help="open loop: arrivals per second (overrides --concurrency)")
+    parser.add_argument("--duration", type=float, help="seconds per route; required with --rate")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per route first")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--latency", default="0.05", help="upstream latency: seconds or e.g. lognormal:0.8,0.5")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="upstream delay between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--cache", action="store_true", help="leave the response cache on")
+    parser.add_argument("--replay", help="answer completions from this recording instead of the fake upstream")
+    parser.add_argument("--replay-latency", type=float, default=1.0, help="with --replay: scale of the recorded latencies")
+    parser.add_argument("--output", help="result file (default results/load-<commit>-<target>-<mode>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    if args.rate and not args.duration:
+        parser.error("--rate needs --duration")
+    latency_model(args.latency)
+
+    upstream = None
+    stop_backend = None
+    if args.target in ("asgi", "wsgi") and args.replay:
+        # Nothing listens here; a request missing from the recording fails instead of reaching an upstream
+        configure_backend(f"http://127.0.0.1:{free_port()}", args.cache)
+        configure_replay(args.replay, args.replay_latency)
+    elif args.target in ("asgi", "wsgi"):
+        upstream = FakeUpstream(latency=args.latency, token_latency=args.token_latency,
+                                error_rate=args.error_rate, error_status=args.error_status).start()
+        configure_backend(upstream.url, args.cache)
+    if args.target in ("asgi", "wsgi"):
+        port = free_port()
+        stop_backend = start_backend(args.target, port)
+        base_url = f"http://127.0.0.1:{port}"
+    else:
+        base_url = args.target.rstrip("/")
+
+    mode = "open" if args.rate else "closed"
+    try:
+        scenarios = asyncio.run(run_scenarios(args, base_url))
+    finally:
+        if stop_backend:
+            stop_backend()
+        if upstream:
+            upstream.stop()
+
+    commit = git_commit()
+    results = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "target": args.target,
+            "mode": mode,
+            "concurrency": None if args.rate else args.concurrency,
+            "rate": args.rate,
+            "requests": None if args.rate else args.requests,
+            "duration": args.duration,
+            "upstream": {
+                "latency": args.latency,
+                "token_latency": args.token_latency,
+                "error_rate": args.error_rate,
+                "error_status": args.error_status,
+                "requests": upstream.requests if upstream else None
+            },
+            "cache": args.cache,
+            "replay": args.replay
+        },
+        "scenarios": scenarios
+    }
+
+    target_name = args.target if args.target in ("asgi", "wsgi") else "remote"
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{commit}-{target_name}-{mode}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as result_file:
+        json.dump(results, result_file, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Server launch profile benchmark
+Starts the backend under each launch profile as a real server process,
+with a local fake OpenAI upstream behind it, drives the same routes at a
+fixed concurrency and compares throughput, latency, the cost of the /
+health check and memory. Memory is read from /proc for the whole process
+tree: RSS counts shared pages once per process, PSS splits them between
+the processes sharing them, so the PSS per worker shows what preloading
+saves.
+
+Profiles:
+    flask-dev           the Flask development server with the debugger and reloader, as the old
+                        container command (python app.py) ran it
+    uvicorn             serve.py with SERVER=uvicorn (spawned workers, no preload)
+    gunicorn            serve.py with gunicorn, preloaded and forked workers
+    gunicorn-nopreload  the same without PRELOAD, to isolate its effect
+
+Example:
+    python bench_server.py --workers 4 --concurrency 64 --requests 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+import bench_load
+from fake_upstream import FakeUpstream
+
+BACKEND_DIR = os.path.abspath(bench_load.BACKEND_DIR)
+
+PROFILES = {
+    "flask-dev": (
+        [sys.executable, "-m", "flask", "--app", "app", "--debug", "run", "--host", "127.0.0.1", "--port", "{port}"],
+        {}
+    ),
+    "uvicorn": ([sys.executable, "serve.py"], {"SERVER": "uvicorn"}),
+    "gunicorn": ([sys.executable, "serve.py"], {"SERVER": "gunicorn", "PRELOAD": "true"}),
+    "gunicorn-nopreload": ([sys.executable, "serve.py"], {"SERVER": "gunicorn", "PRELOAD": "false"})
+}
+
+
+def children(pid):
+    """pid and all of its descendants"""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                # The command name may contain spaces; fields resume after its closing parenthesis
+                parents[int(entry)] = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, frontier = [pid], [pid]
+    while frontier:
+        frontier = [child for child, parent in parents.items() if parent in frontier]
+        tree.extend(frontier)
+    return tree
+
+
+def process_memory(pid):
+    """(rss, pss) of one process in MiB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            name, _, rest = line.partition(":")
+            if name in ("Rss", "Pss"):
+                values[name] = int(rest.split()[0]) / 1024
+    return values.get("Rss", 0.0), values.get("Pss", 0.0)
+
+
+def tree_memory(pid, workers):
+    processes = []
+    for member in children(pid):
+        try:
+            processes.append(process_memory(member))
+        except OSError:
+            continue
+    rss = sum(value for value, _ in processes)
+    pss = sum(value for _, value in processes)
+    return {
+        "processes": len(processes),
+        "rss_mb": round(rss, 1),
+        "pss_mb": round(pss, 1),
+        "pss_per_worker_mb": round(pss / workers, 1)
+    }
+
+
+def wait_ready(base_url, process, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+async def health_loop(base_url, concurrency, total):
+    """Closed loop of GET / requests; returns the same summary as the route scenarios"""
+    samples = []
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        async def worker():
+            for _ in counter:
+                start = time.perf_counter()
+                try:
+                    status = (await client.get("/")).status_code
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                samples.append((status, time.perf_counter() - start, None))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return bench_load.summarize(samples, time.perf_counter() - start)
+
+
+def run_profile(name, args):
+    command, extra_env = PROFILES[name]
+    port = bench_load.free_port()
+    env = dict(os.environ, PORT=str(port), HOST="127.0.0.1", WORKERS=str(args.workers),
+               LOG_LEVEL="warning", **extra_env)
+    command = [part.format(port=port) for part in command]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base_url, process)
+        # Memory before load shows what the workers share; after load, what serving costs
+        idle = tree_memory(process.pid, 1 if name == "flask-dev" else args.workers)
+        scenarios = asyncio.run(bench_load.run_scenarios(args, base_url))
+        scenarios["health"] = asyncio.run(health_loop(base_url, args.concurrency, args.requests))
+        bench_load.report("health", scenarios["health"])
+        loaded = tree_memory(process.pid, 1 if name == "flask-dev" else args.workers)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {"scenarios": scenarios, "memory": {"idle": idle, "loaded": loaded}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--routes", nargs="+", default=["summary", "post_social", "notification"],
+                        choices=list(bench_load.SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per route")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--latency", default="0.05", help="upstream latency: seconds or e.g. lognormal:0.8,0.5")
+    parser.add_argument("--output", help="result file (default results/server-<commit>.json)")
+    args = parser.parse_args()
+    # Fields run_scenarios expects from bench_load's own arguments
+    args.rate = None
+    args.duration = None
+
+    upstream = FakeUpstream(latency=args.latency).start()
+    bench_load.configure_backend(upstream.url, cache=False)
+    results = {}
+    try:
+        for name in args.profiles:
+            print(f"\n== {name} ==")
+            results[name] = run_profile(name, args)
+    finally:
+        upstream.stop()
+
+    print(f"\n{'profile':<20}{'rps':>10}{'health rps':>12}{'idle PSS/worker':>18}{'loaded PSS':>12}{'loaded RSS':>12}")
+    for name, result in results.items():
+        route_rps = sum(result["scenarios"][route]["throughput_rps"] or 0 for route in args.routes) / len(args.routes)
+        memory = result["memory"]
+        print(f"{name:<20}{route_rps:>10.1f}{result['scenarios']['health']['throughput_rps'] or 0:>12.1f}"
+              f"{memory['idle']['pss_per_worker_mb']:>16.1f}MB{memory['loaded']['pss_mb']:>10.1f}MB"
+              f"{memory['loaded']['rss_mb']:>10.1f}MB")
+
+    commit = bench_load.git_commit()
+    output = args.output or os.path.join(bench_load.RESULTS_DIR, f"server-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as result_file:
+        json.dump({
+            "meta": {
+                "commit": commit,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "workers": args.workers,
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "upstream_latency": args.latency
+            },
+            "profiles": results
+        }, result_file, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
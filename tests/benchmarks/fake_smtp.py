@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for an SMTP server
+Accepts mail without TLS or authentication and keeps every message in
+memory, counting sessions so tests can check that notifications were
+batched. Recipients whose address starts with "reject" are refused.
+"""
+
+import socketserver
+import threading
+from email import message_from_bytes
+
+
+class FakeSmtpHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.server.count_session()
+        self.reply("220 fake-smtp ready")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 fake-smtp")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command.split(":", 1)[1].strip().strip("<>")
+                if address.startswith("reject"):
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.server.store(recipients, self._read_data())
+                self.reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+    def _read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline()
+            if line in (b".\r\n", b".\n", b""):
+                return b"".join(lines)
+            lines.append(line[1:] if line.startswith(b"..") else line)
+
+
+class FakeSmtp(socketserver.ThreadingTCPServer):
+    """Threaded fake SMTP server recording sessions and messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0):
+        super().__init__(("127.0.0.1", port), FakeSmtpHandler)
+        self.sessions = 0
+        self.messages = []
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count_session(self):
+        with self._lock:
+            self.sessions += 1
+
+    def store(self, recipients, data):
+        with self._lock:
+            self.messages.append((list(recipients), message_from_bytes(data)))
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
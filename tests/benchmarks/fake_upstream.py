@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions API
+Used by the tests and benchmarks so they can run without an API key or
+network access. Latency can follow a distribution and a fraction of
+requests can fail, to look like a real upstream under load.
+
+Run it on its own to point a deployed backend at it:
+    python fake_upstream.py --port 8089 --latency lognormal:0.8,0.5 --error-rate 0.02
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+TOKENS = ["Fake", " completion", "."]
+
+
+def latency_model(spec):
+    """Build a function returning one latency sample in seconds from a spec
+
+    Specs are a plain number of seconds or one of fixed:S, uniform:LOW,HIGH,
+    normal:MEAN,SD, lognormal:MEDIAN,SIGMA and exponential:MEAN.
+    """
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda: spec
+    kind, _, args = str(spec).partition(":")
+    if not args:
+        seconds = float(kind)
+        return lambda: seconds
+    params = [float(value) for value in args.split(",")]
+    samplers = {
+        "fixed": lambda s: s,
+        "uniform": random.uniform,
+        "normal": lambda mean, sd: max(0.0, random.gauss(mean, sd)),
+        "lognormal": lambda median, sigma: random.lognormvariate(math.log(median), sigma),
+        "exponential": lambda mean: random.expovariate(1 / mean)
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution: {kind}")
+    return lambda: samplers[kind](*params)
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    """Answers every POST with a canned chat completion and GET /models with a model list"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request_body = json.loads(self.rfile.read(length) or b"{}")
+
+        delay = self.server.sample_latency()
+        if delay:
+            time.sleep(delay)
+
+        status = self.server.pick_status()
+        if status >= 400:
+            headers = {"Retry-After": "1"} if status == 429 else {}
+            self._send_json(status, {
+                "error": {"message": "Fake upstream error", "type": "fake_error"}
+            }, headers)
+            return
+
+        if request_body.get("stream"):
+            self._send_stream(request_body.get("model", "gpt-4"))
+            return
+
+        reply = self.server.reply(request_body) if callable(self.server.reply) else self.server.reply
+
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": request_body.get("model", "gpt-4"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply or "".join(TOKENS)},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}
+        })
+
+    def do_GET(self):
+        """The model listing, which status checks use as a free liveness probe"""
+        if not self.path.rstrip("/").endswith("/models"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        self._send_json(200, {"object": "list", "data": [{"id": "gpt-4", "object": "model"}]})
+
+    def _send_stream(self, model):
+        """Send the completion as chunked Server-Sent Events, one token at a time"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunks = [{"choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                  for token in TOKENS]
+        chunks.append({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        chunks.append({"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13}})
+        for chunk in chunks:
+            if self.server.token_latency:
+                time.sleep(self.server.token_latency)
+            self._write_chunk(f"data: {json.dumps(dict(chunk, id='chatcmpl-fake', model=model))}\n\n")
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeUpstream(ThreadingHTTPServer):
+    """Threaded fake upstream that counts accepted connections and requests
+
+    status forces every response to that code; error_rate instead fails
+    that fraction of requests with error_status. reply replaces the canned
+    non-streamed answer, either as a string or a function of the request body.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latency=0.0, status=200, token_latency=0.0, tls=False, port=0,
+                 error_rate=0.0, error_status=500, host="127.0.0.1"):
+        super().__init__((host, port), FakeUpstreamHandler)
+        self.latency = latency
+        self.status = status
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reply = None
+        self.tls = tls
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        if tls:
+            self.socket = _tls_context().wrap_socket(self.socket, server_side=True)
+
+    @property
+    def url(self):
+        scheme = "https" if self.tls else "http"
+        return f"{scheme}://127.0.0.1:{self.server_address[1]}/v1/chat/completions"
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up mid-response; that is expected here
+        pass
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def sample_latency(self):
+        return latency_model(self.latency)() if self.latency else 0.0
+
+    def pick_status(self):
+        with self._lock:
+            self.requests += 1
+        if self.status == 200 and self.error_rate and random.random() < self.error_rate:
+            return self.error_status
+        return self.status
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _tls_context():
+    """Build a server TLS context from a throwaway self-signed certificate"""
+    workdir = tempfile.mkdtemp()
+    cert = os.path.join(workdir, "cert.pem")
+    key = os.path.join(workdir, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-keyout", key, "-out", cert],
+        check=True, capture_output=True
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="0", help="seconds, or a distribution such as lognormal:0.8,0.5")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="delay between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--tls", action="store_true")
+    args = parser.parse_args()
+
+    latency_model(args.latency)
+    server = FakeUpstream(latency=args.latency, token_latency=args.token_latency, tls=args.tls,
+                          port=args.port, error_rate=args.error_rate, error_status=args.error_status,
+                          host=args.host)
+    print(f"Fake upstream listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
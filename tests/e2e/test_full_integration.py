@@ -2,109 +2,214 @@
 """
 End-to-End Integration Tests for AutoTasker
 Tests the complete workflow from frontend -> backend -> n8n -> notifications
+
+Services are probed concurrently with exponential backoff, independent
+suites run in parallel and every test's latency is recorded and checked
+against a timing budget, so a route that gets slower fails the run.
+
+With --local the backend is started in-process against the fake OpenAI
+upstream from tests/benchmarks; the n8n and frontend suites are skipped
+and the run takes seconds:
+
+    python test_full_integration.py --local
+    python test_full_integration.py --budgets budgets.json --report report.json
 """
 
 import os
 import sys
 import json
 import time
+import random
+import argparse
+import threading
 import requests
-import pytest
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional
 
-# Add the backend directory to the path
+# Add the backend and benchmark directories to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'backend'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+WORKFLOWS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'workflows')
+
+# Per suite: its tests in order, as (result name, method name)
+SUITES = {
+    'backend': [
+        ('ai_summary', 'test_ai_summary'),
+        ('ai_social_media', 'test_ai_social_media'),
+        ('ai_resume_screening', 'test_ai_resume_screening'),
+        ('notification', 'test_notification_endpoint')
+    ],
+    'n8n': [
+        ('n8n_health', 'test_n8n_health'),
+        ('workflow_import', 'test_workflow_import'),
+        ('workflow_execution', 'test_workflow_execution')
+    ],
+    'frontend': [
+        ('frontend_accessible', 'test_frontend_accessibility'),
+        ('api_connectivity', 'test_api_connectivity')
+    ],
+    'workflow': [
+        ('complete_workflow', 'test_email_summarizer_workflow')
+    ]
+}
+
+# Services each suite needs; a suite whose services are not run is skipped
+SUITE_SERVICES = {
+    'backend': ['backend'],
+    'n8n': ['n8n'],
+    'frontend': ['frontend', 'backend'],
+    'workflow': ['backend']
+}
+
+# Seconds each test may take against the full stack and the OpenAI API
+DEFAULT_BUDGETS = {
+    'ai_summary': 20.0,
+    'ai_social_media': 15.0,
+    'ai_resume_screening': 20.0,
+    'notification': 2.0,
+    'n8n_health': 2.0,
+    'workflow_import': 2.0,
+    'workflow_execution': 5.0,
+    'frontend_accessible': 3.0,
+    'api_connectivity': 1.0,
+    'complete_workflow': 25.0
+}
+
+# Against the stubbed upstream only the backend's own overhead is measured
+LOCAL_BUDGETS = {name: 2.0 for name in DEFAULT_BUDGETS}
+
 
 class AutoTaskerE2ETest:
     """End-to-End test class for AutoTasker integration"""
-    
-    def __init__(self):
-        self.base_urls = {
+
+    def __init__(self, base_urls: Optional[Dict[str, str]] = None, budgets: Optional[Dict[str, float]] = None,
+                 workers: int = 8, api_key: Optional[str] = None):
+        self.base_urls = base_urls or {
             'frontend': 'http://localhost:3000',
             'backend': 'http://localhost:5000',
             'n8n': 'http://localhost:5678',
             'nginx': 'http://localhost:80'
         }
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        self.workers = workers
+        self.api_key = api_key or os.getenv('AUTOTASKER_API_KEY')
         self.test_results = {}
+        self.timings = {}
+        self.skipped = []
         self.workflow_ids = []
-        
-    def setup_test_environment(self):
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+
+    def setup_test_environment(self, timeout=300):
         """Setup test environment and verify all services are running"""
         print("🔧 Setting up test environment...")
-        
+
         # Wait for services to be ready
-        services_ready = self.wait_for_services()
+        services_ready = self.wait_for_services(timeout)
         if not services_ready:
             raise Exception("❌ Not all services are ready for testing")
-        
+
         print("✅ All services are ready for testing")
-        
-    def wait_for_services(self, timeout=300, interval=10):
-        """Wait for all services to be ready"""
-        print("⏳ Waiting for services to be ready...")
-        
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            all_ready = True
-            
-            for service, url in self.base_urls.items():
-                try:
-                    if service == 'n8n':
-                        # n8n might need authentication
-                        response = requests.get(f"{url}/healthz", timeout=5)
-                    else:
-                        response = requests.get(url, timeout=5)
-                    
-                    if response.status_code not in [200, 401]:  # 401 is OK for n8n
-                        all_ready = False
-                        print(f"⚠️  {service} not ready: {response.status_code}")
-                except requests.exceptions.RequestException as e:
-                    all_ready = False
-                    print(f"⚠️  {service} not ready: {e}")
-            
-            if all_ready:
+
+    def probe(self, service: str, url: str) -> Optional[str]:
+        """Check one service once; returns None when it is ready, else the reason it is not"""
+        try:
+            if service == 'n8n':
+                # n8n might need authentication
+                response = requests.get(f"{url}/healthz", timeout=5)
+            else:
+                response = requests.get(url, timeout=5)
+        except requests.exceptions.RequestException as e:
+            return str(e)
+        if response.status_code not in [200, 401]:  # 401 is OK for n8n
+            return f"status {response.status_code}"
+        return None
+
+    def wait_for_service(self, service: str, url: str, deadline: float, initial_interval: float = 0.25,
+                         max_interval: float = 10.0) -> bool:
+        """Poll one service with jittered exponential backoff until it is ready or the deadline passes"""
+        interval = initial_interval
+        last_reason = None
+        while True:
+            reason = self.probe(service, url)
+            if reason is None:
+                print(f"✅ {service} ready after {time.time() - self.start_time:.1f}s")
                 return True
-            
-            time.sleep(interval)
-        
-        return False
-    
+            if reason != last_reason:
+                print(f"⚠️  {service} not ready: {reason}")
+                last_reason = reason
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(min(random.uniform(interval / 2, interval), max(0.0, deadline - time.monotonic())))
+            interval = min(interval * 2, max_interval)
+
+    def wait_for_services(self, timeout=300, initial_interval=0.25, max_interval=10.0):
+        """Wait for all services to be ready, probing them concurrently"""
+        print("⏳ Waiting for services to be ready...")
+
+        deadline = time.monotonic() + timeout
+        with ThreadPoolExecutor(max_workers=max(1, len(self.base_urls))) as executor:
+            futures = [
+                executor.submit(self.wait_for_service, service, url, deadline, initial_interval, max_interval)
+                for service, url in self.base_urls.items()
+            ]
+            return all(future.result() for future in futures)
+
+    def headers(self) -> Dict[str, str]:
+        """Credentials for the backend's /ai/* routes, when an API key is configured"""
+        return {'X-API-Key': self.api_key} if self.api_key else {}
+
+    def run_test(self, name: str, method: str) -> bool:
+        """Run one test, recording its result and latency"""
+        started = time.perf_counter()
+        try:
+            result = bool(getattr(self, method)())
+        except Exception as e:
+            print(f"❌ {name} error: {e}")
+            result = False
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.test_results[name] = result
+            self.timings[name] = elapsed
+        return result
+
+    def run_suite(self, suite: str) -> bool:
+        """Run one suite's tests in order; suites do not depend on each other"""
+        missing = [service for service in SUITE_SERVICES[suite] if service not in self.base_urls]
+        if missing:
+            print(f"⏭️  Skipping {suite} suite: {', '.join(missing)} not under test")
+            with self._lock:
+                self.skipped.extend(name for name, _ in SUITES[suite])
+            return True
+        return all([self.run_test(name, method) for name, method in SUITES[suite]])
+
+    def run_suites(self, suites: Optional[List[str]] = None) -> bool:
+        """Run the suites in parallel"""
+        suites = suites or list(SUITES)
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(suites))) as executor:
+            return all(list(executor.map(self.run_suite, suites)))
+
     def test_backend_ai_endpoints(self):
         """Test all AI endpoints in the backend"""
         print("🤖 Testing backend AI endpoints...")
-        
-        # Test summarization endpoint
-        summary_result = self.test_ai_summary()
-        self.test_results['ai_summary'] = summary_result
-        
-        # Test social media post generation
-        social_result = self.test_ai_social_media()
-        self.test_results['ai_social_media'] = social_result
-        
-        # Test resume screening
-        resume_result = self.test_ai_resume_screening()
-        self.test_results['ai_resume_screening'] = resume_result
-        
-        # Test notification endpoint
-        notification_result = self.test_notification_endpoint()
-        self.test_results['notification'] = notification_result
-        
-        return all([summary_result, social_result, resume_result, notification_result])
-    
+        return self.run_suite('backend')
+
     def test_ai_summary(self):
         """Test AI summarization endpoint"""
         try:
             payload = {
                 "text": "This is a long email content that needs to be summarized. It contains important information about the project status, upcoming deadlines, and team updates. The team has been working hard on the new features and we expect to deliver them by next week."
             }
-            
+
             response = requests.post(
                 f"{self.base_urls['backend']}/ai/summary",
                 json=payload,
+                headers=self.headers(),
                 timeout=30
             )
-            
+
             if response.status_code == 200:
                 result = response.json()
                 if result.get('status') == 'success' and result.get('summary'):
@@ -116,11 +221,11 @@ class AutoTaskerE2ETest:
             else:
                 print(f"❌ AI Summary endpoint failed: {response.status_code}")
                 return False
-                
+
         except Exception as e:
             print(f"❌ AI Summary endpoint error: {e}")
             return False
-    
+
     def test_ai_social_media(self):
         """Test AI social media post generation"""
         try:
@@ -128,13 +233,14 @@ class AutoTaskerE2ETest:
                 "content": "We just launched our new automation tool!",
                 "platform": "twitter"
             }
-            
+
             response = requests.post(
                 f"{self.base_urls['backend']}/ai/post_social",
                 json=payload,
+                headers=self.headers(),
                 timeout=30
             )
-            
+
             if response.status_code == 200:
                 result = response.json()
                 if result.get('status') == 'success' and result.get('post'):
@@ -146,11 +252,11 @@ class AutoTaskerE2ETest:
             else:
                 print(f"❌ AI Social Media endpoint failed: {response.status_code}")
                 return False
-                
+
         except Exception as e:
             print(f"❌ AI Social Media endpoint error: {e}")
             return False
-    
+
     def test_ai_resume_screening(self):
         """Test AI resume screening endpoint"""
         try:
@@ -158,13 +264,14 @@ class AutoTaskerE2ETest:
                 "resume": "John Doe, Software Engineer with 5 years experience in Python, JavaScript, and React. Worked at Tech Corp on web applications.",
                 "job_description": "Looking for a Senior Software Engineer with Python and React experience"
             }
-            
+
             response = requests.post(
                 f"{self.base_urls['backend']}/ai/screen_resume",
                 json=payload,
+                headers=self.headers(),
                 timeout=30
             )
-            
+
             if response.status_code == 200:
                 result = response.json()
                 if result.get('status') == 'success' and result.get('evaluation'):
@@ -176,11 +283,11 @@ class AutoTaskerE2ETest:
             else:
                 print(f"❌ AI Resume Screening endpoint failed: {response.status_code}")
                 return False
-                
+
         except Exception as e:
             print(f"❌ AI Resume Screening endpoint error: {e}")
             return False
-    
+
     def test_notification_endpoint(self):
         """Test notification endpoint"""
         try:
@@ -188,13 +295,13 @@ class AutoTaskerE2ETest:
                 "subject": "Test Notification",
                 "message": "This is a test notification from AutoTasker"
             }
-            
+
             response = requests.post(
                 f"{self.base_urls['backend']}/notification/send",
                 json=payload,
                 timeout=10
             )
-            
+
             if response.status_code == 200:
                 result = response.json()
                 if result.get('status') == 'success':
@@ -206,29 +313,16 @@ class AutoTaskerE2ETest:
             else:
                 print(f"❌ Notification endpoint failed: {response.status_code}")
                 return False
-                
+
         except Exception as e:
             print(f"❌ Notification endpoint error: {e}")
             return False
-    
+
     def test_n8n_integration(self):
         """Test n8n integration and workflow execution"""
         print("🔄 Testing n8n integration...")
-        
-        # Test n8n health
-        n8n_health = self.test_n8n_health()
-        self.test_results['n8n_health'] = n8n_health
-        
-        # Test workflow import
-        workflow_import = self.test_workflow_import()
-        self.test_results['workflow_import'] = workflow_import
-        
-        # Test workflow execution
-        workflow_execution = self.test_workflow_execution()
-        self.test_results['workflow_execution'] = workflow_execution
-        
-        return all([n8n_health, workflow_import, workflow_execution])
-    
+        return self.run_suite('n8n')
+
     def test_n8n_health(self):
         """Test n8n health endpoint"""
         try:
@@ -242,55 +336,43 @@ class AutoTaskerE2ETest:
         except Exception as e:
             print(f"❌ n8n health check error: {e}")
             return False
-    
+
     def test_workflow_import(self):
         """Test importing workflows to n8n"""
         try:
             # Load email summarizer workflow
-            with open('../../workflows/email_summarizer.json', 'r') as f:
+            with open(os.path.join(WORKFLOWS_DIR, 'email_summarizer.json'), 'r') as f:
                 workflow_data = json.load(f)
-            
+            if not workflow_data.get('nodes'):
+                print("❌ Workflow import error: email_summarizer.json has no nodes")
+                return False
+
             # Convert to n8n format and import
             # This is a simplified test - in reality you'd use n8n API
             print("✅ Workflow import simulation passed")
             return True
-            
+
         except Exception as e:
             print(f"❌ Workflow import error: {e}")
             return False
-    
+
     def test_workflow_execution(self):
         """Test workflow execution via webhook"""
         try:
-            # Test email summarizer workflow via webhook
-            webhook_url = f"{self.base_urls['n8n']}/webhook/incoming_email"
-            payload = {
-                "emailContent": "This is a test email that needs to be summarized for workflow testing purposes."
-            }
-            
-            # Note: This might fail if the actual webhook isn't set up
-            # In a real scenario, you'd have the webhook configured
+            # Posting to the email summarizer webhook needs it set up in n8n,
+            # so this is a simulation
             print("✅ Workflow execution simulation passed")
             return True
-            
+
         except Exception as e:
             print(f"❌ Workflow execution error: {e}")
             return False
-    
+
     def test_frontend_integration(self):
         """Test frontend integration with backend"""
         print("🌐 Testing frontend integration...")
-        
-        # Test frontend accessibility
-        frontend_accessible = self.test_frontend_accessibility()
-        self.test_results['frontend_accessible'] = frontend_accessible
-        
-        # Test API connectivity from frontend perspective
-        api_connectivity = self.test_api_connectivity()
-        self.test_results['api_connectivity'] = api_connectivity
-        
-        return all([frontend_accessible, api_connectivity])
-    
+        return self.run_suite('frontend')
+
     def test_frontend_accessibility(self):
         """Test if frontend is accessible"""
         try:
@@ -304,7 +386,7 @@ class AutoTaskerE2ETest:
         except Exception as e:
             print(f"❌ Frontend accessibility error: {e}")
             return False
-    
+
     def test_api_connectivity(self):
         """Test API connectivity from frontend's perspective"""
         try:
@@ -319,41 +401,37 @@ class AutoTaskerE2ETest:
         except Exception as e:
             print(f"❌ API connectivity error: {e}")
             return False
-    
+
     def test_complete_workflow(self):
         """Test a complete end-to-end workflow"""
         print("🔄 Testing complete workflow...")
-        
-        # Test the email summarizer workflow end-to-end
-        workflow_result = self.test_email_summarizer_workflow()
-        self.test_results['complete_workflow'] = workflow_result
-        
-        return workflow_result
-    
+        return self.run_suite('workflow')
+
     def test_email_summarizer_workflow(self):
         """Test the complete email summarizer workflow"""
         try:
             # Step 1: Simulate email input
             email_content = "Important project update: We have completed the first phase of development and are ready to move to the next phase. The team has been working on the core features and we expect to deliver the beta version by next month."
-            
+
             # Step 2: Call the summary endpoint (simulating n8n calling backend)
             summary_response = requests.post(
                 f"{self.base_urls['backend']}/ai/summary",
                 json={"text": email_content},
+                headers=self.headers(),
                 timeout=30
             )
-            
+
             if summary_response.status_code != 200:
                 print(f"❌ Email summarizer workflow failed at summary step: {summary_response.status_code}")
                 return False
-            
+
             summary_result = summary_response.json()
             summary_text = summary_result.get('summary')
-            
+
             if not summary_text:
                 print("❌ Email summarizer workflow failed: No summary generated")
                 return False
-            
+
             # Step 3: Send notification with summary
             notification_response = requests.post(
                 f"{self.base_urls['backend']}/notification/send",
@@ -363,94 +441,201 @@ class AutoTaskerE2ETest:
                 },
                 timeout=10
             )
-            
+
             if notification_response.status_code != 200:
                 print(f"❌ Email summarizer workflow failed at notification step: {notification_response.status_code}")
                 return False
-            
+
             print("✅ Complete email summarizer workflow passed")
             return True
-            
+
         except Exception as e:
             print(f"❌ Complete workflow error: {e}")
             return False
-    
-    def generate_test_report(self):
-        """Generate a comprehensive test report"""
+
+    def over_budget(self) -> Dict[str, float]:
+        """Tests that took longer than their budget, with their budget"""
+        return {
+            name: self.budgets[name]
+            for name, seconds in self.timings.items()
+            if name in self.budgets and seconds > self.budgets[name]
+        }
+
+    def report_data(self) -> Dict:
+        """The results, latencies and budgets of the run, as saved by --report"""
+        over_budget = self.over_budget()
+        return {
+            "date": datetime.now().isoformat(),
+            "duration": round(time.time() - self.start_time, 3),
+            "tests": {
+                name: {
+                    "passed": result,
+                    "seconds": round(self.timings.get(name, 0.0), 4),
+                    "budget": self.budgets.get(name),
+                    "over_budget": name in over_budget
+                }
+                for name, result in self.test_results.items()
+            },
+            "skipped": sorted(self.skipped)
+        }
+
+    def generate_test_report(self, path: Optional[str] = None):
+        """Generate a comprehensive test report; a test over its timing budget counts as failed"""
         print("\n" + "="*60)
         print("📊 AUTOTASKER INTEGRATION TEST REPORT")
         print("="*60)
         print(f"Test Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"Test Duration: {time.time() - self.start_time:.2f} seconds")
-        
+
+        over_budget = self.over_budget()
         total_tests = len(self.test_results)
-        passed_tests = sum(1 for result in self.test_results.values() if result)
+        passed_tests = sum(1 for name, result in self.test_results.items() if result and name not in over_budget)
         failed_tests = total_tests - passed_tests
-        
+
         print(f"\nTotal Tests: {total_tests}")
         print(f"Passed: {passed_tests}")
         print(f"Failed: {failed_tests}")
-        print(f"Success Rate: {(passed_tests/total_tests)*100:.1f}%")
-        
+        print(f"Skipped: {len(self.skipped)}")
+        if total_tests:
+            print(f"Success Rate: {(passed_tests/total_tests)*100:.1f}%")
+
         print("\n📋 Test Results:")
-        print("-" * 40)
-        for test_name, result in self.test_results.items():
-            status = "✅ PASS" if result else "❌ FAIL"
-            print(f"{test_name:<25} {status}")
-        
+        print("-" * 60)
+        print(f"{'test':<25} {'result':<10} {'latency':>10} {'budget':>10}")
+        for test_name, result in sorted(self.test_results.items()):
+            if not result:
+                status = "❌ FAIL"
+            elif test_name in over_budget:
+                status = "⏱️  SLOW"
+            else:
+                status = "✅ PASS"
+            budget = self.budgets.get(test_name)
+            budget_text = f"{budget:.2f}s" if budget is not None else "-"
+            print(f"{test_name:<25} {status:<10} {self.timings.get(test_name, 0.0):>9.3f}s {budget_text:>10}")
+        for test_name in sorted(self.skipped):
+            print(f"{test_name:<25} ⏭️  SKIP")
+
+        if over_budget:
+            print(f"\n⏱️  {len(over_budget)} tests exceeded their timing budget: {', '.join(sorted(over_budget))}")
         if failed_tests > 0:
             print(f"\n⚠️  {failed_tests} tests failed. Please check the logs above for details.")
         else:
             print("\n🎉 All tests passed! AutoTasker integration is working correctly.")
-        
-        return failed_tests == 0
-    
-    def run_all_tests(self):
+
+        if path:
+            with open(path, 'w') as report_file:
+                json.dump(self.report_data(), report_file, indent=2)
+            print(f"Report saved to {path}")
+
+        return total_tests > 0 and failed_tests == 0
+
+    def run_all_tests(self, report_path: Optional[str] = None, service_timeout: float = 300,
+                      suites: Optional[List[str]] = None):
         """Run all integration tests"""
         self.start_time = time.time()
-        
+
         print("🚀 Starting AutoTasker End-to-End Integration Tests")
         print("="*60)
-        
+
         try:
             # Setup test environment
-            self.setup_test_environment()
-            
-            # Run all test suites
-            backend_tests = self.test_backend_ai_endpoints()
-            n8n_tests = self.test_n8n_integration()
-            frontend_tests = self.test_frontend_integration()
-            workflow_tests = self.test_complete_workflow()
-            
+            self.setup_test_environment(service_timeout)
+
+            # Run all test suites in parallel
+            self.run_suites(suites)
+
             # Generate final report
-            all_passed = self.generate_test_report()
-            
+            all_passed = self.generate_test_report(report_path)
+
             return all_passed
-            
+
         except Exception as e:
             print(f"❌ Test suite failed with error: {e}")
             return False
 
-def main():
+
+def start_local_stack(replay=None):
+    """Serve the backend in-process against the fake upstream, or a recording; returns (base_urls, api_key, stop)"""
+    import bench_load
+    from fake_upstream import FakeUpstream
+
+    upstream = FakeUpstream().start()
+    bench_load.configure_backend(upstream.url, cache=False)
+    if replay:
+        bench_load.configure_replay(replay, latency_scale=0)
+    os.environ["NOTIFY_DEFAULT_CHANNEL"] = "log"
+    # Exercise API-key authentication with a throwaway secret
+    os.environ["API_KEY_SECRET"] = "e2e-local-secret"
+    os.environ.pop("JWT_SECRET", None)
+    os.environ["AUTH_ENABLED"] = "true"
+
+    import auth
+
+    port = bench_load.free_port()
+    stop_backend = bench_load.start_backend("asgi", port)
+
+    def stop():
+        stop_backend()
+        upstream.stop()
+    return {'backend': f"http://127.0.0.1:{port}"}, auth.issue_key("e2e"), stop
+
+
+def load_budgets(path: Optional[str]) -> Dict[str, float]:
+    if not path:
+        return {}
+    with open(path) as budgets_file:
+        return {name: float(seconds) for name, seconds in json.load(budgets_file).items()}
+
+
+def main(argv=None):
     """Main function to run the tests"""
-    if len(sys.argv) > 1 and sys.argv[1] == '--help':
-        print("AutoTasker E2E Integration Test Suite")
-        print("Usage: python test_full_integration.py [options]")
-        print("\nOptions:")
-        print("  --help    Show this help message")
-        print("\nThis script tests the complete integration of:")
-        print("  - Backend AI endpoints")
-        print("  - n8n workflow engine")
-        print("  - Frontend application")
-        print("  - Complete workflow execution")
-        return
-    
+    parser = argparse.ArgumentParser(
+        description="AutoTasker E2E Integration Test Suite: backend AI endpoints, the n8n workflow "
+                    "engine, the frontend application and complete workflow execution"
+    )
+    parser.add_argument("--local", action="store_true",
+                        help="run the backend in-process against a stubbed upstream; n8n and frontend suites are skipped")
+    parser.add_argument("--replay", help="with --local: answer completions from a recording made with UPSTREAM_MODE=record")
+    parser.add_argument("--suites", nargs="+", choices=list(SUITES), help="suites to run (default: all)")
+    parser.add_argument("--budgets", help="JSON file of per-test timing budgets in seconds")
+    parser.add_argument("--report", help="save the results, latencies and budgets as JSON")
+    parser.add_argument("--workers", type=int, default=8, help="suites run in parallel")
+    parser.add_argument("--service-timeout", type=float, default=300.0, help="seconds to wait for services")
+    args = parser.parse_args(argv)
+
+    stop = None
+    base_urls, api_key, budgets = None, None, {}
+    if args.local:
+        base_urls, api_key, stop = start_local_stack(args.replay)
+        budgets = dict(LOCAL_BUDGETS)
+    budgets.update(load_budgets(args.budgets))
+
     # Run the tests
-    tester = AutoTaskerE2ETest()
-    success = tester.run_all_tests()
-    
+    tester = AutoTaskerE2ETest(base_urls, budgets, workers=args.workers, api_key=api_key)
+    try:
+        success = tester.run_all_tests(args.report, args.service_timeout, args.suites)
+    finally:
+        if stop is not None:
+            stop()
+
     # Exit with appropriate code
-    sys.exit(0 if success else 1)
+    return 0 if success else 1
+
+
+def test_local_stack(tmp_path):
+    """The whole runner against the stubbed backend and upstream, in a fresh process"""
+    import subprocess
+
+    report_path = tmp_path / "report.json"
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--local", "--report", str(report_path)],
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stdout + result.stderr
+    report = json.loads(report_path.read_text())
+    assert set(report["tests"]) == {"ai_summary", "ai_social_media", "ai_resume_screening", "notification",
+                                    "complete_workflow"}
+    assert all(test["passed"] and not test["over_budget"] for test in report["tests"].values())
+    assert "n8n_health" in report["skipped"]
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())